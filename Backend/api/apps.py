@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        # Register background job handlers
+        from .services import (  # noqa: F401
+            auth_sweep, city_loader, company_import, coordinate_seeding, domain_upload, geocoding,
+        )
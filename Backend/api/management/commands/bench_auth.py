@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _summary(latencies):
+    if not latencies:
+        return "no requests"
+    return (f"{len(latencies)} requests, p50 {_percentile(latencies, 0.5) * 1000:.1f} ms, "
+            f"p99 {_percentile(latencies, 0.99) * 1000:.1f} ms")
+
+
+class Command(BaseCommand):
+    help = ("Measure logins/sec of a running server and the latency of another endpoint "
+            "before and during a login storm")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000/api', help="API root of the server under test")
+        parser.add_argument('--accounts', type=int, default=20, help="Benchmark accounts, registered if missing")
+        parser.add_argument('--password', default='bench-login-password')
+        parser.add_argument('--login-threads', type=int, default=16, help="Clients logging in back to back")
+        parser.add_argument('--probe-path', default='/locations/search/?search_term=ber',
+                            help="Endpoint whose latency is sampled (relative to --base-url); must answer 2xx")
+        parser.add_argument('--probe-threads', type=int, default=4)
+        parser.add_argument('--probe-interval', type=float, default=0.05, help="Pause between probes per thread")
+        parser.add_argument('--baseline-seconds', type=float, default=5.0, help="Probe-only phase before the storm")
+        parser.add_argument('--seconds', type=float, default=20.0, help="Length of the login storm")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout")
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        timeout = options['timeout']
+        usernames = [f'bench_login_{i}' for i in range(options['accounts'])]
+
+        with requests.Session() as session:
+            for username in usernames:
+                try:
+                    response = session.post(f'{base_url}/auth/register/', json={
+                        'username': username, 'email': f'{username}@bench.invalid', 'password': options['password'],
+                        'first_name': 'Bench', 'last_name': 'Login',
+                    }, timeout=timeout)
+                except requests.RequestException as e:
+                    raise CommandError(f"Cannot reach {base_url}: {e}")
+                if response.status_code not in (201, 400):
+                    raise CommandError(f"Registering {username} failed: {response.status_code} {response.text[:200]}")
+
+        stop = threading.Event()
+        storming = threading.Event()
+        lock = threading.Lock()
+        probes = {'baseline': [], 'storm': []}
+        probe_statuses = {'baseline': Counter(), 'storm': Counter()}
+        logins = []
+        statuses = Counter()
+
+        def probe():
+            with requests.Session() as client:
+                while not stop.is_set():
+                    phase = 'storm' if storming.is_set() else 'baseline'
+                    started = time.perf_counter()
+                    try:
+                        code = client.get(base_url + options['probe_path'], timeout=timeout).status_code
+                    except requests.RequestException as e:
+                        code = type(e).__name__
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        probe_statuses[phase][code] += 1
+                        probes[phase].append(elapsed)
+                    stop.wait(options['probe_interval'])
+
+        def login(offset):
+            position = offset
+            with requests.Session() as client:
+                while storming.is_set() and not stop.is_set():
+                    username = usernames[position % len(usernames)]
+                    position += options['login_threads']
+                    started = time.perf_counter()
+                    try:
+                        code = client.post(f'{base_url}/auth/login/', json={
+                            'username': username, 'password': options['password'],
+                        }, timeout=timeout).status_code
+                    except requests.RequestException as e:
+                        code = type(e).__name__
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        statuses[code] += 1
+                        if code == 200:
+                            logins.append(elapsed)
+
+        probe_threads = [threading.Thread(target=probe, daemon=True) for _ in range(options['probe_threads'])]
+        for thread in probe_threads:
+            thread.start()
+        time.sleep(options['baseline_seconds'])
+
+        storming.set()
+        storm_started = time.perf_counter()
+        login_threads = [threading.Thread(target=login, args=(i,), daemon=True) for i in range(options['login_threads'])]
+        for thread in login_threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        # Stop probing first so no late probe is counted as baseline
+        stop.set()
+        storming.clear()
+        for thread in login_threads + probe_threads:
+            thread.join()
+        storm_seconds = time.perf_counter() - storm_started
+
+        self.stdout.write(f"Logins:   {len(logins) / storm_seconds:.1f}/sec, {_summary(logins)}")
+        self.stdout.write(f"Statuses: {dict(statuses)}")
+        for phase, label in (('baseline', 'before'), ('storm', 'during')):
+            self.stdout.write(f"{options['probe_path']} {label} the storm: {_summary(probes[phase])}, "
+                              f"statuses {dict(probe_statuses[phase])}")
+
+        # Error responses return early, so their latencies say nothing about the endpoint
+        failed = sum(count for counts in probe_statuses.values()
+                     for code, count in counts.items() if not (isinstance(code, int) and 200 <= code < 300))
+        if failed:
+            raise CommandError(f"{failed} probes of {options['probe_path']} did not get a 2xx response; "
+                               f"the probe latencies are not meaningful")
@@ -0,0 +1,75 @@
+import random
+import string
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from api.services.entity_resolution import CompanyIndex, CompanyRecord
+
+WORDS = (
+    'acme global tech data systems software labs health bio energy green blue north river capital '
+    'partners logistics media digital cloud analytics consulting foods retail motors design studio '
+    'networks solutions security robotics finance insurance travel home smart urban star'
+).split()
+SUFFIXES = ('com', 'com', 'com', 'io', 'net', 'org', 'co.uk', 'de', 'fr', 'com.au', 'co.jp', 'com.br')
+LEGAL_FORMS = ('', '', ' Inc', ' LLC', ' Ltd', ' GmbH', ', Inc.')
+
+
+class Command(BaseCommand):
+    help = "Time entity resolution on synthetic companies at growing sizes to check it scales linearly"
+
+    def add_arguments(self, parser):
+        # The People Data Labs free company dataset has tens of millions of
+        # rows; the default sizes keep a run to a minute, pass --sizes to go larger
+        parser.add_argument('--sizes', default='250000,500000,1000000',
+                            help="Comma-separated company counts")
+        parser.add_argument('--duplicate-rate', type=float, default=0.05)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f"{'companies':>12} {'seconds':>9} {'µs/company':>11} {'proposals':>10} {'recall':>7}")
+        baseline = None
+        for size in sizes:
+            records, planted = self._dataset(size, options['duplicate_rate'], random.Random(options['seed']))
+            index = CompanyIndex()
+            started = time.perf_counter()
+            proposals = list(index.resolve(records))
+            seconds = time.perf_counter() - started
+
+            found = sum(1 for proposal in proposals if planted.get(proposal.duplicate_id) == proposal.keep_id)
+            per_company = seconds / size * 1e6
+            baseline = baseline or per_company
+            self.stdout.write(
+                f"{size:>12,} {seconds:>9.2f} {per_company:>11.2f} {len(proposals):>10,} "
+                f"{found / max(len(planted), 1):>7.1%}"
+            )
+        self.stdout.write(f"µs/company at the largest size is {per_company / baseline:.2f}x the smallest (1.0 = linear)")
+
+    def _dataset(self, size, duplicate_rate, rng):
+        """Distinct synthetic companies plus planted near-duplicates of some of them."""
+        records = []
+        planted = {}
+        originals = int(size / (1 + duplicate_rate))
+        for number in range(originals):
+            words = rng.sample(WORDS, 2)
+            tag = ''.join(rng.choices(string.ascii_lowercase, k=3)) + str(number)
+            name = ' '.join(word.capitalize() for word in words) + ' ' + tag.capitalize()
+            domain = f"{''.join(words)}{tag}.{rng.choice(SUFFIXES)}"
+            records.append(CompanyRecord(uuid.uuid4(), name + rng.choice(LEGAL_FORMS), domain, (domain,)))
+
+        for _ in range(size - originals):
+            original = records[rng.randrange(originals)]
+            variant = rng.randrange(3)
+            if variant == 0:
+                domain = 'www.' + original.domain.upper()
+            elif variant == 1:
+                domain = 'shop.' + original.domain
+            else:
+                domain = 'linkedin.com'
+            name = original.name.split(',')[0].replace(' Inc', '').replace(' LLC', '') + rng.choice(LEGAL_FORMS)
+            duplicate = CompanyRecord(uuid.uuid4(), name, domain, (domain,))
+            records.append(duplicate)
+            planted[duplicate.id] = original.id
+        return records, planted
@@ -0,0 +1,112 @@
+import random
+import string
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from api.services.city_index import CityPrefixIndex, CityTrigramIndex
+from data.models import City
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Compare city autocomplete latency of the prefix and trigram indexes with the icontains ORM query"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help="Users typing at the same time")
+        parser.add_argument('--keystrokes-per-second', type=float, default=5.0, help="Per user")
+        parser.add_argument('--queries', type=int, default=20000, help="Keystrokes replayed against the index")
+        parser.add_argument('--orm-queries', type=int, default=200, help="Keystrokes replayed against the ORM")
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help="Use this many generated cities instead of the City table (skips the ORM)")
+        parser.add_argument('--fuzzy-queries', type=int, default=1000, help="Misspelled names replayed against the trigram index")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['synthetic']:
+            cities = [
+                (uuid.uuid4(), name, name, 'Country', rng.randint(1000, 10_000_000))
+                for name in (
+                    ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))).capitalize()
+                    for _ in range(options['synthetic'])
+                )
+            ]
+        else:
+            cities = list(City.objects.values_list('id', 'name', 'ascii_name', 'country', 'population'))
+
+        index = CityPrefixIndex()
+        started = time.perf_counter()
+        index.load(cities)
+        build_seconds = time.perf_counter() - started
+
+        # Users type names of popular cities one keystroke at a time
+        weights = [max(population or 0, 1) ** 0.5 for *_rest, population in cities]
+        keystrokes = []
+        while len(keystrokes) < options['queries']:
+            name = rng.choices(cities, weights=weights)[0][2]
+            keystrokes.extend(name[:length] for length in range(1, len(name) + 1))
+        keystrokes = keystrokes[:options['queries']]
+
+        index_latencies = []
+        for term in keystrokes:
+            started = time.perf_counter()
+            index.search(term)
+            index_latencies.append(time.perf_counter() - started)
+
+        offered = options['users'] * options['keystrokes_per_second']
+        self.stdout.write(f"cities:          {len(cities):,} ({index.stats()['keys']:,} keys, built in {build_seconds:.2f}s)")
+        self.stdout.write(f"offered load:    {offered:,.0f} keystrokes/s")
+        self._report('prefix index', index_latencies, offered)
+
+        if options['fuzzy_queries']:
+            trigram_index = CityTrigramIndex()
+            started = time.perf_counter()
+            if options['synthetic']:
+                trigram_index.add_cities(cities)
+                trigram_index.finish()
+            else:
+                trigram_index.build()
+            stats = trigram_index.stats()
+            self.stdout.write(
+                f"trigram index:   {stats['names']:,} names in ~{stats['estimated_mib']} MiB, "
+                f"built in {time.perf_counter() - started:.2f}s "
+                f"({stats['skipped_alternate_names']:,} alternate names over budget)"
+            )
+            fuzzy_latencies = []
+            for _ in range(options['fuzzy_queries']):
+                name = rng.choices(cities, weights=weights)[0][2]
+                # Drop one character: a typical typo
+                position = rng.randrange(len(name))
+                term = name[:position] + name[position + 1:]
+                started = time.perf_counter()
+                trigram_index.search(term)
+                fuzzy_latencies.append(time.perf_counter() - started)
+            self._report('trigram top-10', fuzzy_latencies, offered)
+
+        if options['synthetic'] or not options['orm_queries']:
+            return
+        orm_latencies = []
+        for term in keystrokes[:options['orm_queries']]:
+            started = time.perf_counter()
+            list(
+                City.objects.filter(ascii_name__icontains=term)
+                .values('id', 'ascii_name', 'country')
+                .order_by('-population')[:10]
+            )
+            orm_latencies.append(time.perf_counter() - started)
+        self._report('ORM icontains', orm_latencies, offered)
+
+    def _report(self, label, latencies, offered):
+        mean = sum(latencies) / len(latencies)
+        capacity = 1 / mean
+        self.stdout.write(
+            f"{label + ':':<16} p50 {_percentile(latencies, 0.5) * 1e3:.3f} ms, "
+            f"p99 {_percentile(latencies, 0.99) * 1e3:.3f} ms, "
+            f"{capacity:,.0f} keystrokes/s per worker ({offered / capacity:.1%} of one worker busy)"
+        )
@@ -0,0 +1,63 @@
+import random
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from api.services.spatial_index import OfficeSpatialIndex
+
+
+class Command(BaseCommand):
+    help = "Report build time, memory and query latency of the office spatial index on synthetic data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offices', type=int, default=1_000_000)
+        parser.add_argument('--companies', type=int, default=250_000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--radius-km', type=float, default=100.0)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        offices = options['offices']
+        company_ids = [uuid.uuid4() for _ in range(options['companies'])]
+        rows = [
+            (uuid.uuid4(), rng.choice(company_ids), rng.uniform(-90, 90), rng.uniform(-180, 180))
+            for _ in range(offices)
+        ]
+
+        index = OfficeSpatialIndex()
+        started = time.perf_counter()
+        index.load(rows)
+        build_seconds = time.perf_counter() - started
+
+        # Measured on a second build: tracing allocations slows loading down.
+        # Rows are fed like a database read, each with its own id objects, so
+        # the figure includes the office and company ids the index keeps alive.
+        tracemalloc.start()
+        traced = OfficeSpatialIndex()
+        traced.load(
+            (uuid.UUID(bytes=office_id.bytes), uuid.UUID(bytes=company_id.bytes), lat, lon)
+            for office_id, company_id, lat, lon in rows
+        )
+        index_bytes, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del traced
+
+        points = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(options['queries'])]
+        started = time.perf_counter()
+        found = sum(len(index.within_radius(lat, lon, options['radius_km'])) for lat, lon in points)
+        radius_us = (time.perf_counter() - started) / len(points) * 1e6
+
+        started = time.perf_counter()
+        for lat, lon in points:
+            index.nearest(lat, lon, 10)
+        nearest_us = (time.perf_counter() - started) / len(points) * 1e6
+
+        per_million = 1_000_000 / offices
+        self.stdout.write(f"offices:              {offices:,}")
+        self.stdout.write(f"build:                {build_seconds:.2f}s ({build_seconds * per_million:.2f}s per million)")
+        self.stdout.write(f"index memory:         {index_bytes / 2**20:.1f} MiB ({index_bytes * per_million / 2**20:.1f} MiB per million)")
+        self.stdout.write(f"within {options['radius_km']:g} km:       {radius_us:.0f} µs/query ({found / len(points):.1f} offices avg)")
+        self.stdout.write(f"nearest 10:           {nearest_us:.0f} µs/query")
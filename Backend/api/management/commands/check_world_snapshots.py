@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.read_model import check_world_snapshot
+from data.models import AuthUser, UserWorld
+
+
+class Command(BaseCommand):
+    help = "Compare stored world snapshots with the live company/office/person/tag join"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only check this username")
+
+    def handle(self, *args, **options):
+        users = AuthUser.objects.filter(id__in=UserWorld.objects.values('user_id')).order_by('id')
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        checked = inconsistent = 0
+        for user in users.iterator(chunk_size=500):
+            checked += 1
+            problems = check_world_snapshot(user)
+            if problems:
+                inconsistent += 1
+                self.stdout.write(self.style.WARNING(f"{user.username}:"))
+                for problem in problems:
+                    self.stdout.write(f"  {problem}")
+
+        if inconsistent:
+            raise CommandError(f"{inconsistent} of {checked} snapshots are inconsistent")
+        self.stdout.write(self.style.SUCCESS(f"All {checked} snapshots match the live data"))
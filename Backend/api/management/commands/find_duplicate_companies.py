@@ -0,0 +1,23 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.entity_resolution import DEFAULT_MIN_SCORE, find_duplicates
+
+
+class Command(BaseCommand):
+    help = "Write merge proposals for duplicate companies as CSV (keep_id, duplicate_id, score, reason)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE)
+
+    def handle(self, *args, **options):
+        writer = csv.writer(self.stdout)
+        writer.writerow(['keep_id', 'duplicate_id', 'score', 'reason'])
+        started = time.perf_counter()
+        proposals = 0
+        for proposal in find_duplicates(options['min_score']):
+            writer.writerow(proposal)
+            proposals += 1
+        self.stderr.write(f"{proposals} merge proposals in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.geocoding import DEFAULT_BATCH_SIZE, GEOCODE_TABLES
+from api.services.jobs import claim, enqueue, requeue, run_job, worker_name
+from data.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = "Fill in office and person coordinates from the City table, resuming a job if given"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', help="ID of an unfinished geocode job to resume")
+        parser.add_argument('--table', action='append', choices=GEOCODE_TABLES,
+                            help="Table to geocode (repeatable; default: all)")
+        parser.add_argument('--queue', action='store_true',
+                            help="Only enqueue the job for `run_workers` instead of running it here")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--overwrite', action='store_true',
+                            help="Also re-geocode rows that already have coordinates")
+
+    def handle(self, *args, **options):
+        if options['job']:
+            try:
+                job = BackgroundJob.objects.get(id=options['job'], kind='geocode')
+            except BackgroundJob.DoesNotExist:
+                raise CommandError(f"No geocode job {options['job']}")
+            if job.status == BackgroundJob.STATUS_DONE:
+                raise CommandError(f"Job {job.id} already finished")
+            if job.status == BackgroundJob.STATUS_RUNNING:
+                raise CommandError(f"Job {job.id} is running on {job.locked_by}")
+            requeue(job)
+        else:
+            job = enqueue('geocode', {
+                'tables': options['table'] or list(GEOCODE_TABLES),
+                'batch_size': options['batch_size'],
+                'overwrite': options['overwrite'],
+            })
+
+        if options['queue']:
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.id}"))
+            return
+
+        worker = worker_name()
+        if not claim(job, worker):
+            raise CommandError(f"Job {job.id} was claimed by a worker")
+        self.stdout.write(f"Running job {job.id}")
+        job = run_job(job, worker)
+        if job.status != BackgroundJob.STATUS_DONE:
+            raise CommandError(f"Job {job.id} {job.status}:\n{job.error or ''}")
+        result = job.result
+        resolved = ', '.join(f"{count} {table}" for table, count in result['resolved'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Geocoded {resolved} of {result['rows']} rows at {result['rows_per_second']} rows/sec "
+            f"({result['cache_hits']} cache hits, {result['cache_misses']} lookups)"
+        ))
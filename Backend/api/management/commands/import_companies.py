@@ -0,0 +1,64 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.company_import import DEFAULT_CHUNK_MB, DEFAULT_COMPANIES_FILE, DEFAULT_WORKERS
+from api.services.jobs import claim, enqueue, requeue, run_job, worker_name
+from data.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = "Import companies and headquarters offices from the free company dataset CSV, resuming a job if given"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_COMPANIES_FILE,
+                            help=f"Company dataset CSV (default: {DEFAULT_COMPANIES_FILE})")
+        parser.add_argument('--job', help="ID of an unfinished import_companies job to resume")
+        parser.add_argument('--queue', action='store_true',
+                            help="Only enqueue the job for `run_workers` instead of running it here")
+        parser.add_argument('--chunk-mb', type=float, default=DEFAULT_CHUNK_MB,
+                            help="Size of the file chunks normalized per worker task")
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                            help="Normalizer processes; 0 normalizes in this process")
+
+    def handle(self, *args, **options):
+        if options['job']:
+            try:
+                job = BackgroundJob.objects.get(id=options['job'], kind='import_companies')
+            except BackgroundJob.DoesNotExist:
+                raise CommandError(f"No import_companies job {options['job']}")
+            if job.status == BackgroundJob.STATUS_DONE:
+                raise CommandError(f"Job {job.id} already finished")
+            if job.status == BackgroundJob.STATUS_RUNNING:
+                raise CommandError(f"Job {job.id} is running on {job.locked_by}")
+            requeue(job)
+        else:
+            path = os.path.abspath(options['path'])
+            if not os.path.isfile(path):
+                raise CommandError(f"No such file: {path}")
+            job = enqueue('import_companies', {
+                'path': path,
+                'chunk_mb': options['chunk_mb'],
+                'workers': options['workers'],
+            })
+
+        if options['queue']:
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.id}"))
+            return
+
+        worker = worker_name()
+        if not claim(job, worker):
+            raise CommandError(f"Job {job.id} was claimed by a worker")
+        self.stdout.write(f"Running job {job.id}")
+        job = run_job(job, worker)
+        if job.status != BackgroundJob.STATUS_DONE:
+            raise CommandError(
+                f"Job {job.id} {job.status}:\n{job.error or ''}\nResume with --job {job.id}"
+            )
+        result = job.result
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {result['rows']} rows in {result['chunks']} chunks at {result['rows_per_second']} rows/sec "
+            f"(staging {result['stage_seconds']}s, merge {result['merge_seconds']}s): "
+            f"{result['created']} companies and {result['offices']} offices created, "
+            f"{result['existing']} domains already known, {result['skipped']} rows skipped"
+        ))
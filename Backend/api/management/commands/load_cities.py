@@ -0,0 +1,54 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.city_loader import DEFAULT_CITIES_FILE
+from api.services.jobs import claim, enqueue, requeue, run_job, worker_name
+from data.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = "Load or refresh the City table from the GeoNames cities CSV, only touching changed cities"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_CITIES_FILE,
+                            help=f"GeoNames cities CSV (default: {DEFAULT_CITIES_FILE})")
+        parser.add_argument('--force', action='store_true',
+                            help="Rewrite every city, even if its modification date did not change")
+        parser.add_argument('--job', help="ID of an unfinished load_cities job to resume")
+        parser.add_argument('--queue', action='store_true',
+                            help="Only enqueue the job for `run_workers` instead of running it here")
+
+    def handle(self, *args, **options):
+        if options['job']:
+            try:
+                job = BackgroundJob.objects.get(id=options['job'], kind='load_cities')
+            except BackgroundJob.DoesNotExist:
+                raise CommandError(f"No load_cities job {options['job']}")
+            if job.status == BackgroundJob.STATUS_DONE:
+                raise CommandError(f"Job {job.id} already finished")
+            if job.status == BackgroundJob.STATUS_RUNNING:
+                raise CommandError(f"Job {job.id} is running on {job.locked_by}")
+            requeue(job)
+        else:
+            path = os.path.abspath(options['path'])
+            if not os.path.isfile(path):
+                raise CommandError(f"No such file: {path}")
+            job = enqueue('load_cities', {'path': path, 'force': options['force']})
+
+        if options['queue']:
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.id}"))
+            return
+
+        worker = worker_name()
+        if not claim(job, worker):
+            raise CommandError(f"Job {job.id} was claimed by a worker")
+        self.stdout.write(f"Running job {job.id}")
+        job = run_job(job, worker)
+        if job.status != BackgroundJob.STATUS_DONE:
+            raise CommandError(f"Job {job.id} {job.status}:\n{job.error or ''}")
+        result = job.result
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {result['rows']} cities in {result['seconds']}s ({result['rows_per_second']} rows/sec): "
+            f"{result['inserted']} inserted, {result['updated']} updated, {result['unchanged']} unchanged"
+        ))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.conditional import world_version
+from api.services.read_model import FRAGMENT_BATCH_SIZE, rebuild_world_snapshot, refresh_fragments
+from data.models import AuthUser, Company, UserWorld
+
+
+class Command(BaseCommand):
+    help = "Rebuild company fragments and every user's world snapshot in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild fragments even when their version is current")
+        parser.add_argument('--batch-size', type=int, default=FRAGMENT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        scanned = rebuilt = 0
+        last_id = None
+        while True:
+            queryset = Company.objects.order_by('id')
+            if last_id is not None:
+                queryset = queryset.filter(id__gt=last_id)
+            batch = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            rebuilt += refresh_fragments(batch, force=options['force'])
+            scanned += len(batch)
+            last_id = batch[-1]
+            self.stdout.write(f"Fragments: {rebuilt} rebuilt / {scanned} companies scanned")
+
+        users = AuthUser.objects.filter(
+            id__in=UserWorld.objects.values('user_id')
+        ).order_by('id')
+        snapshots = 0
+        for user in users.iterator(chunk_size=500):
+            rebuild_world_snapshot(user, world_version(user), refresh=False)
+            snapshots += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rebuilt} fragments and {snapshots} snapshots in {elapsed:.1f}s"
+        ))
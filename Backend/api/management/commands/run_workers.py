@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.services.jobs import JOB_HANDLERS, request_stop, work
+
+
+def _worker_main(kinds, once):
+    # Each process opens its own database connection
+    connections.close_all()
+    signal.signal(signal.SIGTERM, lambda *_: request_stop())
+    signal.signal(signal.SIGINT, lambda *_: request_stop())
+    work(kinds, once=once)
+
+
+class Command(BaseCommand):
+    help = "Run background job worker processes that claim jobs from the background_job table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: CPU count)")
+        parser.add_argument('--kind', action='append', choices=sorted(JOB_HANDLERS),
+                            help="Only run jobs of this kind (repeatable)")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling")
+
+    def handle(self, *args, **options):
+        kinds = options['kind']
+        once = options['once']
+        context = multiprocessing.get_context('fork')
+        # Children must not share the parent's connection
+        connections.close_all()
+
+        stopping = False
+
+        def stop(*_):
+            nonlocal stopping
+            stopping = True
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        def start():
+            process = context.Process(target=_worker_main, args=(kinds, once), daemon=False)
+            process.start()
+            return process
+
+        processes = [start() for _ in range(max(1, options['processes']))]
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f"Started {len(processes)} workers: {', '.join(str(p.pid) for p in processes)}")
+
+        while any(process.is_alive() for process in processes):
+            time.sleep(1)
+            if stopping or once:
+                continue
+            # Replace workers that crashed; their job is requeued once its heartbeat goes stale
+            for position, process in enumerate(processes):
+                if not process.is_alive():
+                    self.stderr.write(f"Worker {process.pid} exited with {process.exitcode}, restarting")
+                    processes[position] = start()
+
+        for process in processes:
+            process.join()
+        self.stdout.write("All workers stopped")
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.coordinate_seeding import DEFAULT_BATCH_SIZE
+from api.services.jobs import claim, enqueue, requeue, run_job, worker_name
+from data.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = "Give every company's first office random coordinates (test data), resuming a job if given"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', help="ID of an unfinished random_coordinates job to resume")
+        parser.add_argument('--queue', action='store_true',
+                            help="Only enqueue the job for `run_workers` instead of running it here")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['job']:
+            try:
+                job = BackgroundJob.objects.get(id=options['job'], kind='random_coordinates')
+            except BackgroundJob.DoesNotExist:
+                raise CommandError(f"No random_coordinates job {options['job']}")
+            if job.status == BackgroundJob.STATUS_DONE:
+                raise CommandError(f"Job {job.id} already finished")
+            if job.status == BackgroundJob.STATUS_RUNNING:
+                raise CommandError(f"Job {job.id} is running on {job.locked_by}")
+            requeue(job)
+        else:
+            job = enqueue('random_coordinates', {'batch_size': options['batch_size']})
+
+        if options['queue']:
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.id}"))
+            return
+
+        worker = worker_name()
+        if not claim(job, worker):
+            raise CommandError(f"Job {job.id} was claimed by a worker")
+        self.stdout.write(f"Running job {job.id}")
+        job = run_job(job, worker)
+        if job.status != BackgroundJob.STATUS_DONE:
+            raise CommandError(f"Job {job.id} {job.status}:\n{job.error or ''}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {job.result['offices_updated']} offices across {job.processed} companies"
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.auth_sweep import DEFAULT_BATCH_SIZE
+from api.services.jobs import claim, enqueue, run_job, worker_name
+from data.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions and expired or used password reset tokens in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows deleted per transaction")
+        parser.add_argument('--every', type=int, metavar='SECONDS',
+                            help="Make the sweep recurring: each run queues the next one this long after it finishes")
+        parser.add_argument('--queue', action='store_true',
+                            help="Only enqueue the job for `run_workers` instead of running it here")
+
+    def handle(self, *args, **options):
+        params = {'batch_size': options['batch_size']}
+        if options['every']:
+            params['every_seconds'] = options['every']
+        job = enqueue('sweep_auth', params)
+
+        if options['queue']:
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.id}"))
+            return
+
+        worker = worker_name()
+        if not claim(job, worker):
+            raise CommandError(f"Job {job.id} was claimed by a worker")
+        job = run_job(job, worker)
+        if job.status != BackgroundJob.STATUS_DONE:
+            raise CommandError(f"Job {job.id} {job.status}:\n{job.error or ''}")
+        result = job.result
+        deleted = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in result['deleted'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} ({result['rows']} rows at {result['rows_per_second']} rows/sec)"
+        ))
+        if result['next_job']:
+            self.stdout.write(f"Next sweep queued as job {result['next_job']}")
@@ -0,0 +1,37 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .services.marker_feed import MEDIA_TYPE
+
+
+class MarkerFeedRenderer(BaseRenderer):
+    """Serve a prebuilt binary marker feed (see `api.services.marker_feed`).
+
+    Selected with `Accept: application/vnd.companymap.markers` or
+    `?format=binary`. Views hand it the cached buffer, which is written out
+    as is; anything else (error payloads) is rendered as JSON.
+    """
+    media_type = MEDIA_TYPE
+    format = 'binary'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return data
+        return json.dumps(data).encode('utf-8')
+
+
+class NDJSONRenderer(JSONRenderer):
+    """Newline-delimited JSON, selected with `Accept: application/x-ndjson` or `?format=ndjson`.
+
+    Streaming views return a `StreamingHttpResponse` themselves; this renderer
+    only makes the media type negotiable and renders non-streamed payloads
+    (such as errors) as a single line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context) + b'\n'
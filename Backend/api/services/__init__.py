@@ -0,0 +1 @@
+# API service helpers package
@@ -0,0 +1,136 @@
+"""Removal of dead authentication rows.
+
+Every login adds a `user_session` row that lives for 30 days, and reset
+tokens stay behind once used or expired. The `sweep_auth` job deletes
+them in small keyset batches, each its own short transaction: expired
+sessions and reset tokens walk the `expires_at` indexes up to the cutoff
+taken when the sweep started, used reset tokens walk a partial index. No
+batch locks more than `batch_size` rows, and a sweep never rescans index
+entries an earlier batch already removed.
+
+New sessions are also capped per user (`AUTH_MAX_SESSIONS_PER_USER`): a
+login past the cap deletes that user's oldest sessions.
+"""
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from data.models import BackgroundJob
+from .jobs import job_handler, save_checkpoint, schedule_next
+from .session_cache import get_session_cache
+
+DEFAULT_BATCH_SIZE = 1000
+# Keyset start; plain row comparisons (no IS NULL branch) keep them index conditions
+FIRST_AT = '-infinity'
+FIRST_ID = '00000000-0000-0000-0000-000000000000'
+
+DELETE_EXPIRED_SQL = """
+WITH batch AS (
+    SELECT id, expires_at FROM {table}
+    WHERE expires_at < %(cutoff)s::timestamp
+      AND (expires_at, id) > (%(after_at)s::timestamp, %(after_id)s::uuid)
+    ORDER BY expires_at, id
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+), deleted AS (
+    DELETE FROM {table} t USING batch WHERE t.id = batch.id
+    RETURNING t.id, t.expires_at
+)
+SELECT count(*), max(expires_at)::text,
+       (SELECT id FROM deleted ORDER BY expires_at DESC, id DESC LIMIT 1)::text
+FROM deleted
+"""
+
+DELETE_USED_RESET_TOKENS_SQL = """
+WITH batch AS (
+    SELECT id FROM password_reset_token
+    WHERE used AND id > %(after_id)s::uuid
+    ORDER BY id
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+), deleted AS (
+    DELETE FROM password_reset_token t USING batch WHERE t.id = batch.id
+    RETURNING t.id
+)
+SELECT count(*), NULL, max(id::text) FROM deleted
+"""
+
+TRIM_SESSIONS_SQL = """
+DELETE FROM user_session
+WHERE id IN (
+    SELECT id FROM user_session
+    WHERE user_id = %(user)s::uuid
+    ORDER BY created_at DESC, id DESC
+    OFFSET %(keep)s
+)
+RETURNING token_hash
+"""
+
+# (checkpoint key, SQL) for each pass, in order
+SWEEPS = (
+    ('sessions', DELETE_EXPIRED_SQL.format(table='user_session')),
+    ('reset_tokens', DELETE_EXPIRED_SQL.format(table='password_reset_token')),
+    ('used_reset_tokens', DELETE_USED_RESET_TOKENS_SQL),
+)
+
+
+def trim_sessions(user, keep: Optional[int] = None) -> int:
+    """Delete all but the user's `keep` newest sessions; returns how many were removed."""
+    keep = keep if keep is not None else getattr(settings, 'AUTH_MAX_SESSIONS_PER_USER', 10)
+    with connection.cursor() as cursor:
+        cursor.execute(TRIM_SESSIONS_SQL, {'user': str(user.id), 'keep': keep})
+        token_hashes = [row[0] for row in cursor.fetchall()]
+    cache = get_session_cache()
+    for token_hash in token_hashes:
+        cache.revoke(token_hash)
+    return len(token_hashes)
+
+
+@job_handler('sweep_auth')
+def sweep_auth(job: BackgroundJob) -> Dict[str, Any]:
+    """Delete expired sessions, expired reset tokens and used reset tokens.
+
+    Params: `batch_size`, and `every_seconds` to queue the next sweep that
+    long after this one finishes. The checkpoint holds the cutoff and each
+    pass's keyset position and count.
+    """
+    batch_size = int(job.params.get('batch_size', DEFAULT_BATCH_SIZE))
+    checkpoint = dict(job.checkpoint)
+    # Timestamps in the tables are naive
+    checkpoint.setdefault('cutoff', timezone.make_naive(timezone.now()).isoformat())
+    processed = resumed_at = job.processed
+    started = time.monotonic()
+
+    for name, sql in SWEEPS:
+        done_key, at_key, id_key = f'{name}_done', f'{name}_after_at', f'{name}_after_id'
+        while not checkpoint.get(done_key):
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, {
+                        'cutoff': checkpoint['cutoff'], 'limit': batch_size,
+                        'after_at': checkpoint.get(at_key, FIRST_AT), 'after_id': checkpoint.get(id_key, FIRST_ID),
+                    })
+                    deleted, after_at, after_id = cursor.fetchone()
+                if deleted:
+                    checkpoint[id_key] = after_id
+                    if after_at is not None:
+                        checkpoint[at_key] = after_at
+                    checkpoint[name] = checkpoint.get(name, 0) + deleted
+                    processed += deleted
+                if deleted < batch_size:
+                    # Rows skipped because another transaction held them are left for the next sweep
+                    checkpoint[done_key] = True
+                save_checkpoint(job, checkpoint, processed)
+
+    every = job.params.get('every_seconds')
+    next_job = schedule_next(job, float(every)) if every else None
+    seconds = time.monotonic() - started
+    return {
+        'deleted': {name: checkpoint.get(name, 0) for name, _sql in SWEEPS},
+        'rows': processed,
+        'rows_per_second': round((processed - resumed_at) / seconds, 1) if seconds else None,
+        'next_job': str(next_job.id) if next_job else None,
+    }
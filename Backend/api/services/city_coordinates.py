@@ -0,0 +1,107 @@
+"""Per-worker LRU cache of city coordinates.
+
+Autocomplete picks are dominated by large cities, so the cache is warmed
+with the most populous ones on first use and then holds whatever else is
+looked up, up to a fixed number of entries. Misses for a whole batch of ids
+are fetched in one query. Cities without coordinates are cached as None so
+repeated lookups of them do not reach the database either.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+from data.models import City
+from .conditional import city_version
+
+Coordinates = Optional[Tuple[float, float]]
+
+
+class CityCoordinateCache:
+    """Bounded LRU of city id -> (latitude, longitude)."""
+
+    def __init__(self, max_size: Optional[int] = None, warm_size: Optional[int] = None):
+        self.max_size = max_size or getattr(settings, 'CITY_COORDINATES_CACHE_SIZE', 50000)
+        self.warm_size = min(
+            warm_size if warm_size is not None else getattr(settings, 'CITY_COORDINATES_WARM_SIZE', 20000),
+            self.max_size,
+        )
+        self._entries: 'OrderedDict[str, Coordinates]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, city_id: str, coordinates: Coordinates) -> None:
+        self._entries[city_id] = coordinates
+        self._entries.move_to_end(city_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _coordinates(latitude, longitude) -> Coordinates:
+        if latitude is None or longitude is None:
+            return None
+        return float(latitude), float(longitude)
+
+    def warm(self) -> None:
+        """Reset the cache to the most populous cities."""
+        cities = (
+            City.objects.exclude(latitude=None).exclude(longitude=None)
+            .order_by('-population')
+            .values_list('id', 'latitude', 'longitude')[:self.warm_size]
+        )
+        with self._lock:
+            self._entries.clear()
+            # Least populous first, so the largest cities are evicted last
+            for city_id, latitude, longitude in reversed(list(cities)):
+                self._store(str(city_id), self._coordinates(latitude, longitude))
+
+    def ensure_fresh(self) -> None:
+        """Warm on first use and again whenever the City table changed."""
+        version = city_version()
+        if version != self.version:
+            self.warm()
+            self.version = version
+
+    def get_many(self, city_ids: Iterable[str]) -> Dict[str, Coordinates]:
+        """Coordinates for each id, keyed as given; ids that are not cities are left out.
+
+        Ids are matched in canonical UUID form, so any spelling of a UUID
+        finds its city; each must be a valid UUID.
+        """
+        wanted = {str(city_id): str(uuid.UUID(str(city_id))) for city_id in city_ids}
+        cached: Dict[str, Coordinates] = {}
+        missing = []
+        with self._lock:
+            for canonical in dict.fromkeys(wanted.values()):
+                if canonical in self._entries:
+                    self._entries.move_to_end(canonical)
+                    cached[canonical] = self._entries[canonical]
+                    self.hits += 1
+                else:
+                    missing.append(canonical)
+                    self.misses += 1
+        if missing:
+            # Queried outside the lock, so other requests' cache hits never wait on the database
+            cities = City.objects.filter(id__in=missing).values_list('id', 'latitude', 'longitude')
+            rows = [(str(city_id), self._coordinates(latitude, longitude)) for city_id, latitude, longitude in cities]
+            with self._lock:
+                for city_id, coordinates in rows:
+                    self._store(city_id, coordinates)
+            cached.update(rows)
+        return {city_id: cached[canonical] for city_id, canonical in wanted.items() if canonical in cached}
+
+
+_coordinate_cache = CityCoordinateCache()
+
+
+def get_coordinate_cache() -> CityCoordinateCache:
+    """Return this worker's coordinate cache, warmed for the current City table."""
+    _coordinate_cache.ensure_fresh()
+    return _coordinate_cache
@@ -0,0 +1,404 @@
+"""Per-worker city search indexes: a prefix index and a trigram index.
+
+Every word start of a city's normalized name is a key ("new york" is
+indexed as "new york" and "york"), and the keys are kept in one sorted
+list, so the cities matching a prefix are a contiguous range found with two
+binary searches. Short prefixes match thousands of cities; for every prefix
+whose range is larger than `SCAN_LIMIT` the population-ranked top results
+are computed at build time, so no query scans more than `SCAN_LIMIT` keys.
+
+`CityTrigramIndex` covers typos and other names for a city ("Muenchen",
+"Bombay"): names, including GeoNames alternate names, are split into
+pg_trgm-style trigrams with an inverted list of names per trigram. Alternate
+names are added most populous city first until the memory budget is spent.
+
+Both indexes are built in a background thread when a worker starts and
+rebuilt the same way when the City table's version changes; until the
+first build is done, searches fall back to a substring query on the table.
+"""
+import heapq
+import logging
+import math
+import re
+import sys
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from data.models import City
+from .conditional import city_version
+from .geocoding import normalize_place
+
+logger = logging.getLogger(__name__)
+
+# Results precomputed per heavy prefix; the endpoint returns 10
+TOP_K = 10
+# Prefixes matching more keys than this get their top results precomputed
+SCAN_LIMIT = 64
+# Sorts after every character that can appear in a normalized key
+_KEY_END = '\x7f'
+
+
+class CityPrefixIndex:
+    """Sorted word-start keys with population-ranked top-k per heavy prefix."""
+
+    def __init__(self):
+        self.version = None
+        self._keys: List[str] = []
+        self._key_city = array('l')
+        self._ids: List[str] = []
+        self._names: List[str] = []
+        self._countries: List[str] = []
+        self._population = array('q')
+        self._top: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load(self, cities) -> None:
+        """Build from `(id, name, ascii_name, country, population)` rows."""
+        keyed = []
+        for city_id, name, ascii_name, country, population in cities:
+            row = len(self._ids)
+            self._ids.append(str(city_id))
+            self._names.append(ascii_name or name)
+            self._countries.append(country)
+            self._population.append(population or 0)
+            for normalized in {normalize_place(ascii_name), normalize_place(name)}:
+                words = normalized.split(' ')
+                for start in range(len(words)):
+                    key = ' '.join(words[start:])
+                    if key:
+                        keyed.append((key, row))
+        keyed.sort()
+        self._keys = [key for key, _row in keyed]
+        self._key_city = array('l', (row for _key, row in keyed))
+        self._top = {}
+        self._precompute(0, len(self._keys), 1)
+
+    def _rank(self, rows) -> array:
+        population = self._population
+        names = self._names
+        best = heapq.nsmallest(TOP_K, set(rows), key=lambda row: (-population[row], names[row], row))
+        return array('l', best)
+
+    def _precompute(self, lo: int, hi: int, depth: int):
+        """Top rows of `keys[lo:hi]`, which share their first `depth - 1` characters.
+
+        Recurses into each prefix of length `depth` and stores the top-k of
+        the ones whose range exceeds SCAN_LIMIT. A node's top-k is ranked
+        from its children's top-k, so each key is ranked only once.
+        """
+        if hi - lo <= SCAN_LIMIT:
+            return self._key_city[lo:hi]
+        keys = self._keys
+        candidates = array('l')
+        while lo < hi:
+            if len(keys[lo]) < depth:
+                # The key is the shared prefix itself
+                candidates.append(self._key_city[lo])
+                lo += 1
+                continue
+            prefix = keys[lo][:depth]
+            end = bisect_left(keys, prefix + _KEY_END, lo, hi)
+            top = self._precompute(lo, end, depth + 1)
+            if end - lo > SCAN_LIMIT:
+                self._top[prefix] = top
+            candidates.extend(top)
+            lo = end
+        return self._rank(candidates)
+
+    def build(self) -> None:
+        """Load every city from the City table."""
+        self.load(
+            City.objects.order_by()
+            .values_list('id', 'name', 'ascii_name', 'country', 'population')
+            .iterator(chunk_size=20000)
+        )
+
+    def search(self, term: str, limit: int = TOP_K) -> List[Dict[str, Any]]:
+        """Cities with a name word starting with `term`, most populous first.
+
+        At most TOP_K results are returned.
+        """
+        prefix = normalize_place(term)
+        if not prefix:
+            return []
+        rows = self._top.get(prefix)
+        if rows is None:
+            # Not a heavy prefix, so the range holds at most SCAN_LIMIT keys
+            lo = bisect_left(self._keys, prefix)
+            hi = bisect_left(self._keys, prefix + _KEY_END, lo)
+            rows = self._rank(self._key_city[lo:hi])
+        return [self.city(row) for row in rows[:limit]]
+
+    def city(self, row: int) -> Dict[str, Any]:
+        return {'id': self._ids[row], 'ascii_name': self._names[row], 'country': self._countries[row]}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'cities': len(self._ids),
+            'keys': len(self._keys),
+            'precomputed_prefixes': len(self._top),
+            'version': self.version,
+        }
+
+
+# Minimum pg_trgm-style similarity for a fuzzy match
+MIN_SIMILARITY = 0.3
+# Weight of log-population against similarity when ranking fuzzy matches
+POPULATION_WEIGHT = 0.15
+_WORD = re.compile(r'\w+')
+_EMPTY = array('l')
+
+
+def fold_name(value: Optional[str]) -> str:
+    """Casefold a name and strip accents, keeping letters of any script."""
+    if not value:
+        return ''
+    if not value.isascii():
+        decomposed = unicodedata.normalize('NFKD', value)
+        value = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(_WORD.findall(value.casefold()))
+
+
+def trigrams(folded: str) -> FrozenSet[str]:
+    """Trigrams of each word padded like pg_trgm: two spaces before, one after."""
+    grams = set()
+    for word in folded.split(' '):
+        if word:
+            padded = '  ' + word + ' '
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class CityTrigramIndex:
+    """Inverted trigram index over city names and alternate names."""
+
+    def __init__(self, memory_budget: Optional[int] = None):
+        if memory_budget is None:
+            memory_budget = getattr(settings, 'CITY_TRIGRAM_MEMORY_MB', 64) * 2**20
+        self.memory_budget = memory_budget
+        self.version = None
+        self._city_row: Dict[Any, int] = {}
+        self._ids: List[str] = []
+        self._names: List[str] = []
+        self._countries: List[str] = []
+        self._population = array('q')
+        self._name_text: List[str] = []
+        self._name_city = array('l')
+        self._name_grams = array('H')
+        self._postings: Dict[str, array] = {}
+        self._seen: set = set()
+        self.estimated_bytes = 0
+        self.skipped_names = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _add_name(self, row: int, name: Optional[str], force: bool = False) -> bool:
+        """Index one name of a city; returns False once the budget is spent."""
+        folded = fold_name(name)
+        if not folded or (row, folded) in self._seen:
+            return True
+        grams = trigrams(folded)
+        cost = sys.getsizeof(folded) + 24 + 8 * len(grams)
+        if not force and self.estimated_bytes + cost > self.memory_budget:
+            self.skipped_names += 1
+            return False
+        name_id = len(self._name_text)
+        self._seen.add((row, folded))
+        self._name_text.append(folded)
+        self._name_city.append(row)
+        self._name_grams.append(min(len(grams), 65535))
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array('l')
+                cost += 100
+            posting.append(name_id)
+        self.estimated_bytes += cost
+        return True
+
+    def add_cities(self, cities: Iterable[tuple]) -> None:
+        """Add `(id, name, ascii_name, country, population)` rows with their own names.
+
+        Primary names are always indexed, even past the memory budget.
+        """
+        for city_id, name, ascii_name, country, population in cities:
+            row = len(self._ids)
+            self._city_row[city_id] = row
+            self._ids.append(str(city_id))
+            self._names.append(ascii_name or name)
+            self._countries.append(country)
+            self._population.append(population or 0)
+            self._add_name(row, name, force=True)
+            self._add_name(row, ascii_name, force=True)
+
+    def add_alternate_names(self, rows: Iterable[tuple]) -> None:
+        """Add `(city_id, alternate_names)` rows, most populous city first, until the budget is spent."""
+        for city_id, names in rows:
+            row = self._city_row.get(city_id)
+            if row is None:
+                continue
+            for name in names or ():
+                if not self._add_name(row, name):
+                    return
+
+    def finish(self) -> None:
+        """Drop build-only state."""
+        self._seen = set()
+
+    def build(self) -> None:
+        cities = City.objects.order_by('-population')
+        self.add_cities(
+            cities.values_list('id', 'name', 'ascii_name', 'country', 'population').iterator(chunk_size=20000)
+        )
+        self.add_alternate_names(
+            cities.exclude(alternate_names=None).values_list('id', 'alternate_names').iterator(chunk_size=5000)
+        )
+        self.finish()
+
+    def search(self, term: str, limit: int = TOP_K, min_similarity: float = MIN_SIMILARITY,
+               exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Cities whose name or an alternate name is similar to `term`.
+
+        Ranked by trigram similarity plus a log-population bonus; each city
+        appears once, with the name that matched best.
+        """
+        query = trigrams(fold_name(term))
+        if not query:
+            return []
+        needed = max(1, math.ceil(min_similarity * len(query)))
+        postings = sorted((self._postings.get(gram, _EMPTY) for gram in query), key=len)
+        # A name sharing `needed` trigrams with the query must appear in one
+        # of the rarest len(query) - needed + 1 lists; the rest only add counts
+        probe, rest = postings[:len(query) - needed + 1], postings[len(query) - needed + 1:]
+        shared = Counter(chain.from_iterable(probe))
+        for posting in rest:
+            for name_id in shared:
+                position = bisect_left(posting, name_id)
+                if position < len(posting) and posting[position] == name_id:
+                    shared[name_id] += 1
+
+        excluded = set(exclude)
+        best: Dict[int, tuple] = {}
+        for name_id, count in shared.items():
+            similarity = count / (len(query) + self._name_grams[name_id] - count)
+            if similarity < min_similarity:
+                continue
+            row = self._name_city[name_id]
+            if self._ids[row] in excluded:
+                continue
+            score = similarity + POPULATION_WEIGHT * min(math.log10(self._population[row] + 1) / 7, 1.0)
+            if row not in best or score > best[row][0]:
+                best[row] = (score, name_id)
+
+        results = []
+        for row, (score, name_id) in heapq.nlargest(limit, best.items(), key=lambda item: item[1][0]):
+            city = {'id': self._ids[row], 'ascii_name': self._names[row], 'country': self._countries[row]}
+            if self._name_text[name_id] != fold_name(self._names[row]):
+                city['matched_name'] = self._name_text[name_id]
+            results.append(city)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'cities': len(self._ids),
+            'names': len(self._name_text),
+            'trigrams': len(self._postings),
+            'estimated_mib': round(self.estimated_bytes / 2**20, 1),
+            'skipped_alternate_names': self.skipped_names,
+            'version': self.version,
+        }
+
+
+CityIndexes = Tuple[CityPrefixIndex, CityTrigramIndex]
+
+_city_indexes: Optional[CityIndexes] = None
+_building = False
+_city_index_lock = threading.Lock()
+
+
+def _build(version: Optional[str]) -> None:
+    global _city_indexes, _building
+    try:
+        version = version or city_version()
+        prefix_index = CityPrefixIndex()
+        prefix_index.build()
+        prefix_index.version = version
+        trigram_index = CityTrigramIndex()
+        trigram_index.build()
+        trigram_index.version = version
+        _city_indexes = (prefix_index, trigram_index)
+    except Exception:
+        logger.exception('Building the city indexes failed')
+    finally:
+        with _city_index_lock:
+            _building = False
+        connection.close()
+
+
+def warm_city_indexes(version: Optional[str] = None) -> None:
+    """Build this worker's city indexes in a background thread.
+
+    Called at worker startup and whenever the City table's version moved;
+    does nothing while a build is already running.
+    """
+    global _building
+    with _city_index_lock:
+        if _building:
+            return
+        _building = True
+    threading.Thread(target=_build, args=(version,), name='city-index-build', daemon=True).start()
+
+
+def get_city_indexes() -> Optional[CityIndexes]:
+    """This worker's indexes, or None until their first build has finished.
+
+    When the City table changed, a rebuild starts in the background and the
+    previous indexes keep answering until it is done.
+    """
+    version = city_version()
+    indexes = _city_indexes
+    if indexes is None or indexes[0].version != version:
+        warm_city_indexes(version)
+    return indexes
+
+
+def search_cities_in_db(term: str, limit: int = TOP_K) -> List[Dict[str, Any]]:
+    """Substring match on the City table, for requests served while the indexes build.
+
+    Results have the same shape as the indexes' results, ids included as text.
+    """
+    cities = (
+        City.objects.filter(ascii_name__icontains=term)
+        .values('id', 'ascii_name', 'country')
+        .order_by('-population')[:limit]
+    )
+    return [{**city, 'id': str(city['id'])} for city in cities]
+
+
+def search_cities(term: str, limit: int = TOP_K, indexes: Optional[CityIndexes] = None) -> List[Dict[str, Any]]:
+    """Prefix matches first, topped up with fuzzy and alternate-name matches.
+
+    Pass the `indexes` the response's ETag was computed from; without any
+    (still building) the City table is searched directly.
+    """
+    if indexes is None:
+        indexes = get_city_indexes()
+    if indexes is None:
+        return search_cities_in_db(term, limit)
+    prefix_index, trigram_index = indexes
+    results = prefix_index.search(term, limit)
+    if len(results) < limit:
+        seen = [city['id'] for city in results]
+        results += trigram_index.search(term, limit - len(results), exclude=seen)
+    return results
@@ -0,0 +1,190 @@
+"""Streaming, incremental load of the GeoNames cities export.
+
+The `;`-separated CSV (geonames-all-cities-with-a-population-1000) is
+streamed with COPY into a temporary staging table and merged into `city`
+with one upsert keyed by Geoname ID. A city that already exists is only
+rewritten when the file's modification date is newer than the stored one,
+so re-running the load with the same file changes nothing and a newer file
+only touches the cities GeoNames changed.
+"""
+import os
+import time
+from typing import Any, Dict, Optional
+
+from django.db import connection, transaction
+
+from data.models import BackgroundJob
+from .jobs import job_handler, report_progress
+
+DEFAULT_CITIES_FILE = '/data/geonames-all-cities-with-a-population-1000.csv'
+
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE staging_cities(
+    "Geoname ID" BIGINT,
+    "Name" TEXT,
+    "ASCII Name" TEXT,
+    "Alternate Names" TEXT,
+    "Feature Class" TEXT,
+    "Feature Code" TEXT,
+    "Country Code" TEXT,
+    "Country name EN" TEXT,
+    "Country Code 2" TEXT,
+    "Admin1 Code" TEXT,
+    "Admin2 Code" TEXT,
+    "Admin3 Code" TEXT,
+    "Admin4 Code" TEXT,
+    "Population" TEXT,
+    "Elevation" TEXT,
+    "DIgital Elevation Model" TEXT,
+    "Timezone" TEXT,
+    "Modification date" TEXT,
+    "LABEL EN" TEXT,
+    "Coordinates" TEXT
+) ON COMMIT DROP
+"""
+
+COPY_SQL = """COPY staging_cities FROM STDIN WITH (FORMAT csv, HEADER true, DELIMITER ';')"""
+
+# Cities loaded before geoname_id existed: adopt their GeoNames id instead
+# of inserting them a second time. Legacy rows can repeat a name and
+# coordinates, so each legacy row takes at most one id and each id goes to
+# one legacy row (the lowest id); the others are left to the upsert.
+ADOPT_LEGACY_SQL = """
+WITH matches AS (
+    SELECT DISTINCT ON (c.id) c.id, s."Geoname ID" AS geoname_id
+    FROM city c
+    JOIN staging_cities s
+      ON c.name = s."Name"
+     AND c.latitude = NULLIF(TRIM(split_part(s."Coordinates", ',', 1)), '')::DECIMAL(10,8)
+     AND c.longitude = NULLIF(TRIM(split_part(s."Coordinates", ',', 2)), '')::DECIMAL(11,8)
+    WHERE c.geoname_id IS NULL
+      AND s."Geoname ID" IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM city taken WHERE taken.geoname_id = s."Geoname ID")
+    ORDER BY c.id, s."Geoname ID"
+), adopted AS (
+    SELECT DISTINCT ON (geoname_id) id, geoname_id
+    FROM matches
+    ORDER BY geoname_id, id
+)
+UPDATE city c
+SET geoname_id = adopted.geoname_id
+FROM adopted
+WHERE c.id = adopted.id
+"""
+
+UPSERT_SQL = """
+WITH source AS (
+    SELECT DISTINCT ON ("Geoname ID")
+        "Geoname ID" AS geoname_id,
+        COALESCE(NULLIF("Name", ''), 'Unknown') AS name,
+        COALESCE(NULLIF("ASCII Name", ''), NULLIF("Name", ''), 'Unknown') AS ascii_name,
+        COALESCE(NULLIF("Country name EN", ''), NULLIF("Country Code", ''), 'Unknown') AS country,
+        NULLIF(TRIM(split_part("Coordinates", ',', 1)), '')::DECIMAL(10,8) AS latitude,
+        NULLIF(TRIM(split_part("Coordinates", ',', 2)), '')::DECIMAL(11,8) AS longitude,
+        NULLIF("Population", '')::INTEGER AS population,
+        string_to_array(NULLIF("Alternate Names", ''), ',') AS alternate_names,
+        NULLIF("Timezone", '') AS timezone,
+        NULLIF("Modification date", '')::DATE AS modification_date
+    FROM staging_cities
+    WHERE "Geoname ID" IS NOT NULL
+    ORDER BY "Geoname ID", NULLIF("Modification date", '')::DATE DESC NULLS LAST
+), upserted AS (
+    INSERT INTO city AS c (geoname_id, name, ascii_name, country, latitude, longitude, population,
+                           alternate_names, timezone, modification_date)
+    SELECT * FROM source
+    ON CONFLICT (geoname_id) DO UPDATE SET
+        name = EXCLUDED.name,
+        ascii_name = EXCLUDED.ascii_name,
+        country = EXCLUDED.country,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        population = EXCLUDED.population,
+        alternate_names = EXCLUDED.alternate_names,
+        timezone = EXCLUDED.timezone,
+        modification_date = EXCLUDED.modification_date
+    WHERE %(force)s
+       OR c.modification_date IS NULL
+       OR EXCLUDED.modification_date > c.modification_date
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT
+    (SELECT count(*) FROM source),
+    count(*) FILTER (WHERE inserted),
+    count(*) FILTER (WHERE NOT inserted)
+FROM upserted
+"""
+
+
+class _CountingReader:
+    """File wrapper that reports bytes read, for progress during COPY."""
+
+    def __init__(self, file, on_read):
+        self._file = file
+        self._on_read = on_read
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._on_read(len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = self._file.readline(size)
+        self._on_read(len(data))
+        return data
+
+
+def load_cities(path: str, force: bool = False, progress=None) -> Dict[str, Any]:
+    """Stream the cities CSV into `city`; return row counts and throughput.
+
+    `progress(bytes_read, file_size)` is called as the file is read. With
+    `force` every city is rewritten regardless of its modification date.
+    """
+    size = os.path.getsize(path)
+    read = 0
+    last_report = 0.0
+
+    def on_read(count):
+        nonlocal read, last_report
+        read += count
+        if progress and time.monotonic() - last_report >= 1:
+            last_report = time.monotonic()
+            progress(read, size)
+
+    started = time.monotonic()
+    with transaction.atomic(), connection.cursor() as cursor, open(path, 'rb') as file:
+        cursor.execute(CREATE_STAGING_SQL)
+        cursor.copy_expert(COPY_SQL, _CountingReader(file, on_read), size=1 << 20)
+        copied_seconds = time.monotonic() - started
+        cursor.execute(ADOPT_LEGACY_SQL)
+        adopted = cursor.rowcount
+        cursor.execute(UPSERT_SQL, {'force': force})
+        rows, inserted, updated = cursor.fetchone()
+    seconds = time.monotonic() - started
+    if progress:
+        progress(size, size)
+    return {
+        'rows': rows,
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': rows - inserted - updated,
+        'adopted_legacy_rows': adopted,
+        'copy_seconds': round(copied_seconds, 2),
+        'seconds': round(seconds, 2),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+    }
+
+
+@job_handler('load_cities')
+def load_cities_job(job: BackgroundJob) -> Dict[str, Any]:
+    """Job form of `load_cities`; params `path` and `force`.
+
+    The whole load is one transaction, so a retry simply starts over, which
+    the upsert makes safe. Progress is measured in bytes of the file read
+    and written by the job's heartbeat thread, outside that transaction.
+    """
+    path: Optional[str] = job.params.get('path') or DEFAULT_CITIES_FILE
+    return load_cities(
+        path,
+        force=bool(job.params.get('force', False)),
+        progress=lambda read, size: report_progress(job, read, total=size),
+    )
@@ -0,0 +1,91 @@
+"""Grid-based marker clustering for the map viewport.
+
+The world is split into square lon/lat tiles whose width halves with every
+zoom level, like the map's own tiles. Each tile is clustered on its own
+fixed grid, so a viewport is the union of independent tiles and every tile
+result can be cached and reused while the user pans.
+"""
+import math
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .spatial_index import OfficeSpatialIndex
+
+# Grid cells per tile side; with 256px tiles this is a ~64px cluster radius
+CELLS_PER_TILE = 4
+# From this zoom on, offices are returned individually instead of clustered
+MAX_CLUSTER_ZOOM = 13
+MAX_ZOOM = 20
+
+
+def tile_size(zoom: int) -> float:
+    """Width and height of a tile in degrees at the given zoom."""
+    return 360.0 / (2 ** zoom)
+
+
+def tiles_for_bbox(min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+                   zoom: int) -> List[Tuple[int, int]]:
+    """Return the `(x, y)` tiles covering a bbox, with `y` counted from the south pole."""
+    size = tile_size(zoom)
+    x_tiles = 2 ** zoom
+    y_tiles = max(1, math.ceil(180.0 / size))
+    min_x = max(0, int((min_lon + 180.0) // size))
+    max_x = min(x_tiles - 1, int((max_lon + 180.0) // size))
+    min_y = max(0, int((min_lat + 90.0) // size))
+    max_y = min(y_tiles - 1, int((max_lat + 90.0) // size))
+    return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+
+def cluster_tile(index: OfficeSpatialIndex, company_ids: Iterable[Any],
+                 zoom: int, x: int, y: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Cluster one tile's offices for the given companies.
+
+    Below `MAX_CLUSTER_ZOOM` offices sharing a grid cell become one cluster
+    with a count and the centroid of its members; a cell holding a single
+    office is returned as that office. From `MAX_CLUSTER_ZOOM` on every
+    office is returned individually.
+    """
+    size = tile_size(zoom)
+    min_lon = -180.0 + x * size
+    min_lat = -90.0 + y * size
+    # Let the last column/row include offices sitting exactly on lon 180 / lat 90
+    max_lon = min_lon + size if min_lon + size < 180.0 else 180.0 + 1e-9
+    max_lat = min_lat + size if min_lat + size < 90.0 else 90.0 + 1e-9
+    offices = index.within_bbox(min_lat, max_lat, min_lon, max_lon, company_ids)
+
+    if zoom >= MAX_CLUSTER_ZOOM:
+        return {
+            'clusters': [],
+            'offices': [_office(lat, lon, office_id, company_id) for lat, lon, office_id, company_id in offices],
+        }
+
+    cell_size = size / CELLS_PER_TILE
+    cells: Dict[Tuple[int, int], List[Tuple[float, float, Any, Any]]] = {}
+    for office in offices:
+        lat, lon = office[0], office[1]
+        key = (
+            min(int((lon - min_lon) // cell_size), CELLS_PER_TILE - 1),
+            min(int((lat - min_lat) // cell_size), CELLS_PER_TILE - 1),
+        )
+        cells.setdefault(key, []).append(office)
+
+    clusters = []
+    singles = []
+    for members in cells.values():
+        if len(members) == 1:
+            singles.append(_office(*members[0]))
+            continue
+        clusters.append({
+            'lat': sum(member[0] for member in members) / len(members),
+            'lon': sum(member[1] for member in members) / len(members),
+            'count': len(members),
+        })
+    return {'clusters': clusters, 'offices': singles}
+
+
+def _office(lat: float, lon: float, office_id: Any, company_id: Any) -> Dict[str, Any]:
+    return {
+        'id': str(office_id),
+        'companyId': str(company_id),
+        'lat': lat,
+        'lon': lon,
+    }
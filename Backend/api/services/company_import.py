@@ -0,0 +1,243 @@
+"""Parallel import of the free company dataset.
+
+The CSV is split into line-aligned byte ranges. Each range is parsed and
+its websites normalized to domains on a process pool, and the normalized
+rows are streamed with COPY into `company_import_staging`, one transaction
+per chunk together with the job checkpoint, so a failed import resumes at
+the first chunk that was not staged. Once every chunk is staged, one
+set-based merge inserts the companies whose domain is not already known
+(a hash anti-join against every primary and alternate domain) and a
+headquarters office for each from its locality, region and country.
+
+The dataset has one record per line; a quoted field spanning lines would
+be cut at a chunk boundary and its rows counted as skipped.
+"""
+import csv
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import connection, transaction
+
+from data.models import BackgroundJob
+from .domains import normalize_domain
+from .jobs import job_handler, save_checkpoint
+
+DEFAULT_COMPANIES_FILE = '/data/free_company_dataset.csv'
+DEFAULT_CHUNK_MB = 32
+DEFAULT_WORKERS = 4
+# Columns the import reads; the dataset also has founded, id, linkedin_url and size
+REQUIRED_COLUMNS = ('name', 'website')
+OPTIONAL_COLUMNS = ('industry', 'locality', 'region', 'country')
+MAX_LENGTH = 255
+
+COPY_STAGING_SQL = """
+COPY company_import_staging (job_id, chunk, line, name, domain, industry, locality, region, country)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+# Rows of chunks the checkpoint does not list, left over from an attempt
+# that died mid-copy; removed once per attempt before staging resumes
+DELETE_UNSTAGED_SQL = """
+DELETE FROM company_import_staging
+WHERE job_id = %(job)s::uuid AND chunk <> ALL(%(staged)s::int[])
+"""
+
+MERGE_SQL = """
+WITH known AS (
+    SELECT lower(domain) AS domain FROM company
+    UNION
+    SELECT lower(unnest(domains)) FROM company
+), source AS (
+    SELECT DISTINCT ON (s.domain) s.name, s.domain, s.industry, s.locality, s.region, s.country
+    FROM company_import_staging s
+    WHERE s.job_id = %(job)s::uuid
+      AND NOT EXISTS (SELECT 1 FROM known WHERE known.domain = s.domain)
+    ORDER BY s.domain, s.chunk, s.line
+), created AS (
+    INSERT INTO company (name, domain, domains, default_insdustry)
+    SELECT name, domain, ARRAY[domain]::TEXT[], industry FROM source
+    -- Created meanwhile by a domain upload
+    ON CONFLICT ((lower(domain))) DO NOTHING
+    RETURNING id, name, domain
+), offices AS (
+    INSERT INTO office (company_id, name, city, state, country, is_headquarters)
+    SELECT created.id, created.name, source.locality, source.region, source.country, TRUE
+    FROM created JOIN source USING (domain)
+    WHERE source.locality IS NOT NULL OR source.region IS NOT NULL OR source.country IS NOT NULL
+    RETURNING 1
+)
+SELECT
+    (SELECT count(DISTINCT domain) FROM company_import_staging WHERE job_id = %(job)s::uuid),
+    (SELECT count(*) FROM created),
+    (SELECT count(*) FROM offices)
+"""
+
+DELETE_STAGED_SQL = "DELETE FROM company_import_staging WHERE job_id = %(job)s::uuid"
+
+Chunk = Tuple[int, int, int]
+
+
+def read_header(path: str) -> Tuple[List[str], int]:
+    """Column names of the CSV and the byte offset of its first record."""
+    with open(path, 'rb') as file:
+        line = file.readline()
+        header = next(csv.reader([line.decode('utf-8-sig')]), [])
+        return [column.strip().lower() for column in header], file.tell()
+
+
+def plan_chunks(path: str, start: int, chunk_bytes: int) -> List[Chunk]:
+    """Split the file from `start` into `(index, start, end)` ranges ending on a newline."""
+    size = os.path.getsize(path)
+    chunks = []
+    with open(path, 'rb') as file:
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                file.seek(end)
+                file.readline()
+                end = file.tell()
+            chunks.append((len(chunks), start, end))
+            start = end
+    return chunks
+
+
+def _clean(value: Optional[str]) -> Optional[str]:
+    value = (value or '').strip()
+    return value[:MAX_LENGTH] or None
+
+
+def _place(value: Optional[str]) -> Optional[str]:
+    # The dataset lowercases places; title-case those for display
+    value = _clean(value)
+    return value.title() if value and value.islower() else value
+
+
+def normalize_chunk(path: str, header: List[str], job_id: str, chunk: Chunk) -> Tuple[int, int, int, bytes]:
+    """Parse one chunk into COPY-ready CSV of staging rows.
+
+    Runs in a pool worker. Returns `(index, rows, skipped, data)`; rows
+    without a name or a usable website domain are skipped.
+    """
+    index, start, end = chunk
+    with open(path, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8', errors='replace')
+    positions = {column: header.index(column) for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+                 if column in header}
+    width = len(header)
+
+    def field(record, column):
+        position = positions.get(column)
+        return record[position] if position is not None else None
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+    rows = skipped = 0
+    for line, record in enumerate(csv.reader(io.StringIO(text))):
+        if not record:
+            continue
+        rows += 1
+        if len(record) < width:
+            skipped += 1
+            continue
+        name = _clean(field(record, 'name'))
+        domain = normalize_domain(field(record, 'website'))
+        if not name or not domain or len(domain) > MAX_LENGTH:
+            skipped += 1
+            continue
+        writer.writerow([
+            job_id, index, line, name, domain, _clean(field(record, 'industry')),
+            _place(field(record, 'locality')), _place(field(record, 'region')), _place(field(record, 'country')),
+        ])
+    return index, rows, skipped, out.getvalue().encode('utf-8')
+
+
+@job_handler('import_companies')
+def import_companies(job: BackgroundJob) -> Dict[str, Any]:
+    """Stage the companies CSV chunk by chunk, then merge new companies and offices.
+
+    Params: `path`, `chunk_mb` (chunk size), `workers` (normalizer processes,
+    0 normalizes in this process). The checkpoint holds the staged chunk
+    indexes and running row counts; progress is measured in bytes.
+    """
+    path = job.params.get('path') or DEFAULT_COMPANIES_FILE
+    chunk_bytes = int(float(job.params.get('chunk_mb', DEFAULT_CHUNK_MB)) * 2**20)
+    workers = int(job.params.get('workers', DEFAULT_WORKERS))
+    job_id = str(job.id)
+    checkpoint = dict(job.checkpoint)
+    started = time.monotonic()
+    resumed_rows = checkpoint.get('rows', 0)
+
+    header, data_start = read_header(path)
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"{path} has no {', '.join(missing)} column")
+    chunks = plan_chunks(path, data_start, chunk_bytes)
+    staged = set(checkpoint.get('staged', []))
+    pending = [chunk for chunk in chunks if chunk[0] not in staged]
+    if job.total is None:
+        save_checkpoint(job, checkpoint, job.processed, total=os.path.getsize(path))
+    if pending:
+        with connection.cursor() as cursor:
+            cursor.execute(DELETE_UNSTAGED_SQL, {'job': job_id, 'staged': sorted(staged)})
+
+    def stage(result):
+        index, rows, skipped, data = result
+        _index, start, end = chunks[index]
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.copy_expert(COPY_STAGING_SQL, io.BytesIO(data))
+            staged.add(index)
+            checkpoint['staged'] = sorted(staged)
+            checkpoint['rows'] = checkpoint.get('rows', 0) + rows
+            checkpoint['skipped'] = checkpoint.get('skipped', 0) + skipped
+            save_checkpoint(job, checkpoint, job.processed + end - start)
+
+    if pending and workers > 0:
+        # Forked children must not inherit the parent's open connection
+        connection.close()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            try:
+                # Keep a bounded number of chunks in flight so memory stays flat
+                in_flight = []
+                for chunk in pending:
+                    in_flight.append(pool.submit(normalize_chunk, path, header, job_id, chunk))
+                    if len(in_flight) >= 2 * workers:
+                        stage(in_flight.pop(0).result())
+                for future in in_flight:
+                    stage(future.result())
+            except BaseException:
+                pool.shutdown(cancel_futures=True)
+                raise
+    else:
+        for chunk in pending:
+            stage(normalize_chunk(path, header, job_id, chunk))
+    staged_seconds = time.monotonic() - started
+
+    if 'created' not in checkpoint:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(MERGE_SQL, {'job': job_id})
+                domains, created, offices = cursor.fetchone()
+                cursor.execute(DELETE_STAGED_SQL, {'job': job_id})
+            checkpoint.update(domains=domains, created=created, offices=offices)
+            save_checkpoint(job, checkpoint, job.processed)
+
+    seconds = time.monotonic() - started
+    rows = checkpoint.get('rows', 0)
+    return {
+        'rows': rows,
+        'skipped': checkpoint.get('skipped', 0),
+        'domains': checkpoint['domains'],
+        'created': checkpoint['created'],
+        'existing': checkpoint['domains'] - checkpoint['created'],
+        'offices': checkpoint['offices'],
+        'chunks': len(chunks),
+        'stage_seconds': round(staged_seconds, 2),
+        'merge_seconds': round(seconds - staged_seconds, 2),
+        'rows_per_second': round((rows - resumed_rows) / seconds, 1) if seconds else None,
+    }
@@ -0,0 +1,149 @@
+"""Frontend-shaped company payloads, built with batched queries."""
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+from django.db import connection
+
+from data.models import Company, Office, Person, TaxonomyRelationship, UserWorld
+
+# One keyset page of the user's companies in (name, id) order, walking
+# idx_company_name_id; the first page starts from ('', nil uuid)
+USER_COMPANIES_PAGE_SQL = """
+WITH members AS (
+    SELECT company_id AS id FROM user_world
+    WHERE user_id = %(user)s::uuid AND company_id IS NOT NULL
+    UNION
+    SELECT unnest(world_companies_id) FROM user_world WHERE user_id = %(user)s::uuid
+)
+SELECT c.id, c.name
+FROM company c
+WHERE c.id IN (SELECT id FROM members)
+  AND (c.name, c.id) > (%(name)s, %(id)s::uuid)
+ORDER BY c.name, c.id
+LIMIT %(limit)s
+"""
+FIRST_PAGE = ('', '00000000-0000-0000-0000-000000000000')
+
+
+def serialize_office(office: Dict[str, Any]) -> Dict[str, Any]:
+    """Serialize an Office values() row into the frontend-expected shape."""
+    # Only include coordinates if both present
+    coords = None
+    if office['latitude'] is not None and office['longitude'] is not None:
+        coords = {
+            'lat': float(office['latitude']),
+            'lon': float(office['longitude']),
+        }
+    return {
+        'id': str(office['id']),
+        'coordinates': coords if coords is not None else {'lat': 0.0, 'lon': 0.0},
+        'address': office['address'] or '',
+        'city': office['city'] or '',
+        'country': office['country'] or '',
+        'isHQ': bool(office['is_headquarters']),
+    }
+
+
+def serialize_companies(company_ids: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Serialize a set of companies into the frontend-expected shape.
+
+    Offices, people and tags are fetched for the whole set at once, so the
+    cost is four queries regardless of how many companies are requested.
+    """
+    company_ids = list(company_ids)
+    if not company_ids:
+        return []
+
+    companies = list(
+        Company.objects.filter(id__in=company_ids)
+        .order_by('name', 'id')
+        .values('id', 'name')
+    )
+    return serialize_company_rows(companies)
+
+
+def serialize_company_rows(companies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Serialize Company `values('id', 'name')` rows, keeping their order.
+
+    Offices, people and tags for all rows are loaded in three queries.
+    """
+    company_ids = [company['id'] for company in companies]
+    if not company_ids:
+        return []
+
+    # Locations mapping, ordered like Office.Meta.ordering within a company
+    locations: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    offices = (
+        Office.objects.filter(company_id__in=company_ids)
+        .order_by('company_id', 'is_headquarters', 'city')
+        .values('id', 'company_id', 'latitude', 'longitude', 'address', 'city', 'country', 'is_headquarters')
+    )
+    for office in offices:
+        locations[office['company_id']].append(serialize_office(office))
+
+    # People: just return IDs (frontend expects string[]), ordered like Person.Meta.ordering
+    people_ids: Dict[Any, List[str]] = defaultdict(list)
+    people = (
+        Person.objects.filter(company_id__in=company_ids)
+        .order_by('company_id', 'last_name', 'first_name', 'id')
+        .values_list('company_id', 'id')
+    )
+    for company_id, person_id in people:
+        people_ids[company_id].append(str(person_id))
+
+    # Tags: taxonomy IDs associated to each company, in a fixed order so stored
+    # fragments and live payloads compare equal
+    tag_ids: Dict[Any, List[str]] = defaultdict(list)
+    tags = (
+        TaxonomyRelationship.objects.filter(company_id__in=company_ids)
+        .order_by('company_id', 'taxonomy_id')
+        .values_list('company_id', 'taxonomy_id')
+    )
+    for company_id, taxonomy_id in tags:
+        tag_ids[company_id].append(str(taxonomy_id))
+
+    return [
+        {
+            'id': str(company['id']),
+            'name': company['name'],
+            'locations': locations.get(company['id'], []),
+            'people': people_ids.get(company['id'], []),
+            'tags': tag_ids.get(company['id'], []),
+        }
+        for company in companies
+    ]
+
+
+def get_user_company_ids(user) -> Set[Any]:
+    """Collect company IDs from the user's `UserWorld` records.
+
+    Includes the primary `company` and any IDs listed in `world_companies`.
+    """
+    company_ids = set()
+    for company_id, world_companies in UserWorld.objects.filter(user=user).values_list('company_id', 'world_companies'):
+        if company_id:
+            company_ids.add(company_id)
+        if world_companies:
+            company_ids.update(world_companies)
+    return company_ids
+
+
+def iter_user_company_pages(user, page_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the user's companies as `values('id', 'name')` rows, one keyset page at a time.
+
+    Each page is its own short query, so no cursor or transaction stays
+    open while a slow client reads the stream.
+    """
+    name, company_id = FIRST_PAGE
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(USER_COMPANIES_PAGE_SQL, {
+                'user': str(user.id), 'name': name, 'id': str(company_id), 'limit': page_size,
+            })
+            page = [{'id': row_id, 'name': row_name} for row_id, row_name in cursor.fetchall()]
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        name, company_id = page[-1]['name'], page[-1]['id']
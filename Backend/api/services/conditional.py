@@ -0,0 +1,89 @@
+"""Strong ETags and conditional GET helpers for API views."""
+import hashlib
+import threading
+import time
+from typing import Any, Optional
+
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+# Counter bumped by triggers in the same transaction as every change to the
+# user's world membership or to a member company, its offices, people and
+# tags (init-scripts/init-db.sql), so it moves exactly when committed data does
+WORLD_VERSION_SQL = "SELECT version FROM world_version WHERE user_id = %(user)s::uuid"
+
+# City rows carry no timestamps; their version is re-read at most this often
+CITY_VERSION_SECONDS = 300
+
+_city_version = (0.0, None)
+_city_version_lock = threading.Lock()
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a strong ETag from the parts that determine a representation."""
+    digest = hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def world_version(user) -> str:
+    """Return a version string for everything in the user's map payload.
+
+    One primary-key lookup, whatever the size of the world; a user whose
+    world never changed has no row yet and is at version 0.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(WORLD_VERSION_SQL, {'user': str(user.id)})
+        row = cursor.fetchone()
+    return str(row[0]) if row else '0'
+
+
+def city_version() -> str:
+    """Return a version string for the City table, cached per worker."""
+    global _city_version
+    with _city_version_lock:
+        fetched_at, version = _city_version
+        if version is None or time.monotonic() - fetched_at >= CITY_VERSION_SECONDS:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*), coalesce(sum(population), 0), max(modification_date) FROM city"
+                )
+                version = '%s:%s:%s' % cursor.fetchone()
+            _city_version = (time.monotonic(), version)
+        return version
+
+
+def representation_etag(request, version: str, *sources: str) -> str:
+    """ETag for `version` as rendered for this path, query and media type.
+
+    Responses answered from a per-worker index pass its `fingerprint()` as
+    a source: the index can lag the database, so the database version
+    alone does not identify the body.
+    """
+    accepted = getattr(request, 'accepted_media_type', '')
+    return make_etag(version, *sources, request.get_full_path(), accepted)
+
+
+def not_modified(request, etag: str) -> Optional[Response]:
+    """Return a 304 response if the request's If-None-Match matches `etag`."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return None
+    candidates = [tag.strip() for tag in header.split(',')]
+    # If-None-Match uses weak comparison, so a W/ prefix still matches
+    if '*' in candidates or etag in candidates or f'W/{etag}' in candidates:
+        return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return None
+
+
+def with_etag(response, etag: str):
+    """Attach the ETag and mark the response as varying per user and format.
+
+    Error responses are returned untouched.
+    """
+    if response.status_code not in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        return response
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Authorization', 'Accept'))
+    return response
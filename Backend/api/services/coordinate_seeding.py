@@ -0,0 +1,65 @@
+"""Random office coordinates for test data, as a resumable background job."""
+from typing import Any, Dict
+
+from django.db import connection, transaction
+
+from data.models import BackgroundJob, Company
+from .jobs import job_handler, save_checkpoint
+
+DEFAULT_BATCH_SIZE = 50000
+
+# One set-based statement per batch: take the next companies by id, pick each
+# company's first office (Office.Meta.ordering) and give it random coordinates.
+SEED_BATCH_SQL = """
+WITH batch AS (
+    SELECT id FROM company
+    WHERE %(after)s::uuid IS NULL OR id > %(after)s::uuid
+    ORDER BY id
+    LIMIT %(limit)s
+), targets AS (
+    SELECT DISTINCT ON (o.company_id) o.id
+    FROM office o JOIN batch b ON b.id = o.company_id
+    ORDER BY o.company_id, o.is_headquarters, o.city
+), updated AS (
+    UPDATE office
+    SET latitude = (random() * 180 - 90)::DECIMAL(10,8),
+        longitude = (random() * 360 - 180)::DECIMAL(11,8),
+        updated_at = NOW()
+    FROM targets
+    WHERE office.id = targets.id
+    RETURNING 1
+)
+SELECT
+    (SELECT id FROM batch ORDER BY id DESC LIMIT 1),
+    (SELECT count(*) FROM batch),
+    (SELECT count(*) FROM updated)
+"""
+
+
+@job_handler('random_coordinates')
+def seed_random_coordinates(job: BackgroundJob) -> Dict[str, Any]:
+    """Assign random coordinates to the first office of every company.
+
+    Companies are walked in keyset batches by id; each batch is one UPDATE
+    committed together with the job checkpoint.
+    """
+    batch_size = int(job.params.get('batch_size', DEFAULT_BATCH_SIZE))
+    after = job.checkpoint.get('after')
+    updated = int(job.checkpoint.get('updated', 0))
+    processed = job.processed
+    if job.total is None:
+        save_checkpoint(job, job.checkpoint, processed, total=Company.objects.count())
+
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(SEED_BATCH_SQL, {'after': after, 'limit': batch_size})
+                last_id, companies, offices = cursor.fetchone()
+            if not companies:
+                break
+            after = str(last_id)
+            processed += companies
+            updated += offices
+            save_checkpoint(job, {'after': after, 'updated': updated}, processed)
+
+    return {'offices_updated': updated}
@@ -0,0 +1,194 @@
+"""Import of client domain lists into a user's world, as a background job.
+
+The upload request only reads the file line by line, normalizes the
+domains and COPYs them into `domain_upload_staging` under a new job, in
+the same transaction that queues the job. The `import_domains` job then
+matches the staged domains in fixed-size batches, creates placeholder
+companies if asked, and appends each batch's matches to the user's world,
+committing every batch together with its checkpoint.
+"""
+import codecs
+import csv
+import io
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+from django.db import connection, transaction
+
+from data.models import BackgroundJob
+from .domains import normalize_domain
+from .jobs import enqueue, job_handler, save_checkpoint
+
+# Distinct domains matched per query
+UPLOAD_BATCH_SIZE = 5000
+
+# Header cells recognised as the domain column of a CSV file
+DOMAIN_COLUMNS = ('domain', 'domains', 'website', 'url', 'company_domain')
+
+# Companies whose primary domain or any alternate domain is in the batch.
+# Served by idx_company_domain_lower_unique and the GIN index on domains.
+MATCH_DOMAINS_SQL = """
+SELECT lower(c.domain), c.id FROM company c WHERE lower(c.domain) = ANY(%(domains)s)
+UNION
+SELECT d, c.id
+FROM company c CROSS JOIN LATERAL unnest(c.domains) AS d
+WHERE c.domains && %(domains)s::text[] AND d = ANY(%(domains)s)
+"""
+
+# Placeholder companies for domains nobody has imported yet; the pipeline
+# fills in names and offices later. Domains created concurrently by another
+# import hit the unique lower(domain) index and are matched afterwards.
+CREATE_COMPANIES_SQL = """
+INSERT INTO company (name, domain, domains)
+SELECT d, d, ARRAY[d]::text[]
+FROM unnest(%(domains)s::text[]) AS d
+ON CONFLICT ((lower(domain))) DO NOTHING
+RETURNING domain, id
+"""
+
+COPY_STAGING_SQL = "COPY domain_upload_staging (job_id, line, domain) FROM STDIN WITH (FORMAT csv)"
+
+STAGED_BATCH_SQL = """
+SELECT line, domain FROM domain_upload_staging
+WHERE job_id = %(job)s::uuid AND line > %(after)s
+ORDER BY line
+LIMIT %(limit)s
+"""
+
+DELETE_STAGED_SQL = "DELETE FROM domain_upload_staging WHERE job_id = %(job)s::uuid"
+
+# Append to the user's oldest world, or create one if they have none.
+ADD_TO_WORLD_SQL = """
+WITH target AS (
+    SELECT id FROM user_world WHERE user_id = %(user)s::uuid ORDER BY created_at LIMIT 1
+), updated AS (
+    UPDATE user_world uw
+    SET world_companies_id = ARRAY(
+            SELECT DISTINCT unnest(coalesce(uw.world_companies_id, '{}'::uuid[]) || %(companies)s::uuid[])
+        ),
+        updated_at = NOW()
+    FROM target
+    WHERE uw.id = target.id
+    RETURNING uw.id
+)
+INSERT INTO user_world (user_id, world_companies_id, world_people_id)
+SELECT %(user)s::uuid, %(companies)s::uuid[], '{}'::uuid[]
+WHERE NOT EXISTS (SELECT 1 FROM updated)
+"""
+
+
+def iter_upload_values(uploaded_file, encoding: str = 'utf-8-sig') -> Iterator[str]:
+    """Yield the raw domain cell of each line of an uploaded CSV or text file.
+
+    Plain-text files are read as one-column CSV. When the first row has a
+    recognised header the named column is used, otherwise the first column.
+    """
+    reader = codecs.getreader(encoding)(uploaded_file, errors='replace')
+    rows = csv.reader(reader)
+    column = 0
+    first = True
+    for row in rows:
+        if not row:
+            continue
+        if first:
+            first = False
+            header = [cell.strip().lower() for cell in row]
+            matches = [i for i, cell in enumerate(header) if cell in DOMAIN_COLUMNS]
+            if matches:
+                column = matches[0]
+                continue
+        if column < len(row):
+            yield row[column]
+
+
+def stage_upload(user, values: Iterable[str], create_missing: bool = False) -> BackgroundJob:
+    """Queue an `import_domains` job for the normalized domains in `values`.
+
+    Must run inside a transaction, so no worker sees the job before its
+    domains are staged. Lines and rejected values are counted here.
+    """
+    job = enqueue('import_domains', {'user': str(user.id), 'create': create_missing}, owner=user)
+    lines = invalid = staged = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    with connection.cursor() as cursor:
+        for value in values:
+            lines += 1
+            domain = normalize_domain(value)
+            if domain is None:
+                invalid += 1
+                continue
+            writer.writerow([job.id, staged, domain])
+            staged += 1
+            if staged % UPLOAD_BATCH_SIZE == 0:
+                buffer.seek(0)
+                cursor.copy_expert(COPY_STAGING_SQL, buffer)
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            buffer.seek(0)
+            cursor.copy_expert(COPY_STAGING_SQL, buffer)
+    job.params.update(lines=lines, invalid=invalid)
+    job.total = staged
+    job.save(update_fields=['params', 'total', 'updated_at'])
+    return job
+
+
+def _match(cursor, domains: List[str], company_ids: Set[Any]) -> Set[str]:
+    """Add the companies matching `domains` to `company_ids`; return the matched domains."""
+    cursor.execute(MATCH_DOMAINS_SQL, {'domains': domains})
+    matched: Set[str] = set()
+    for domain, company_id in cursor.fetchall():
+        matched.add(domain)
+        company_ids.add(company_id)
+    return matched
+
+
+@job_handler('import_domains')
+def import_domains(job: BackgroundJob) -> Dict[str, int]:
+    """Match staged domains against companies and add the matches to the user's world.
+
+    With `create` a placeholder company is created for every domain that
+    matches nothing. Counts are per distinct domain within a batch, so a
+    domain repeated far apart in the file is counted again.
+    """
+    job_id = str(job.id)
+    stats = {'matched': 0, 'created': 0, 'unmatched': 0, 'companies': 0}
+    stats.update(job.checkpoint.get('stats', {}))
+    after = job.checkpoint.get('after', -1)
+
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(STAGED_BATCH_SQL, {'job': job_id, 'after': after, 'limit': UPLOAD_BATCH_SIZE})
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            after = rows[-1][0]
+            batch = list({domain for _line, domain in rows})
+
+            company_ids: Set[Any] = set()
+            matched = _match(cursor, batch, company_ids)
+            missing = [domain for domain in batch if domain not in matched]
+            if job.params.get('create') and missing:
+                cursor.execute(CREATE_COMPANIES_SQL, {'domains': missing})
+                created = dict(cursor.fetchall())
+                company_ids.update(created.values())
+                stats['created'] += len(created)
+                raced = [domain for domain in missing if domain not in created]
+                if raced:
+                    matched |= _match(cursor, raced, company_ids)
+                stats['unmatched'] += len(missing) - len(created) - len(set(raced) & matched)
+            else:
+                stats['unmatched'] += len(missing)
+            stats['matched'] += len(matched)
+
+            if company_ids:
+                cursor.execute(ADD_TO_WORLD_SQL, {
+                    'user': job.params['user'],
+                    'companies': [str(company_id) for company_id in company_ids],
+                })
+            stats['companies'] += len(company_ids)
+            save_checkpoint(job, {'after': after, 'stats': stats}, after + 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(DELETE_STAGED_SQL, {'job': job_id})
+    return {'lines': job.params.get('lines', 0), 'invalid': job.params.get('invalid', 0), **stats}
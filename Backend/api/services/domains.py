@@ -0,0 +1,33 @@
+"""Domain normalization shared by uploads and company imports."""
+import re
+from typing import Optional
+
+_SCHEME = re.compile(r'^[a-z][a-z0-9+.-]*://')
+_HOST_END = re.compile(r'[/?#\s]')
+_HOSTNAME = re.compile(r'^(?=.{1,253}$)[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?)+$')
+
+
+def normalize_domain(raw: Optional[str]) -> Optional[str]:
+    """Reduce a URL, email address or hostname to a lowercase hostname.
+
+    Strips scheme, credentials, path, query, port, a leading `www.` and a
+    trailing dot; internationalized names are converted to punycode. Returns
+    None for anything that is not a plausible hostname.
+    """
+    if not raw:
+        return None
+    value = raw.strip().strip('"\'').lower()
+    value = _SCHEME.sub('', value)
+    value = value.rsplit('@', 1)[-1]
+    value = _HOST_END.split(value, maxsplit=1)[0]
+    value = value.split(':', 1)[0].rstrip('.')
+    if value.startswith('www.'):
+        value = value[4:]
+    if not value:
+        return None
+    if not value.isascii():
+        try:
+            value = value.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None
+    return value if _HOSTNAME.match(value) else None
@@ -0,0 +1,271 @@
+"""Company entity resolution over registrable domains and blocking keys.
+
+Every company is reduced to a few blocking keys: its registrable domain
+(`shop.example.co.uk` -> `example.co.uk`) and a normalized name. Companies
+are only ever compared with others sharing a key, so resolving a batch costs
+one dict lookup per key per record and the whole pass is linear in the
+number of companies. Hosts that say nothing about the company (LinkedIn or
+Facebook pages the CSV loader fell back to, `unknown.local`) never block;
+those companies are matched by name alone, with a lower score.
+"""
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set
+
+from django.db import connection
+
+from .domains import normalize_domain
+
+# Multi-label public suffixes that sit below a registrable name. Not the
+# full Public Suffix List, but it covers the country-code second levels
+# that show up in company websites.
+MULTI_LABEL_SUFFIXES = frozenset({
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'ltd.uk', 'plc.uk', 'me.uk', 'net.uk',
+    'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au', 'co.nz', 'org.nz', 'net.nz',
+    'co.jp', 'ne.jp', 'or.jp', 'ac.jp', 'co.kr', 'or.kr', 'com.cn', 'net.cn', 'org.cn',
+    'com.hk', 'com.tw', 'com.sg', 'com.my', 'co.id', 'co.th', 'com.ph', 'com.vn',
+    'co.in', 'net.in', 'org.in', 'firm.in', 'gen.in', 'com.pk', 'com.bd', 'com.np', 'com.lk',
+    'com.br', 'net.br', 'org.br', 'com.ar', 'com.mx', 'com.co', 'com.pe', 'com.ve', 'com.uy',
+    'com.ec', 'com.bo', 'com.py', 'cl.cl', 'co.za', 'org.za', 'com.ng', 'com.eg', 'co.ke',
+    'com.gh', 'co.tz', 'co.ug', 'com.tr', 'com.sa', 'com.qa', 'com.kw', 'co.il', 'org.il',
+    'com.ua', 'com.pl', 'com.ru', 'com.gr', 'com.cy', 'com.mt', 'co.at', 'or.at', 'com.es',
+    'com.pt', 'co.hu', 'com.ro',
+})
+
+# Hosts shared by unrelated companies; they must never put companies in one block
+NON_IDENTIFYING_DOMAINS = frozenset({
+    'unknown.local', 'linkedin.com', 'facebook.com', 'twitter.com', 'x.com', 'instagram.com',
+    'youtube.com', 'crunchbase.com', 'angel.co', 'wellfound.com', 'google.com', 'sites.google.com',
+    'wix.com', 'wixsite.com', 'wordpress.com', 'blogspot.com', 'squarespace.com', 'github.io',
+    'godaddysites.com', 'weebly.com', 'yelp.com',
+})
+
+LEGAL_SUFFIXES = frozenset({
+    'inc', 'incorporated', 'llc', 'llp', 'lp', 'ltd', 'limited', 'corp', 'corporation', 'co',
+    'company', 'plc', 'gmbh', 'ag', 'kg', 'sa', 'sas', 'sarl', 'srl', 'spa', 'bv', 'nv', 'oy',
+    'ab', 'as', 'aps', 'pty', 'pvt', 'private', 'sl', 'kk', 'the', 'group', 'holdings',
+})
+
+_LINKEDIN_COMPANY = re.compile(r'linkedin\.com/(?:company|school)/([^/?#\s]+)', re.IGNORECASE)
+
+# Blocks larger than this are too generic to compare pairwise ("consulting")
+# and are skipped, which keeps a pass linear even on dirty data
+MAX_BLOCK_SIZE = 50
+
+# Proposals below this score are dropped
+DEFAULT_MIN_SCORE = 0.6
+
+# Companies read per query when building the index
+INDEX_BATCH_SIZE = 20000
+
+COMPANY_BATCH_SQL = """
+SELECT id, name, domain, domains FROM company
+WHERE %(after)s::uuid IS NULL OR id > %(after)s::uuid
+ORDER BY id
+LIMIT %(limit)s
+"""
+
+
+class CompanyRecord(NamedTuple):
+    id: Any
+    name: str
+    domain: Optional[str]
+    domains: Sequence[str] = ()
+
+
+class MergeProposal(NamedTuple):
+    """`duplicate_id` should be merged into `keep_id`; `score` is in (0, 1]."""
+    keep_id: Any
+    duplicate_id: Any
+    score: float
+    reason: str
+
+
+def registrable_domain(host: Optional[str]) -> Optional[str]:
+    """Return the registrable part of a host, or None if it identifies nothing.
+
+    `shop.example.co.uk` and `www.example.co.uk` both become
+    `example.co.uk`; placeholder and social-network hosts return None.
+    """
+    host = normalize_domain(host)
+    if host is None:
+        return None
+    labels = host.split('.')
+    suffix_labels = 2 if '.'.join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 1
+    if len(labels) <= suffix_labels:
+        return None
+    registrable = '.'.join(labels[-suffix_labels - 1:])
+    if registrable in NON_IDENTIFYING_DOMAINS or host in NON_IDENTIFYING_DOMAINS or host.endswith('.local'):
+        return None
+    return registrable
+
+
+def name_tokens(name: Optional[str]) -> List[str]:
+    """Lowercase ASCII word tokens of a company name without legal-form words."""
+    if not name:
+        return []
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii').lower()
+    ascii_name = ascii_name.replace('&', ' and ')
+    tokens = re.findall(r'[a-z0-9]+', ascii_name)
+    return [token for token in tokens if token not in LEGAL_SUFFIXES] or tokens
+
+
+def name_key(name: Optional[str]) -> Optional[str]:
+    tokens = name_tokens(name)
+    return ' '.join(tokens) if tokens else None
+
+
+def _registrable_domains(record: CompanyRecord) -> frozenset:
+    hosts = {record.domain, *(record.domains or ())}
+    domains = set(filter(None, (registrable_domain(host) for host in hosts)))
+    for host in hosts:
+        if host and 'linkedin' in host:
+            slug = linkedin_slug(host)
+            if slug:
+                domains.add('linkedin:' + slug)
+    return frozenset(domains)
+
+
+def linkedin_slug(value: Optional[str]) -> Optional[str]:
+    """The company slug of a LinkedIn company page URL, if `value` is one."""
+    match = _LINKEDIN_COMPANY.search(value or '')
+    return match.group(1).lower() if match else None
+
+
+def blocking_keys(record: CompanyRecord) -> Set[str]:
+    """Keys under which a company is indexed: registrable domains, LinkedIn page and name."""
+    return set(_entry(record).keys)
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry(NamedTuple):
+    id: Any
+    # Registrable domains plus `linkedin:<slug>` for LinkedIn company pages
+    domains: frozenset
+    tokens: frozenset
+    keys: tuple
+
+
+def _entry(record: CompanyRecord) -> _Entry:
+    domains = _registrable_domains(record)
+    tokens = name_tokens(record.name)
+    keys = tuple('d:' + domain for domain in domains)
+    if tokens:
+        keys += ('n:' + ' '.join(tokens),)
+    return _Entry(record.id, domains, frozenset(tokens), keys)
+
+
+def score_pair(a: _Entry, b: _Entry) -> tuple:
+    """Score two companies; returns `(score, reason)`.
+
+    A shared registrable domain is strong evidence on its own and is
+    confirmed by the names; a name match without any shared domain scores
+    lower, and lower still when both companies have conflicting domains.
+    """
+    names = _jaccard(a.tokens, b.tokens)
+    if a.domains & b.domains:
+        return 0.7 + 0.3 * names, 'domain'
+    if names == 1.0:
+        if a.domains and b.domains:
+            return 0.55, 'name, different domains'
+        return 0.8, 'name'
+    return 0.6 * names, 'name'
+
+
+class CompanyIndex:
+    """Hashed blocking index over companies, keyed by `blocking_keys`."""
+
+    def __init__(self):
+        self._entries: List[_Entry] = []
+        self._blocks: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, record: CompanyRecord) -> None:
+        self._add(_entry(record))
+
+    def _add(self, entry: _Entry) -> None:
+        position = len(self._entries)
+        self._entries.append(entry)
+        for key in entry.keys:
+            block = self._blocks.setdefault(key, [])
+            if len(block) <= MAX_BLOCK_SIZE:
+                block.append(position)
+
+    def _candidates(self, entry: _Entry) -> Set[int]:
+        positions = set()
+        for key in entry.keys:
+            block = self._blocks.get(key)
+            if block and len(block) <= MAX_BLOCK_SIZE:
+                positions.update(block)
+        return positions
+
+    def best_match(self, record: CompanyRecord, min_score: float = DEFAULT_MIN_SCORE) -> Optional[MergeProposal]:
+        """The highest-scoring indexed company for a record, if any clears `min_score`."""
+        return self._best_match(_entry(record), min_score)
+
+    def _best_match(self, entry: _Entry, min_score: float) -> Optional[MergeProposal]:
+        best = None
+        for position in self._candidates(entry):
+            other = self._entries[position]
+            if other.id == entry.id:
+                continue
+            score, reason = score_pair(entry, other)
+            if score >= min_score and (best is None or score > best.score):
+                best = MergeProposal(other.id, entry.id, round(score, 3), reason)
+        return best
+
+    def resolve(self, records: Iterable[CompanyRecord], min_score: float = DEFAULT_MIN_SCORE,
+                add: bool = True) -> Iterator[MergeProposal]:
+        """Yield a proposal for every record that duplicates an indexed company.
+
+        With `add` (the default) unmatched records join the index, so
+        duplicates within the same batch resolve to the first occurrence.
+        """
+        for record in records:
+            entry = _entry(record)
+            proposal = self._best_match(entry, min_score)
+            if proposal is not None:
+                yield proposal
+            elif add:
+                self._add(entry)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'companies': len(self._entries),
+            'blocks': len(self._blocks),
+            'oversized_blocks': sum(1 for block in self._blocks.values() if len(block) > MAX_BLOCK_SIZE),
+        }
+
+
+def iter_company_records(batch_size: int = INDEX_BATCH_SIZE) -> Iterator[CompanyRecord]:
+    """Stream every company in id order with keyset batches."""
+    after = None
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(COMPANY_BATCH_SQL, {'after': after, 'limit': batch_size})
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            for company_id, name, domain, domains in rows:
+                yield CompanyRecord(company_id, name, domain, domains or ())
+            after = str(rows[-1][0])
+
+
+def build_company_index() -> CompanyIndex:
+    """Index every existing company."""
+    index = CompanyIndex()
+    for record in iter_company_records():
+        index.add(record)
+    return index
+
+
+def find_duplicates(min_score: float = DEFAULT_MIN_SCORE) -> Iterator[MergeProposal]:
+    """Resolve the company table against itself in one linear pass."""
+    return CompanyIndex().resolve(iter_company_records(), min_score)
@@ -0,0 +1,44 @@
+import math
+from typing import List, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+# Length of one degree of latitude (and of longitude at the equator)
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in km between two (lat, lon) points in degrees."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, List[Tuple[float, float]]]:
+    """Return a lat/lon box that contains every point within `radius_km`.
+
+    The result is `(min_lat, max_lat, lon_ranges)`. `lon_ranges` holds one
+    `(min_lon, max_lon)` pair, or two when the box crosses the antimeridian.
+    Near the poles the box covers every longitude.
+    """
+    d_lat = radius_km / KM_PER_DEGREE
+    min_lat = max(-90.0, lat - d_lat)
+    max_lat = min(90.0, lat + d_lat)
+
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat <= 1e-9 or max_lat >= 90.0 or min_lat <= -90.0:
+        return min_lat, max_lat, [(-180.0, 180.0)]
+
+    d_lon = radius_km / (KM_PER_DEGREE * cos_lat)
+    if d_lon >= 180.0:
+        return min_lat, max_lat, [(-180.0, 180.0)]
+
+    min_lon = lon - d_lon
+    max_lon = lon + d_lon
+    if min_lon < -180.0:
+        return min_lat, max_lat, [(min_lon + 360.0, 180.0), (-180.0, max_lon)]
+    if max_lon > 180.0:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360.0)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
@@ -0,0 +1,271 @@
+"""Offline geocoding of office and person locations against the City table.
+
+`CityGazetteer` maps normalized city names to candidate cities ordered by
+population, so resolving `(city, country)` is a dict lookup plus a scan of
+a few candidates. The `geocode` job walks offices and people without
+coordinates in keyset batches, normalizes each row's pair once, resolves
+the distinct pairs of the batch in-process and writes the coordinates
+back with one UPDATE per batch. A lookup costs well under a microsecond,
+less than shipping the pair to another process, so there is no pool.
+"""
+import re
+import time
+import unicodedata
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection, transaction
+
+from data.models import BackgroundJob, City
+from .jobs import job_handler, save_checkpoint
+
+DEFAULT_BATCH_SIZE = 20000
+# Resolved (city, country) pairs kept by the parent before the cache is reset
+PAIR_CACHE_SIZE = 500000
+
+# Tables that can be geocoded, in the order the job processes them
+GEOCODE_TABLES = ('office', 'person')
+
+# Spellings of countries that differ from the GeoNames English country names
+COUNTRY_ALIASES = {
+    'us': 'united states', 'usa': 'united states', 'u s': 'united states', 'u s a': 'united states',
+    'united states of america': 'united states', 'america': 'united states',
+    'uk': 'united kingdom', 'gb': 'united kingdom', 'great britain': 'united kingdom',
+    'england': 'united kingdom', 'scotland': 'united kingdom', 'wales': 'united kingdom',
+    'northern ireland': 'united kingdom',
+    'uae': 'united arab emirates', 'south korea': 'korea republic of', 'korea': 'korea republic of',
+    'north korea': 'korea democratic peoples republic of', 'russia': 'russian federation',
+    'iran': 'iran islamic republic of', 'vietnam': 'viet nam', 'syria': 'syrian arab republic',
+    'laos': 'lao peoples democratic republic', 'bolivia': 'bolivia plurinational state of',
+    'venezuela': 'venezuela bolivarian republic of', 'tanzania': 'tanzania united republic of',
+    'moldova': 'moldova republic of', 'czech republic': 'czechia', 'holland': 'netherlands',
+    'the netherlands': 'netherlands', 'taiwan': 'taiwan province of china', 'macedonia': 'north macedonia',
+    'ivory coast': 'cote divoire', 'turkey': 'turkiye', 'brasil': 'brazil', 'deutschland': 'germany',
+    'espana': 'spain', 'schweiz': 'switzerland', 'suisse': 'switzerland',
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+PENDING_BATCH_SQL = """
+SELECT id, city, country FROM {table}
+WHERE city IS NOT NULL AND city <> ''
+  AND (%(overwrite)s OR latitude IS NULL OR longitude IS NULL)
+  AND (%(after)s::uuid IS NULL OR id > %(after)s::uuid)
+ORDER BY id
+LIMIT %(limit)s
+"""
+
+PENDING_COUNT_SQL = """
+SELECT count(*) FROM {table}
+WHERE city IS NOT NULL AND city <> ''
+  AND (%(overwrite)s OR latitude IS NULL OR longitude IS NULL)
+"""
+
+UPDATE_COORDINATES_SQL = """
+UPDATE {table} t
+SET latitude = v.latitude, longitude = v.longitude, updated_at = NOW()
+FROM unnest(%(ids)s::uuid[], %(latitudes)s::numeric[], %(longitudes)s::numeric[])
+    AS v(id, latitude, longitude)
+WHERE t.id = v.id
+"""
+
+Pair = Tuple[str, str]
+Coordinates = Optional[Tuple[float, float]]
+
+
+def normalize_place(value: Optional[str]) -> str:
+    """Lowercase ASCII words of a place name, separated by single spaces."""
+    if not value:
+        return ''
+    ascii_value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii').lower()
+    ascii_value = ascii_value.replace("'", '')
+    return _NON_WORD.sub(' ', ascii_value).strip()
+
+
+def normalize_country(value: Optional[str]) -> str:
+    country = normalize_place(value)
+    return COUNTRY_ALIASES.get(country, country)
+
+
+class CityGazetteer:
+    """Normalized city name -> candidate cities, most populous first."""
+
+    def __init__(self):
+        self._names: Dict[str, array] = {}
+        self._lat = array('d')
+        self._lon = array('d')
+        self._country = array('l')
+        self._countries: List[str] = []
+        self._country_row: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._lat)
+
+    def load(self, cities: Iterable[tuple]) -> None:
+        """Add `(name, ascii_name, country, latitude, longitude, population)` rows.
+
+        Rows must arrive in descending population order; candidates keep
+        insertion order, so the first match for a name is the largest city.
+        """
+        for name, ascii_name, country, latitude, longitude, _population in cities:
+            if latitude is None or longitude is None:
+                continue
+            country = normalize_country(country)
+            country_row = self._country_row.get(country)
+            if country_row is None:
+                country_row = self._country_row[country] = len(self._countries)
+                self._countries.append(country)
+            row = len(self._lat)
+            self._lat.append(float(latitude))
+            self._lon.append(float(longitude))
+            self._country.append(country_row)
+            for key in {normalize_place(name), normalize_place(ascii_name)}:
+                if key:
+                    self._names.setdefault(key, array('l')).append(row)
+
+    def build(self) -> None:
+        """Load every city with coordinates, largest population first."""
+        self.load(
+            City.objects.exclude(latitude=None).exclude(longitude=None)
+            .order_by('-population')
+            .values_list('name', 'ascii_name', 'country', 'latitude', 'longitude', 'population')
+            .iterator(chunk_size=20000)
+        )
+
+    def resolve(self, city: Optional[str], country: Optional[str] = None) -> Coordinates:
+        """Coordinates of the most populous matching city, or None.
+
+        With a country only cities in that country match; without one the
+        largest city of that name anywhere wins.
+        """
+        return self.lookup(_pair(city, country))
+
+    def lookup(self, pair: Pair) -> Coordinates:
+        """`resolve` for a pair that is already normalized by `_pair`."""
+        city, country = pair
+        candidates = self._names.get(city)
+        if not candidates:
+            return None
+        country_row = None
+        if country:
+            country_row = self._country_row.get(country)
+            if country_row is None:
+                return None
+        for row in candidates:
+            if country_row is None or self._country[row] == country_row:
+                return self._lat[row], self._lon[row]
+        return None
+
+
+def _pair(city: Optional[str], country: Optional[str]) -> Pair:
+    return normalize_place(city), normalize_country(country)
+
+
+class PairCache:
+    """Resolved `(city, country)` pairs, cleared when it outgrows its budget."""
+
+    def __init__(self, max_size: int = PAIR_CACHE_SIZE):
+        self.max_size = max_size
+        self._pairs: Dict[Pair, Coordinates] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def missing(self, pairs: Iterable[Pair]) -> List[Pair]:
+        """Pairs not cached yet; makes room for them first so none of `pairs` is evicted later."""
+        pairs = set(pairs)
+        if len(self._pairs) + len(pairs) > self.max_size:
+            self._pairs.clear()
+        missing = []
+        for pair in pairs:
+            if pair in self._pairs:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.append(pair)
+        return missing
+
+    def update(self, pairs: List[Pair], results: List[Coordinates]) -> None:
+        self._pairs.update(zip(pairs, results))
+
+    def get(self, pair: Pair) -> Coordinates:
+        return self._pairs.get(pair)
+
+
+def geocode_batch(rows: List[tuple], cache: PairCache,
+                  gazetteer: CityGazetteer) -> Tuple[List[str], List[float], List[float]]:
+    """Resolve `(id, city, country)` rows; return columns for the rows that resolved."""
+    pairs = [_pair(city, country) for _id, city, country in rows]
+    missing = cache.missing(pairs)
+    if missing:
+        cache.update(missing, [gazetteer.lookup(pair) for pair in missing])
+
+    ids, latitudes, longitudes = [], [], []
+    for (row_id, _city, _country), pair in zip(rows, pairs):
+        coordinates = cache.get(pair)
+        if coordinates is not None:
+            ids.append(str(row_id))
+            latitudes.append(round(coordinates[0], 8))
+            longitudes.append(round(coordinates[1], 8))
+    return ids, latitudes, longitudes
+
+
+@job_handler('geocode')
+def geocode_locations(job: BackgroundJob) -> Dict[str, Any]:
+    """Fill in missing office and person coordinates from the City table.
+
+    Params: `tables` (default both), `batch_size` and `overwrite` to
+    re-geocode rows that already have coordinates. Each batch's UPDATE is
+    committed with the checkpoint.
+    """
+    tables = [table for table in job.params.get('tables', GEOCODE_TABLES) if table in GEOCODE_TABLES]
+    batch_size = int(job.params.get('batch_size', DEFAULT_BATCH_SIZE))
+    overwrite = bool(job.params.get('overwrite', False))
+    checkpoint = dict(job.checkpoint)
+    processed = resumed_at = job.processed
+    started = time.monotonic()
+
+    if job.total is None:
+        with connection.cursor() as cursor:
+            total = 0
+            for table in tables:
+                cursor.execute(PENDING_COUNT_SQL.format(table=table), {'overwrite': overwrite})
+                total += cursor.fetchone()[0]
+        save_checkpoint(job, checkpoint, processed, total=total)
+
+    gazetteer = CityGazetteer()
+    gazetteer.build()
+    cache = PairCache()
+
+    for table in tables:
+        done_key, after_key, resolved_key = f'{table}_done', f'{table}_after', f'{table}_resolved'
+        while not checkpoint.get(done_key):
+            with connection.cursor() as cursor:
+                cursor.execute(PENDING_BATCH_SQL.format(table=table), {
+                    'overwrite': overwrite, 'after': checkpoint.get(after_key), 'limit': batch_size,
+                })
+                rows = cursor.fetchall()
+            if not rows:
+                checkpoint[done_key] = True
+                save_checkpoint(job, checkpoint, processed)
+                break
+
+            ids, latitudes, longitudes = geocode_batch(rows, cache, gazetteer)
+            with transaction.atomic():
+                if ids:
+                    with connection.cursor() as cursor:
+                        cursor.execute(UPDATE_COORDINATES_SQL.format(table=table), {
+                            'ids': ids, 'latitudes': latitudes, 'longitudes': longitudes,
+                        })
+                checkpoint[after_key] = str(rows[-1][0])
+                checkpoint[resolved_key] = checkpoint.get(resolved_key, 0) + len(ids)
+                processed += len(rows)
+                save_checkpoint(job, checkpoint, processed)
+
+    seconds = time.monotonic() - started
+    return {
+        'resolved': {table: checkpoint.get(f'{table}_resolved', 0) for table in tables},
+        'rows': processed,
+        'rows_per_second': round((processed - resumed_at) / seconds, 1) if seconds else None,
+        'cache_hits': cache.hits,
+        'cache_misses': cache.misses,
+    }
@@ -0,0 +1,419 @@
+"""Background jobs: a registry of handlers, a Postgres-backed queue and its workers.
+
+A handler receives its `BackgroundJob`, processes work in batches and calls
+`save_checkpoint` after each one, so a job that dies part way is resumed
+from its last checkpoint instead of starting over. Checkpoints are the
+points where cancellation and worker shutdown take effect.
+
+Jobs are claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so any number of
+worker processes (`manage.py run_workers`) can poll the same table without
+blocking each other. While a job runs, a side thread refreshes its
+heartbeat every `JOB_HEARTBEAT_SECONDS` however long a batch takes. A
+failed job is retried with exponential backoff until it runs out of
+attempts; a running job whose heartbeat stops (its worker was killed) is
+put back on the queue, and that counts as an attempt too.
+
+Checkpoints and the final status are only written while the job is still
+locked by the worker running it, so a worker whose job was requeued after
+a stall cannot overwrite the progress of the worker that took it over.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from data.models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS: Dict[str, Callable[[BackgroundJob], Dict[str, Any]]] = {}
+
+# Set when the worker process is asked to stop; running jobs requeue at their next checkpoint
+_stop_requested = threading.Event()
+
+CLAIM_JOB_SQL = """
+UPDATE background_job
+SET status = 'running', locked_by = %(worker)s, heartbeat_at = NOW(), updated_at = NOW()
+WHERE id = (
+    SELECT id FROM background_job
+    WHERE status = 'queued' AND run_after <= NOW()
+      AND (%(kinds)s::text[] IS NULL OR kind = ANY(%(kinds)s::text[]))
+    ORDER BY run_after, created_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id
+"""
+
+# The attempt was counted when the job started: out of attempts it fails,
+# otherwise it is retried with the same backoff as a run that raised
+REQUEUE_STALE_SQL = """
+UPDATE background_job
+SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+    error = CASE WHEN attempts >= max_attempts THEN 'Worker stopped sending heartbeats' ELSE error END,
+    finished_at = CASE WHEN attempts >= max_attempts THEN NOW() ELSE finished_at END,
+    run_after = NOW() + %(retry_base)s * power(2, greatest(attempts - 1, 0)) * INTERVAL '1 second',
+    locked_by = NULL,
+    updated_at = NOW()
+WHERE status = 'running' AND heartbeat_at < NOW() - %(stale)s * INTERVAL '1 second'
+"""
+
+HEARTBEAT_SQL = """
+UPDATE background_job
+SET heartbeat_at = NOW(),
+    processed = COALESCE(%(processed)s, processed),
+    total = COALESCE(%(total)s, total),
+    updated_at = NOW()
+WHERE id = %(job)s::uuid AND status = 'running' AND locked_by IS NOT DISTINCT FROM %(worker)s
+RETURNING cancel_requested
+"""
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint when cancellation of the job was requested."""
+
+
+class JobInterrupted(Exception):
+    """Raised at a checkpoint when the worker running the job is shutting down."""
+
+
+class JobLeaseLost(Exception):
+    """Raised at a checkpoint when the job was requeued and may be running elsewhere."""
+
+
+class _Heartbeat(threading.Thread):
+    """Refreshes a running job's heartbeat on its own database connection.
+
+    Also writes the progress published with `report_progress`, and records
+    whether the job was cancelled or taken over, for handlers whose work is
+    one long transaction.
+    """
+
+    def __init__(self, job: BackgroundJob):
+        super().__init__(name=f'job-heartbeat-{job.id}', daemon=True)
+        self.job_id = str(job.id)
+        self.worker = job.locked_by
+        self.interval = getattr(settings, 'JOB_HEARTBEAT_SECONDS', 30)
+        self.progress: Optional[tuple] = None
+        self.cancelled = False
+        self.lost = False
+        self._written: Optional[tuple] = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        try:
+            while not self.lost:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                stopping = self._stopped.is_set()
+                if not stopping or self.progress != self._written:
+                    self._beat()
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    def _beat(self) -> None:
+        progress = self.progress
+        processed, total = progress or (None, None)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(HEARTBEAT_SQL, {
+                    'job': self.job_id, 'worker': self.worker, 'processed': processed, 'total': total,
+                })
+                row = cursor.fetchone()
+        except Exception:
+            logger.exception('Heartbeat of job %s failed', self.job_id)
+            return
+        self._written = progress
+        if row is None:
+            # Requeued or finished elsewhere; the handler learns at its next checkpoint
+            self.lost = True
+        else:
+            self.cancelled = row[0]
+
+    def publish(self, processed: int, total: Optional[int]) -> None:
+        self.progress = (processed, total)
+        self._wake.set()
+
+    def stop(self) -> None:
+        """Write any unwritten progress and end the thread."""
+        self._stopped.set()
+        self._wake.set()
+        self.join()
+
+
+# Heartbeat threads of the jobs this process is running, by job id
+_heartbeats: Dict[str, _Heartbeat] = {}
+
+
+def job_handler(kind: str):
+    """Register a function as the handler for jobs of `kind`."""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind: str, params: Optional[Dict[str, Any]] = None,
+            max_attempts: Optional[int] = None, run_after: Optional[datetime] = None,
+            owner=None) -> BackgroundJob:
+    """Queue a job; `run_after` delays it, e.g. for the next run of a recurring job.
+
+    `owner` is the user who may see and cancel the job through the API;
+    jobs without one are visible to staff only.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = BackgroundJob(kind=kind, params=params or {}, owner=owner)
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    if run_after is not None:
+        job.run_after = run_after
+    job.save()
+    return job
+
+
+def schedule_next(job: BackgroundJob, seconds: float) -> Optional[BackgroundJob]:
+    """Queue the next run of a recurring job unless one of its kind is already queued."""
+    if BackgroundJob.objects.filter(kind=job.kind, status=BackgroundJob.STATUS_QUEUED).exclude(id=job.id).exists():
+        return None
+    return enqueue(job.kind, job.params, max_attempts=job.max_attempts,
+                   run_after=timezone.now() + timedelta(seconds=seconds), owner=job.owner)
+
+
+def save_checkpoint(job: BackgroundJob, checkpoint: Dict[str, Any], processed: int,
+                    total: Optional[int] = None) -> None:
+    """Persist a job's resume position and progress, and refresh its heartbeat.
+
+    Raises JobCancelled or JobInterrupted when the job should stop, and
+    JobLeaseLost, without writing anything, when the job is no longer
+    locked by this worker. Callers that save the checkpoint inside the
+    batch's transaction get that batch rolled back with it, so the stored
+    checkpoint stays consistent.
+    """
+    now = timezone.now()
+    fields = {'checkpoint': checkpoint, 'processed': processed, 'heartbeat_at': now, 'updated_at': now}
+    if total is not None:
+        fields['total'] = total
+    updated = BackgroundJob.objects.filter(
+        id=job.id, status=BackgroundJob.STATUS_RUNNING, locked_by=job.locked_by,
+    ).update(**fields)
+    if not updated:
+        raise JobLeaseLost()
+    for field, value in fields.items():
+        setattr(job, field, value)
+    if BackgroundJob.objects.filter(id=job.id, cancel_requested=True).exists():
+        raise JobCancelled()
+    if _stop_requested.is_set():
+        raise JobInterrupted()
+
+
+def report_progress(job: BackgroundJob, processed: int, total: Optional[int] = None) -> None:
+    """Publish progress of a job whose work is one transaction, without a checkpoint.
+
+    `save_checkpoint` inside a long transaction would keep the job row
+    locked and its progress invisible until commit; this hands the numbers
+    to the job's heartbeat thread, which writes them on its own
+    connection. Raises like `save_checkpoint` when the job should stop.
+    """
+    if _stop_requested.is_set():
+        raise JobInterrupted()
+    heartbeat = _heartbeats.get(str(job.id))
+    if heartbeat is None:
+        return
+    if heartbeat.lost:
+        raise JobLeaseLost()
+    if heartbeat.cancelled:
+        raise JobCancelled()
+    heartbeat.publish(processed, total)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    base = getattr(settings, 'JOB_RETRY_BASE_SECONDS', 30)
+    return timedelta(seconds=base * 2 ** max(attempts - 1, 0))
+
+
+def run_job(job: BackgroundJob, worker: Optional[str] = None) -> BackgroundJob:
+    """Run a job in the current thread, resuming from its checkpoint.
+
+    Failures are retried later (status back to queued, `run_after` pushed
+    out) while attempts remain; cancellation and worker shutdown end the run
+    at the next checkpoint.
+    """
+    handler = JOB_HANDLERS[job.kind]
+    job.status = BackgroundJob.STATUS_RUNNING
+    job.attempts += 1
+    job.locked_by = worker or job.locked_by
+    job.heartbeat_at = timezone.now()
+    job.started_at = job.started_at or timezone.now()
+    job.save(update_fields=['status', 'attempts', 'locked_by', 'heartbeat_at', 'started_at', 'updated_at'])
+    heartbeat = _heartbeats[str(job.id)] = _Heartbeat(job)
+    heartbeat.start()
+    try:
+        job.result = handler(job) or {}
+        job.status = BackgroundJob.STATUS_DONE
+        job.error = None
+    except JobLeaseLost:
+        logger.warning('Job %s (%s) was requeued while %s ran it; dropping this run', job.id, job.kind, job.locked_by)
+        return job
+    except JobCancelled:
+        job.status = BackgroundJob.STATUS_CANCELLED
+    except JobInterrupted:
+        # Not the job's fault: give the attempt back and let another worker resume it
+        job.status = BackgroundJob.STATUS_QUEUED
+        job.attempts -= 1
+        job.run_after = timezone.now()
+    except Exception:
+        logger.exception('Job %s (%s) failed, attempt %s of %s', job.id, job.kind, job.attempts, job.max_attempts)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = BackgroundJob.STATUS_QUEUED
+            job.run_after = timezone.now() + _retry_delay(job.attempts)
+        else:
+            job.status = BackgroundJob.STATUS_FAILED
+    finally:
+        heartbeat.stop()
+        del _heartbeats[str(job.id)]
+    if job.status != BackgroundJob.STATUS_QUEUED:
+        job.finished_at = timezone.now()
+    # Fenced like save_checkpoint: a requeued job belongs to whoever claimed it next
+    updated = BackgroundJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        status=job.status, result=job.result, error=job.error, attempts=job.attempts, run_after=job.run_after,
+        locked_by=None, finished_at=job.finished_at, updated_at=timezone.now(),
+    )
+    if not updated:
+        logger.warning('Job %s (%s) was requeued while %s ran it; dropping this run', job.id, job.kind, job.locked_by)
+    job.locked_by = None
+    return job
+
+
+def cancel_job(job: BackgroundJob) -> BackgroundJob:
+    """Cancel a queued job now, or ask a running one to stop at its next checkpoint."""
+    now = timezone.now()
+    BackgroundJob.objects.filter(id=job.id, status=BackgroundJob.STATUS_QUEUED).update(
+        status=BackgroundJob.STATUS_CANCELLED, cancel_requested=True, finished_at=now, updated_at=now,
+    )
+    BackgroundJob.objects.filter(id=job.id, status=BackgroundJob.STATUS_RUNNING).update(
+        cancel_requested=True, updated_at=now,
+    )
+    job.refresh_from_db()
+    return job
+
+
+def requeue(job: BackgroundJob) -> BackgroundJob:
+    """Put a failed, cancelled or interrupted job back on the queue to resume from its checkpoint."""
+    job.status = BackgroundJob.STATUS_QUEUED
+    job.cancel_requested = False
+    job.run_after = timezone.now()
+    job.finished_at = None
+    job.save(update_fields=['status', 'cancel_requested', 'run_after', 'finished_at', 'updated_at'])
+    return job
+
+
+def claim_job(worker: str, kinds: Optional[Iterable[str]] = None) -> Optional[BackgroundJob]:
+    """Mark the oldest due queued job as running for `worker` and return it."""
+    with connection.cursor() as cursor:
+        cursor.execute(CLAIM_JOB_SQL, {'worker': worker, 'kinds': list(kinds) if kinds else None})
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return BackgroundJob.objects.get(id=row[0])
+
+
+def claim(job: BackgroundJob, worker: str) -> bool:
+    """Claim one specific queued job, e.g. to run it from a management command.
+
+    Returns False if a worker got to it first.
+    """
+    claimed = BackgroundJob.objects.filter(id=job.id, status=BackgroundJob.STATUS_QUEUED).update(
+        status=BackgroundJob.STATUS_RUNNING, locked_by=worker, heartbeat_at=timezone.now(),
+    )
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def requeue_stale_jobs() -> int:
+    """Requeue running jobs whose worker stopped sending heartbeats, or fail them when out of attempts."""
+    with connection.cursor() as cursor:
+        cursor.execute(REQUEUE_STALE_SQL, {
+            'stale': getattr(settings, 'JOB_STALE_SECONDS', 600),
+            'retry_base': getattr(settings, 'JOB_RETRY_BASE_SECONDS', 30),
+        })
+        return cursor.rowcount
+
+
+def request_stop() -> None:
+    """Ask this process's worker loop to exit after requeueing its current job."""
+    _stop_requested.set()
+
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def work(kinds: Optional[Iterable[str]] = None, once: bool = False) -> int:
+    """Claim and run jobs until asked to stop; return the number of jobs run.
+
+    With `once` the loop exits as soon as the queue is empty.
+    """
+    worker = worker_name()
+    poll_seconds = getattr(settings, 'JOB_POLL_SECONDS', 1.0)
+    stale_check_seconds = getattr(settings, 'JOB_STALE_SECONDS', 600) / 4
+    last_stale_check = 0.0
+    completed = 0
+    while not _stop_requested.is_set():
+        close_old_connections()
+        if time.monotonic() - last_stale_check >= stale_check_seconds:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                logger.warning('Requeued %s jobs with stale heartbeats', requeued)
+            last_stale_check = time.monotonic()
+
+        job = claim_job(worker, kinds)
+        if job is None:
+            if once:
+                break
+            _stop_requested.wait(poll_seconds)
+            continue
+        if job.kind not in JOB_HANDLERS:
+            job.status = BackgroundJob.STATUS_FAILED
+            job.error = f'No handler registered for {job.kind}'
+            job.locked_by = None
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'error', 'locked_by', 'finished_at', 'updated_at'])
+            continue
+        logger.info('Worker %s running job %s (%s)', worker, job.id, job.kind)
+        run_job(job, worker)
+        completed += 1
+    connection.close()
+    return completed
+
+
+def serialize_job(job: BackgroundJob) -> Dict[str, Any]:
+    return {
+        'id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'processed': job.processed,
+        'total': job.total,
+        'progress': job.progress,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'cancel_requested': job.cancel_requested,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
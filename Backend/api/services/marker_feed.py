@@ -0,0 +1,100 @@
+"""Compact binary marker feed for map rendering.
+
+Layout, little-endian, with every section 4-byte aligned so the client can
+wrap the columns in typed arrays without copying:
+
+    header          5 x uint32: magic b'CMK1', office count N, company count C,
+                    names length L, reserved
+    lat             float32[N]
+    lon             float32[N]
+    company index   uint32[N]   offset into the company columns
+    office ids      16 bytes[N] raw UUIDs
+    company ids     16 bytes[C] raw UUIDs
+    company names   L bytes     UTF-8, one name per line, in company order
+
+Only offices with coordinates are included. Buffers are built from the
+office spatial index and cached per worker until the index or the user's
+world version (which also covers company names) changes.
+"""
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Iterable, Tuple
+
+from django.conf import settings
+
+from data.models import Company
+from .spatial_index import get_office_index
+
+MAGIC = b'CMK1'
+HEADER = struct.Struct('<4sIIII')
+MEDIA_TYPE = 'application/vnd.companymap.markers'
+# Per-worker cache size, in users
+CACHE_ENTRIES = 256
+
+_cache: 'OrderedDict[Any, Tuple[float, bytes]]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def build_marker_feed(company_ids: Iterable[Any]) -> bytes:
+    """Pack the offices of the given companies into a marker feed buffer."""
+    company_ids = set(company_ids)
+    offices = get_office_index().company_offices(company_ids)
+
+    names = dict(Company.objects.filter(id__in=company_ids).values_list('id', 'name'))
+    company_order = {}
+    lats = array('f')
+    lons = array('f')
+    company_index = array('I')
+    office_ids = bytearray()
+    for lat, lon, office_id, company_id in offices:
+        lats.append(lat)
+        lons.append(lon)
+        company_index.append(company_order.setdefault(company_id, len(company_order)))
+        office_ids += office_id.bytes
+
+    company_ids_blob = b''.join(company_id.bytes for company_id in company_order)
+    names_blob = '\n'.join(
+        (names.get(company_id) or '').replace('\n', ' ') for company_id in company_order
+    ).encode('utf-8')
+
+    columns = [lats, lons, company_index]
+    if struct.pack('=I', 1) != struct.pack('<I', 1):
+        for column in columns:
+            column.byteswap()
+    return b''.join([
+        HEADER.pack(MAGIC, len(lats), len(company_order), len(names_blob), 0),
+        *(column.tobytes() for column in columns),
+        bytes(office_ids),
+        company_ids_blob,
+        names_blob,
+    ])
+
+
+def get_marker_feed(user_id: Any, company_ids: Iterable[Any], world_version: str) -> bytes:
+    """Return the user's marker feed, reusing the cached buffer when still valid.
+
+    `world_version` is `conditional.world_version(user)`.
+    """
+    company_ids = frozenset(company_ids)
+    index = get_office_index()
+    key = (user_id, hash(company_ids), index.version, world_version)
+    ttl = getattr(settings, 'MARKER_FEED_CACHE_SECONDS', 60)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and now - entry[0] < ttl:
+            _cache.move_to_end(key)
+            return entry[1]
+
+    feed = build_marker_feed(company_ids)
+    with _cache_lock:
+        # Drop this user's older buffers along with least-recently-used ones
+        for stale in [k for k in _cache if k[0] == user_id]:
+            del _cache[stale]
+        _cache[key] = (now, feed)
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return feed
@@ -0,0 +1,94 @@
+"""Password hashing on a bounded per-worker thread pool.
+
+PBKDF2 takes a few hundred milliseconds of CPU per call. `hashlib`
+releases the GIL while it runs, so a thread pool keeps the calling
+thread's event loop (ASGI) or sibling request threads free during
+logins. At most `PASSWORD_HASH_WORKERS` hashes run at once and at most
+`PASSWORD_HASH_QUEUE` more wait; a request that cannot get a slot within
+`PASSWORD_HASH_WAIT_SECONDS` gets `PasswordHashingBusy` instead of
+adding to the backlog, so a login storm degrades into fast 503s rather
+than unbounded latency for everyone.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when every hashing slot stayed taken for the whole wait."""
+
+
+class PasswordHasherPool:
+    """Thread pool with a bounded number of running and waiting hashes."""
+
+    def __init__(self, workers: Optional[int] = None, queue: Optional[int] = None,
+                 wait_seconds: Optional[float] = None):
+        self.workers = workers or getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+        queue = queue if queue is not None else getattr(settings, 'PASSWORD_HASH_QUEUE', 32)
+        self.wait_seconds = wait_seconds if wait_seconds is not None else getattr(
+            settings, 'PASSWORD_HASH_WAIT_SECONDS', 2.0)
+        self._slots = threading.BoundedSemaphore(self.workers + queue)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads do not survive a fork; each worker process gets its own pool
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            return self._executor
+
+    def submit(self, func: Callable, *args) -> Future:
+        if not self._slots.acquire(timeout=self.wait_seconds):
+            raise PasswordHashingBusy()
+        return self._start(func, *args)
+
+    async def asubmit(self, func: Callable, *args) -> Future:
+        """`submit` that waits for a slot without blocking the event loop."""
+        deadline = time.monotonic() + self.wait_seconds
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise PasswordHashingBusy()
+            await asyncio.sleep(0.005)
+        return self._start(func, *args)
+
+    def _start(self, func: Callable, *args) -> Future:
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _future: self._slots.release())
+        return future
+
+
+_pool = PasswordHasherPool()
+
+
+def get_hasher_pool() -> PasswordHasherPool:
+    """Return this worker's password hashing pool."""
+    return _pool
+
+
+def hash_password(password: str) -> str:
+    return _pool.submit(make_password, password).result()
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    return _pool.submit(check_password, password, encoded).result()
+
+
+async def ahash_password(password: str) -> str:
+    return await asyncio.wrap_future(await _pool.asubmit(make_password, password))
+
+
+async def averify_password(password: str, encoded: str) -> bool:
+    return await asyncio.wrap_future(await _pool.asubmit(check_password, password, encoded))
@@ -0,0 +1,150 @@
+"""Incrementally maintained read model for the map payload.
+
+Each company's serialized JSON is kept in `company_fragment` together with
+the version of the rows it was built from (the company, its offices, people
+and tags). A user's payload is the concatenation of their companies'
+fragments, stored in `user_world_snapshot` under the world version from
+`api.services.conditional.world_version`.
+
+Both versions are counters bumped by database triggers on the source
+tables, so they move in the transaction that commits the change. When a
+request arrives with a world version the snapshot was not built for, only
+fragments whose source version moved are rebuilt and the snapshot is
+re-assembled from fragments. Versions are read before the rows they cover,
+so a write racing a rebuild at worst stores newer data under an older
+version, which the next bump rebuilds again.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection
+
+from data.models import Company, CompanyFragment, UserWorldSnapshot
+from .company_payload import get_user_company_ids, serialize_companies, serialize_company_rows
+
+# Companies serialized per batch when rebuilding fragments
+FRAGMENT_BATCH_SIZE = 1000
+
+# Current source version of each company next to the version its fragment
+# was built from. The counter is bumped by triggers in the same transaction
+# as every change to the company, its offices, people and tags
+# (init-scripts/init-db.sql); a company never changed since is at 0.
+FRAGMENT_VERSION_SQL = """
+SELECT m.id, f.version, coalesce(v.version, 0)::text
+FROM (SELECT DISTINCT unnest(%(ids)s::uuid[]) AS id) m
+LEFT JOIN company_version v ON v.company_id = m.id
+LEFT JOIN company_fragment f ON f.company_id = m.id
+"""
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+
+def _source_versions(company_ids: List[Any]) -> Dict[str, Tuple[Optional[str], str]]:
+    """Map company id (as text) to `(fragment_version, current_version)`."""
+    with connection.cursor() as cursor:
+        cursor.execute(FRAGMENT_VERSION_SQL, {'ids': [str(company_id) for company_id in company_ids]})
+        return {str(company_id): (built, current) for company_id, built, current in cursor.fetchall()}
+
+
+def refresh_fragments(company_ids: Iterable[Any], force: bool = False) -> int:
+    """Rebuild fragments that are missing or older than their source rows.
+
+    Returns the number of fragments rebuilt. With `force` every given
+    company is rebuilt regardless of its version.
+    """
+    company_ids = list(company_ids)
+    if not company_ids:
+        return 0
+    versions = _source_versions(company_ids)
+    stale = [company_id for company_id, (built, current) in versions.items() if force or built != current]
+
+    for start in range(0, len(stale), FRAGMENT_BATCH_SIZE):
+        batch = stale[start:start + FRAGMENT_BATCH_SIZE]
+        companies = list(Company.objects.filter(id__in=batch).values('id', 'name'))
+        fragments = [
+            CompanyFragment(
+                company_id=company['id'],
+                name=company['name'],
+                payload=_dumps(payload),
+                version=versions[str(company['id'])][1],
+            )
+            for company, payload in zip(companies, serialize_company_rows(companies))
+        ]
+        CompanyFragment.objects.bulk_create(
+            fragments,
+            update_conflicts=True,
+            unique_fields=['company'],
+            update_fields=['name', 'payload', 'version', 'updated_at'],
+        )
+    return len(stale)
+
+
+def rebuild_world_snapshot(user, version: str, refresh: bool = True) -> str:
+    """Re-assemble and store the user's payload; return it as JSON text.
+
+    `refresh=False` skips the fragment version check, for callers that have
+    just refreshed every fragment.
+    """
+    company_ids = list(get_user_company_ids(user))
+    if refresh:
+        refresh_fragments(company_ids)
+    fragments = (
+        CompanyFragment.objects.filter(company_id__in=company_ids)
+        .order_by('name', 'company_id')
+        .values_list('payload', flat=True)
+    )
+    payload = '[' + ','.join(fragments) + ']'
+    UserWorldSnapshot.objects.bulk_create(
+        [UserWorldSnapshot(user=user, payload=payload, world_version=version)],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['payload', 'world_version', 'updated_at'],
+    )
+    return payload
+
+
+def get_world_payload(user, version: str) -> str:
+    """Return the user's map payload as JSON text for the given world version."""
+    payload = (
+        UserWorldSnapshot.objects.filter(user=user, world_version=version)
+        .values_list('payload', flat=True)
+        .first()
+    )
+    if payload is not None:
+        return payload
+    return rebuild_world_snapshot(user, version)
+
+
+def _comparable(company: Dict[str, Any]) -> str:
+    """A company payload with its id lists sorted, so list order is not a difference."""
+    return _dumps({**company, 'people': sorted(company['people']), 'tags': sorted(company['tags'])})
+
+
+def check_world_snapshot(user) -> List[str]:
+    """Compare the stored snapshot with the live join; return the differences.
+
+    People and tag ids are compared as sets; fragments built before their
+    order was fixed are still correct.
+    """
+    stored = UserWorldSnapshot.objects.filter(user=user).values_list('payload', flat=True).first()
+    if stored is None:
+        return ['snapshot missing']
+
+    live = serialize_companies(get_user_company_ids(user))
+    snapshot = json.loads(stored)
+    live_by_id = {company['id']: company for company in live}
+    snapshot_by_id = {company['id']: company for company in snapshot}
+
+    problems = []
+    for company_id in live_by_id.keys() - snapshot_by_id.keys():
+        problems.append(f'company {company_id} missing from snapshot')
+    for company_id in snapshot_by_id.keys() - live_by_id.keys():
+        problems.append(f'company {company_id} no longer in world')
+    for company_id in live_by_id.keys() & snapshot_by_id.keys():
+        if _comparable(live_by_id[company_id]) != _comparable(snapshot_by_id[company_id]):
+            problems.append(f'company {company_id} differs from live data')
+    if not problems and [c['id'] for c in live] != [c['id'] for c in snapshot]:
+        problems.append('companies out of order')
+    return problems
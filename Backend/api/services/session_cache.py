@@ -0,0 +1,97 @@
+"""Per-worker cache of bearer-token sessions.
+
+Every authenticated request resolves its token to a user. A resolved
+session is kept here, keyed by token hash, for `AUTH_TOKEN_CACHE_SECONDS`
+(never past the session's own expiry), so repeated requests with the same
+token skip the database. A miss is one indexed query that loads the
+session with its user, user data and person.
+
+Logout revokes the token in the worker that served it immediately; other
+workers stop accepting it once their entry's TTL runs out, so a logged out
+token stays usable for at most `AUTH_TOKEN_CACHE_SECONDS` elsewhere.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from data.models import AuthUser, UserSession
+
+# user, session expiry, monotonic time the entry stops being trusted
+Entry = Tuple[AuthUser, datetime, float]
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionTokenCache:
+    """Bounded LRU of token hash -> (user, session expiry) with a TTL."""
+
+    def __init__(self, ttl: Optional[float] = None, max_size: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'AUTH_TOKEN_CACHE_SECONDS', 30)
+        self.max_size = max_size or getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000)
+        self._entries: 'OrderedDict[str, Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _aware(value: datetime) -> datetime:
+        if timezone.is_naive(value):
+            return timezone.make_aware(value, timezone.get_current_timezone())
+        return value
+
+    def get_user(self, token_hash: str) -> Optional[AuthUser]:
+        """The user of an unexpired session with this token hash, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(token_hash)
+                self.hits += 1
+                # Callers get their own copy; the cached instance is shared between threads
+                return copy.copy(entry[0])
+            self.misses += 1
+
+        session = (
+            UserSession.objects.select_related('user__user_data__person')
+            .filter(token_hash=token_hash).first()
+        )
+        if session is None or session.is_expired:
+            self.revoke(token_hash)
+            return None
+        expires_at = self._aware(session.expires_at)
+        trusted_for = min(self.ttl, (expires_at - timezone.now()).total_seconds())
+        with self._lock:
+            self._entries[token_hash] = (session.user, expires_at, now + trusted_for)
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return copy.copy(session.user)
+
+    def revoke(self, token_hash: str) -> None:
+        """Forget a token in this worker, e.g. after its session was deleted."""
+        with self._lock:
+            self._entries.pop(token_hash, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_session_cache = SessionTokenCache()
+
+
+def get_session_cache() -> SessionTokenCache:
+    """Return this worker's session token cache."""
+    return _session_cache
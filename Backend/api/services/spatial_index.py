@@ -0,0 +1,366 @@
+"""Per-worker spatial index over Office coordinates.
+
+Offices are bucketed into a fixed lat/lon grid. Coordinates live in flat
+`array` columns instead of a Python object per row. Counting the office
+and company UUIDs it keeps alive, the index costs roughly 300-350 bytes
+per office at four offices per company, and up to ~480 bytes when every
+office belongs to a different company (`manage.py bench_spatial_index`);
+size workers for that. The first request in a worker builds the index;
+after that it is kept fresh by re-reading offices whose `updated_at` is
+within `WATERMARK_OVERLAP` of the newest `updated_at` already loaded, and
+a periodic full rebuild in a background thread picks up deleted offices.
+Rebuilds load into a new index and swap it in, so queries keep being
+answered from the old one meanwhile (at the cost of holding both for the
+duration of the build).
+
+The watermark is taken from the rows themselves rather than the local
+clock. `updated_at` is set when a row is saved, which can be a while
+before its transaction commits; the overlap re-reads that window so such
+rows are not skipped. Re-reading is idempotent and unchanged rows do not
+bump `version`.
+"""
+import math
+import threading
+import time
+from array import array
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from data.models import Office
+from .geo import KM_PER_DEGREE, bounding_box, haversine_km
+
+# Grid cell size in degrees; 1° is ~111 km, close to the typical search radius
+CELL_DEGREES = 1.0
+LON_CELLS = int(360 / CELL_DEGREES)
+# Half of Earth's circumference: no two points are further apart than this
+MAX_DISTANCE_KM = math.pi * 6371.0
+# Longest a transaction may take between saving an office and committing
+# and still be picked up by the next refresh
+WATERMARK_OVERLAP = timedelta(seconds=60)
+
+OfficeRow = Tuple[Any, Any, float, float]
+Match = Tuple[float, Any, Any]
+
+
+def _cell_key(lat: float, lon: float) -> int:
+    lat_cell = min(int((lat + 90.0) // CELL_DEGREES), int(180 / CELL_DEGREES) - 1)
+    lon_cell = min(int((lon + 180.0) // CELL_DEGREES), LON_CELLS - 1)
+    return lat_cell * LON_CELLS + lon_cell
+
+
+class OfficeSpatialIndex:
+    """Grid index answering within-radius and k-nearest office queries."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held while a build or refresh reads the database; never by queries
+        self._update_lock = threading.Lock()
+        self._rebuilding = False
+        self.version = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._office_ids: List[Any] = []
+        self._office_row: Dict[Any, int] = {}
+        self._companies: List[Any] = []
+        self._company_row: Dict[Any, int] = {}
+        self._lat = array('d')
+        self._lon = array('d')
+        self._company = array('l')
+        self._cells: Dict[int, array] = {}
+        self._company_offices: Dict[int, array] = {}
+        # Newest office updated_at loaded so far
+        self._watermark = None
+        self._built_at = 0.0
+        self._refreshed_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._office_row)
+
+    # Loading
+
+    def load(self, rows: Iterable[OfficeRow]) -> None:
+        """Insert or move offices given `(office_id, company_id, lat, lon)` rows.
+
+        A row with a missing coordinate removes the office from the index.
+        """
+        with self._lock:
+            changed = False
+            for office_id, company_id, lat, lon in rows:
+                row = self._office_row.get(office_id)
+                if lat is None or lon is None:
+                    if row is not None:
+                        self._remove_from_cell(row)
+                        self._remove_from_company(row)
+                        del self._office_row[office_id]
+                        changed = True
+                    continue
+
+                lat = float(lat)
+                lon = float(lon)
+                company = self._company_row.get(company_id)
+                if company is None:
+                    company = self._company_row[company_id] = len(self._companies)
+                    self._companies.append(company_id)
+
+                if row is not None and (self._lat[row], self._lon[row], self._company[row]) == (lat, lon, company):
+                    continue
+                changed = True
+                if row is None:
+                    row = len(self._office_ids)
+                    self._office_ids.append(office_id)
+                    self._office_row[office_id] = row
+                    self._lat.append(lat)
+                    self._lon.append(lon)
+                    self._company.append(company)
+                else:
+                    self._remove_from_cell(row)
+                    self._remove_from_company(row)
+                    self._lat[row] = lat
+                    self._lon[row] = lon
+                    self._company[row] = company
+                self._cells.setdefault(_cell_key(lat, lon), array('l')).append(row)
+                self._company_offices.setdefault(company, array('l')).append(row)
+            if changed:
+                self.version += 1
+
+    def _remove_from_cell(self, row: int) -> None:
+        cell = self._cells.get(_cell_key(self._lat[row], self._lon[row]))
+        if cell is not None:
+            try:
+                cell.remove(row)
+            except ValueError:
+                pass
+
+    def _remove_from_company(self, row: int) -> None:
+        rows = self._company_offices.get(self._company[row])
+        if rows is not None:
+            try:
+                rows.remove(row)
+            except ValueError:
+                pass
+
+    def _read(self, queryset) -> Iterable[OfficeRow]:
+        """Yield office rows, tracking the newest `updated_at` in `self._watermark`."""
+        for office_id, company_id, lat, lon, updated_at in queryset.values_list(
+            'id', 'company_id', 'latitude', 'longitude', 'updated_at'
+        ).iterator(chunk_size=20000):
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+            yield office_id, company_id, lat, lon
+
+    def build(self) -> None:
+        """Rebuild the whole index from the Office table.
+
+        Loads into a new index and swaps it in, so concurrent queries see
+        either the old or the new index, never a partial one.
+        """
+        fresh = OfficeSpatialIndex()
+        fresh.load(fresh._read(Office.objects.exclude(latitude=None).exclude(longitude=None).order_by()))
+        fresh._built_at = fresh._refreshed_at = time.monotonic()
+        with self._lock:
+            state = {key: value for key, value in vars(fresh).items()
+                     if key not in ('_lock', '_update_lock', '_rebuilding', 'version')}
+            vars(self).update(state)
+            self.version += 1
+
+    def refresh(self) -> int:
+        """Apply offices changed since the last build or refresh.
+
+        Returns the number of rows re-read. Rows inside the overlap window
+        are re-read every time, which is harmless because loading is
+        idempotent.
+        """
+        offices = Office.objects.order_by()
+        if self._watermark is not None:
+            offices = offices.filter(updated_at__gte=self._watermark - WATERMARK_OVERLAP)
+        changed = list(self._read(offices))
+        self.load(changed)
+        self._refreshed_at = time.monotonic()
+        return len(changed)
+
+    def _rebuild(self) -> None:
+        try:
+            self.build()
+        finally:
+            self._rebuilding = False
+            self._update_lock.release()
+            # Do not keep this thread's connection open
+            connection.close()
+
+    def ensure_fresh(self) -> None:
+        """Build on first use, then refresh or rebuild based on settings.
+
+        Only the very first build makes the request wait. Refreshes run on
+        whichever request finds the index stale while no other update is
+        running; periodic rebuilds run in a background thread.
+        """
+        if not self._built_at:
+            with self._update_lock:
+                if not self._built_at:
+                    self.build()
+            return
+        now = time.monotonic()
+        rebuild_after = getattr(settings, 'SPATIAL_INDEX_REBUILD_SECONDS', 3600)
+        refresh_after = getattr(settings, 'SPATIAL_INDEX_REFRESH_SECONDS', 5)
+        if now - self._built_at >= rebuild_after:
+            if not self._rebuilding and self._update_lock.acquire(blocking=False):
+                self._rebuilding = True
+                try:
+                    threading.Thread(target=self._rebuild, name='office-index-rebuild', daemon=True).start()
+                except BaseException:
+                    self._rebuilding = False
+                    self._update_lock.release()
+                    raise
+        elif now - self._refreshed_at >= refresh_after:
+            if self._update_lock.acquire(blocking=False):
+                try:
+                    self.refresh()
+                finally:
+                    self._update_lock.release()
+
+    # Queries
+
+    def _company_filter(self, company_ids: Optional[Iterable[Any]]) -> Optional[Set[int]]:
+        if company_ids is None:
+            return None
+        return {self._company_row[c] for c in company_ids if c in self._company_row}
+
+    def _rows_in_box(self, lat: float, lon: float, radius_km: float) -> Iterable[int]:
+        min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+        lat_cells = range(
+            int((min_lat + 90.0) // CELL_DEGREES),
+            min(int((max_lat + 90.0) // CELL_DEGREES), int(180 / CELL_DEGREES) - 1) + 1,
+        )
+        for min_lon, max_lon in lon_ranges:
+            lon_cells = range(
+                int((min_lon + 180.0) // CELL_DEGREES),
+                min(int((max_lon + 180.0) // CELL_DEGREES), LON_CELLS - 1) + 1,
+            )
+            for lat_cell in lat_cells:
+                for lon_cell in lon_cells:
+                    cell = self._cells.get(lat_cell * LON_CELLS + lon_cell)
+                    if cell:
+                        yield from cell
+
+    def within_radius(self, lat: float, lon: float, radius_km: float,
+                      company_ids: Optional[Iterable[Any]] = None) -> List[Match]:
+        """Return `(distance_km, office_id, company_id)` within the radius, closest first.
+
+        When `company_ids` is given only offices of those companies are returned.
+        """
+        with self._lock:
+            allowed = self._company_filter(company_ids)
+            if allowed is not None and not allowed:
+                return []
+            lats, lons, companies = self._lat, self._lon, self._company
+            matches = []
+            for row in self._rows_in_box(lat, lon, radius_km):
+                company = companies[row]
+                if allowed is not None and company not in allowed:
+                    continue
+                distance = haversine_km(lat, lon, lats[row], lons[row])
+                if distance <= radius_km:
+                    matches.append((distance, self._office_ids[row], self._companies[company]))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def within_bbox(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float,
+                    company_ids: Optional[Iterable[Any]] = None) -> List[Tuple[float, float, Any, Any]]:
+        """Return `(lat, lon, office_id, company_id)` for offices inside the box.
+
+        Bounds are inclusive at the minimum and exclusive at the maximum, so
+        adjacent boxes never return the same office twice. When the company
+        filter is narrower than the grid cells covering the box, the
+        companies' own offices are scanned instead of the cells.
+        """
+        with self._lock:
+            allowed = self._company_filter(company_ids)
+            lats, lons = self._lat, self._lon
+
+            lat_cells = range(
+                max(int((min_lat + 90.0) // CELL_DEGREES), 0),
+                min(int((max_lat + 90.0) // CELL_DEGREES), int(180 / CELL_DEGREES) - 1) + 1,
+            )
+            lon_cells = range(
+                max(int((min_lon + 180.0) // CELL_DEGREES), 0),
+                min(int((max_lon + 180.0) // CELL_DEGREES), LON_CELLS - 1) + 1,
+            )
+            if allowed is not None and (
+                sum(len(self._company_offices.get(company, ())) for company in allowed)
+                < len(lat_cells) * len(lon_cells) * len(self._office_row) / max(len(self._cells), 1)
+            ):
+                candidates = (row for company in allowed for row in self._company_offices.get(company, ()))
+                allowed = None
+            else:
+                candidates = (
+                    row
+                    for lat_cell in lat_cells
+                    for lon_cell in lon_cells
+                    for row in self._cells.get(lat_cell * LON_CELLS + lon_cell, ())
+                )
+
+            matches = []
+            for row in candidates:
+                lat, lon = lats[row], lons[row]
+                if not (min_lat <= lat < max_lat and min_lon <= lon < max_lon):
+                    continue
+                company = self._company[row]
+                if allowed is not None and company not in allowed:
+                    continue
+                matches.append((lat, lon, self._office_ids[row], self._companies[company]))
+            return matches
+
+    def company_offices(self, company_ids: Iterable[Any]) -> List[Tuple[float, float, Any, Any]]:
+        """Return `(lat, lon, office_id, company_id)` for every indexed office of the companies."""
+        with self._lock:
+            lats, lons = self._lat, self._lon
+            return [
+                (lats[row], lons[row], self._office_ids[row], self._companies[company])
+                for company in self._company_filter(company_ids)
+                for row in self._company_offices.get(company, ())
+            ]
+
+    def nearest(self, lat: float, lon: float, k: int,
+                company_ids: Optional[Iterable[Any]] = None) -> List[Match]:
+        """Return the `k` offices closest to the point, closest first.
+
+        Searches a growing radius until `k` offices are inside it; anything
+        outside the searched radius is necessarily further away.
+        """
+        radius_km = CELL_DEGREES * KM_PER_DEGREE
+        while True:
+            matches = self.within_radius(lat, lon, radius_km, company_ids)
+            if len(matches) >= k or radius_km >= MAX_DISTANCE_KM:
+                return matches[:k]
+            radius_km = min(radius_km * 2, MAX_DISTANCE_KM)
+
+    def fingerprint(self) -> str:
+        """Identify the loaded offices the same way in every worker.
+
+        Changes when a refresh loads newer rows or a rebuild drops deleted
+        ones; for ETags of responses answered from the index.
+        """
+        with self._lock:
+            return f'{self._watermark}:{len(self._office_row)}'
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'offices': len(self._office_row),
+                'companies': len(self._companies),
+                'cells': len(self._cells),
+                'watermark': self._watermark,
+            }
+
+
+_office_index = OfficeSpatialIndex()
+
+
+def get_office_index() -> OfficeSpatialIndex:
+    """Return this worker's shared office index, refreshed if it is stale."""
+    _office_index.ensure_fresh()
+    return _office_index
@@ -0,0 +1,257 @@
+"""Per-worker bitmap index of taxonomy tags over companies.
+
+Every company that has a tag gets a dense bit position; each taxonomy is a
+bitset (a Python int) of its companies. AND/OR over many tags, and with a
+user's world or a radius result, are then plain integer bit operations.
+
+Like the office spatial index it is built on first use and refreshed from
+a watermark taken from the rows themselves, re-reading a
+`WATERMARK_OVERLAP` window for transactions that committed late. Deleted
+relationships are copied into `taxonomy_relationship_deletion` by a
+trigger (init-scripts/init-db.sql), and refreshes clear their bits unless
+the pair exists again, so a removed tag disappears within one refresh
+instead of at the next rebuild.
+Periodic rebuilds run in a background thread and swap the new bitsets in.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from django.conf import settings
+from django.db import connection
+
+from data.models import TaxonomyRelationship
+from .spatial_index import WATERMARK_OVERLAP
+
+MODES = ('any', 'all')
+# Deletion log entries older than this are dropped on rebuild; every worker
+# rebuilds far more often
+DELETION_LOG_RETENTION_SQL = "DELETE FROM taxonomy_relationship_deletion WHERE deleted_at < %(before)s - interval '1 day'"
+LAST_DELETION_SQL = "SELECT max(deleted_at) FROM taxonomy_relationship_deletion"
+# `present` marks pairs that exist again: re-inserted after the deletion, or
+# duplicated. Read against the table rather than the relationship watermark,
+# which moves independently of the deletion watermark.
+DELETIONS_SQL = """
+SELECT d.company_id, d.taxonomy_id, d.deleted_at, EXISTS (
+    SELECT 1 FROM taxonomy_relationship t
+    WHERE t.company_id = d.company_id AND t.taxonomy_id = d.taxonomy_id
+) AS present
+FROM taxonomy_relationship_deletion d
+WHERE d.deleted_at >= %(since)s
+"""
+
+
+def _bitset(positions: Iterable[int], size: int) -> int:
+    """Build a bitset from bit positions without quadratic int re-allocation."""
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _positions(bitset: int) -> Iterable[int]:
+    """Yield the positions of the set bits, lowest first."""
+    data = bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield (byte_index << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+class TagIndex:
+    """Taxonomy bitsets over a dense company index."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held while a build or refresh reads the database; never by queries
+        self._update_lock = threading.Lock()
+        self._rebuilding = False
+        # Bumped whenever the bitsets change
+        self.version = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._companies: List[Any] = []
+        self._company_bit: Dict[Any, int] = {}
+        self._tags: Dict[Any, int] = {}
+        # Newest relationship updated_at and deletion log deleted_at loaded so far
+        self._watermark = None
+        self._deleted_watermark = None
+        self._built_at = 0.0
+        self._refreshed_at = 0.0
+
+    def _bit(self, company_id: Any) -> int:
+        bit = self._company_bit.get(company_id)
+        if bit is None:
+            bit = self._company_bit[company_id] = len(self._companies)
+            self._companies.append(company_id)
+        return bit
+
+    def load(self, relationships: Iterable[tuple], deleted: Iterable[tuple] = ()) -> None:
+        """Add `(company_id, taxonomy_id)` pairs and clear `deleted` ones.
+
+        A pair in both is kept: `relationships` is read after the deletion
+        log, so it reflects a later state.
+        """
+        with self._lock:
+            positions: Dict[Any, List[int]] = {}
+            pairs = set()
+            for company_id, taxonomy_id in relationships:
+                pairs.add((company_id, taxonomy_id))
+                positions.setdefault(taxonomy_id, []).append(self._bit(company_id))
+            size = len(self._companies)
+            changed = False
+            for taxonomy_id, bits in positions.items():
+                old = self._tags.get(taxonomy_id, 0)
+                new = self._tags[taxonomy_id] = old | _bitset(bits, size)
+                changed = changed or new != old
+            for company_id, taxonomy_id in deleted:
+                bit = self._company_bit.get(company_id)
+                old = self._tags.get(taxonomy_id, 0)
+                if (company_id, taxonomy_id) in pairs or bit is None or not old >> bit & 1:
+                    continue
+                self._tags[taxonomy_id] = old & ~(1 << bit)
+                changed = True
+            if changed:
+                self.version += 1
+
+    def _read(self, queryset) -> Iterable[tuple]:
+        """Yield relationship pairs, tracking the newest `updated_at` in `self._watermark`."""
+        for company_id, taxonomy_id, updated_at in queryset.values_list(
+            'company_id', 'taxonomy_id', 'updated_at'
+        ).iterator(chunk_size=20000):
+            if self._watermark is None or updated_at > self._watermark:
+                self._watermark = updated_at
+            yield company_id, taxonomy_id
+
+    def build(self) -> None:
+        """Rebuild the whole index from TaxonomyRelationship and swap it in."""
+        fresh = TagIndex()
+        with connection.cursor() as cursor:
+            # Deletions up to here are already reflected in the table scan below
+            cursor.execute(LAST_DELETION_SQL)
+            fresh._deleted_watermark = cursor.fetchone()[0]
+            if fresh._deleted_watermark is not None:
+                cursor.execute(DELETION_LOG_RETENTION_SQL, {'before': fresh._deleted_watermark})
+        fresh.load(fresh._read(TaxonomyRelationship.objects.order_by()))
+        fresh._built_at = fresh._refreshed_at = time.monotonic()
+        with self._lock:
+            state = {key: value for key, value in vars(fresh).items()
+                     if key not in ('_lock', '_update_lock', '_rebuilding', 'version')}
+            vars(self).update(state)
+            self.version += 1
+
+    def refresh(self) -> None:
+        """Apply relationships created, updated or deleted since the last build or refresh."""
+        deleted, present = [], []
+        since = self._deleted_watermark - WATERMARK_OVERLAP if self._deleted_watermark is not None else '-infinity'
+        with connection.cursor() as cursor:
+            cursor.execute(DELETIONS_SQL, {'since': since})
+            for company_id, taxonomy_id, deleted_at, exists in cursor.fetchall():
+                (present if exists else deleted).append((company_id, taxonomy_id))
+                if self._deleted_watermark is None or deleted_at > self._deleted_watermark:
+                    self._deleted_watermark = deleted_at
+        relationships = TaxonomyRelationship.objects.order_by()
+        if self._watermark is not None:
+            relationships = relationships.filter(updated_at__gte=self._watermark - WATERMARK_OVERLAP)
+        self.load(list(self._read(relationships)) + present, deleted)
+        self._refreshed_at = time.monotonic()
+
+    def _rebuild(self) -> None:
+        try:
+            self.build()
+        finally:
+            self._rebuilding = False
+            self._update_lock.release()
+            # Do not keep this thread's connection open
+            connection.close()
+
+    def ensure_fresh(self) -> None:
+        """Build on first use, then refresh or rebuild based on settings.
+
+        Only the very first build makes the request wait; periodic
+        rebuilds run in a background thread.
+        """
+        if not self._built_at:
+            with self._update_lock:
+                if not self._built_at:
+                    self.build()
+            return
+        now = time.monotonic()
+        rebuild_after = getattr(settings, 'TAG_INDEX_REBUILD_SECONDS', 600)
+        refresh_after = getattr(settings, 'TAG_INDEX_REFRESH_SECONDS', 5)
+        if now - self._built_at >= rebuild_after:
+            if not self._rebuilding and self._update_lock.acquire(blocking=False):
+                self._rebuilding = True
+                try:
+                    threading.Thread(target=self._rebuild, name='tag-index-rebuild', daemon=True).start()
+                except BaseException:
+                    self._rebuilding = False
+                    self._update_lock.release()
+                    raise
+        elif now - self._refreshed_at >= refresh_after:
+            if self._update_lock.acquire(blocking=False):
+                try:
+                    self.refresh()
+                finally:
+                    self._update_lock.release()
+
+    def fingerprint(self) -> str:
+        """Identify the loaded relationships the same way in every worker; for ETags."""
+        with self._lock:
+            return f'{self._watermark}:{self._deleted_watermark}'
+
+    # Queries
+
+    def bitset_for(self, company_ids: Iterable[Any]) -> int:
+        """Bitset of the given companies; companies without tags are left out."""
+        with self._lock:
+            bits = [self._company_bit[c] for c in company_ids if c in self._company_bit]
+            return _bitset(bits, len(self._companies))
+
+    def match(self, tag_ids: Iterable[Any], mode: str = 'any') -> int:
+        """Bitset of companies having any (OR) or all (AND) of the tags."""
+        with self._lock:
+            bitsets = [self._tags.get(tag_id, 0) for tag_id in tag_ids]
+        if not bitsets:
+            return 0
+        result = bitsets[0]
+        for bitset in bitsets[1:]:
+            result = result & bitset if mode == 'all' else result | bitset
+        return result
+
+    def company_ids(self, bitset: int) -> List[Any]:
+        """Company IDs for the set bits of a bitset."""
+        with self._lock:
+            companies = self._companies
+            return [companies[position] for position in _positions(bitset)]
+
+    def filter(self, company_ids: Iterable[Any], tag_ids: Iterable[Any], mode: str = 'any') -> Set[Any]:
+        """Restrict `company_ids` to companies matching the tag query."""
+        return set(self.company_ids(self.match(tag_ids, mode) & self.bitset_for(company_ids)))
+
+
+_tag_index = TagIndex()
+
+
+def get_tag_index() -> TagIndex:
+    """Return this worker's shared tag index, refreshed if it is stale."""
+    _tag_index.ensure_fresh()
+    return _tag_index
+
+
+def parse_tag_query(query_params) -> Optional[tuple]:
+    """Parse `?tags=a,b&mode=any|all` into `(tag_ids, mode)`.
+
+    Returns None when no tag filter was requested and raises ValueError for
+    malformed input.
+    """
+    raw = query_params.get('tags')
+    if not raw:
+        return None
+    mode = query_params.get('mode', 'any')
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    return [UUID(tag.strip()) for tag in raw.split(',') if tag.strip()], mode
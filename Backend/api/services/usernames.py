@@ -0,0 +1,119 @@
+"""Unique username allocation.
+
+A wanted username that is taken gets the next free numeric suffix
+(`john`, `john_1`, `john_2`, ...). Instead of probing one candidate per
+query, one query reads whether the base is taken and the highest
+existing `base_<n>` suffix. Every `base_...` name sorts bytewise between
+`base_` and `base` followed by a backtick, so that is one range scan of
+the `text_pattern_ops` index. The scan still reads every `base_...` name,
+including ones like `john_smith` for the base `john`, so its cost grows
+with the number of such names, but in one round trip instead of one per
+taken candidate. Another signup can take the same name between that query
+and the insert; inserts are retried with a fresh allocation on a unique
+violation of the username.
+
+`allocate_usernames` and `bulk_create_users` do the same for a whole
+batch of accounts with one query for all distinct bases.
+"""
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from django.db import IntegrityError, connection, transaction
+
+from data.models import AuthUser
+
+# custom_auth_user.username is VARCHAR(150); keep room for a suffix
+MAX_BASE_LENGTH = 130
+MAX_ATTEMPTS = 5
+USERNAME_CONSTRAINT = 'custom_auth_user_username_key'
+
+TAKEN_SUFFIXES_SQL = """
+SELECT
+    b.base,
+    EXISTS (SELECT 1 FROM custom_auth_user u WHERE u.username = b.base),
+    (SELECT COALESCE(max(CASE WHEN substr(u.username, length(b.base) + 2) ~ '^[0-9]{1,18}$'
+                              THEN substr(u.username, length(b.base) + 2)::bigint END), 0)
+     FROM custom_auth_user u
+     -- Pattern operators compare bytewise and can use the text_pattern_ops index
+     WHERE u.username ~>=~ (b.base || '_') AND u.username ~<~ (b.base || '`'))
+FROM unnest(%(bases)s::text[]) AS b(base)
+"""
+
+T = TypeVar('T')
+
+
+def username_base(value: Optional[str], fallback: str = 'user') -> str:
+    """A usable base from an email prefix or provider name."""
+    base = (value or '').strip()[:MAX_BASE_LENGTH]
+    return base or fallback
+
+
+def _taken(bases: Sequence[str]) -> Dict[str, Tuple[bool, int]]:
+    """base -> (base itself taken, highest existing numeric suffix)."""
+    with connection.cursor() as cursor:
+        cursor.execute(TAKEN_SUFFIXES_SQL, {'bases': list(bases)})
+        return {base: (taken, max_suffix) for base, taken, max_suffix in cursor.fetchall()}
+
+
+def allocate_usernames(bases: Sequence[str]) -> List[str]:
+    """A distinct free username for each wanted base, in order, with one query."""
+    bases = [username_base(base) for base in bases]
+    taken = _taken(list(Counter(bases)))
+    next_suffix = {base: max_suffix + 1 for base, (_taken_base, max_suffix) in taken.items()}
+    assigned = set()
+    usernames = []
+    for base in bases:
+        if not taken[base][0] and base not in assigned:
+            username = base
+        else:
+            # Skip names given to an earlier base of this batch (e.g. a literal "john_1")
+            while f'{base}_{next_suffix[base]}' in assigned:
+                next_suffix[base] += 1
+            username = f'{base}_{next_suffix[base]}'
+            next_suffix[base] += 1
+        assigned.add(username)
+        usernames.append(username)
+    return usernames
+
+
+def allocate_username(base: Optional[str]) -> str:
+    return allocate_usernames([base])[0]
+
+
+def _is_username_conflict(error: IntegrityError) -> bool:
+    return USERNAME_CONSTRAINT in str(error)
+
+
+def create_with_unique_username(base: Optional[str], create: Callable[[str], T]) -> T:
+    """Call `create(username)` with a free username, reallocating if it was taken meanwhile."""
+    for attempt in range(MAX_ATTEMPTS):
+        username = allocate_username(base)
+        try:
+            with transaction.atomic():
+                return create(username)
+        except IntegrityError as e:
+            if not _is_username_conflict(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+
+
+def bulk_create_users(users: List[AuthUser], batch_size: int = 1000) -> List[AuthUser]:
+    """`bulk_create` accounts whose `username` holds the wanted base.
+
+    Each batch gets its usernames from one allocation query and is
+    inserted in one statement; a batch that hits a username taken by a
+    concurrent signup is reallocated and retried.
+    """
+    bases = [user.username for user in users]
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        for attempt in range(MAX_ATTEMPTS):
+            for user, username in zip(batch, allocate_usernames(bases[start:start + batch_size])):
+                user.username = username
+            try:
+                with transaction.atomic():
+                    AuthUser.objects.bulk_create(batch)
+                break
+            except IntegrityError as e:
+                if not _is_username_conflict(e) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+    return users
@@ -0,0 +1,148 @@
+"""Per-worker buffer for authentication bookkeeping writes.
+
+Requests only record what happened in memory: a session was used, a user
+logged in. A background thread writes the accumulated state every
+`AUTH_WRITE_FLUSH_SECONDS`, or sooner once `AUTH_WRITE_BUFFER_SIZE`
+entries are pending, as one set-based UPDATE per table: the latest use
+time per session, the latest login per user and the summed login count
+per user data row, added to the stored count in SQL.
+
+A worker that dies loses at most one flush interval (and at most
+`AUTH_WRITE_BUFFER_SIZE` entries) of this bookkeeping; sessions and
+logins themselves are never buffered.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TOUCH_SESSIONS_SQL = """
+UPDATE user_session s
+SET last_used_at = GREATEST(s.last_used_at, v.used_at)
+FROM unnest(%(hashes)s::text[], %(times)s::timestamp[]) AS v(token_hash, used_at)
+WHERE s.token_hash = v.token_hash
+"""
+
+LAST_LOGIN_SQL = """
+UPDATE custom_auth_user u
+SET last_login = GREATEST(u.last_login, v.logged_in_at)
+FROM unnest(%(ids)s::uuid[], %(times)s::timestamp[]) AS v(id, logged_in_at)
+WHERE u.id = v.id
+"""
+
+INCREMENT_LOGINS_SQL = """
+UPDATE user_data d
+SET logins = COALESCE(d.logins, 0) + v.count, updated_at = NOW()
+FROM unnest(%(ids)s::uuid[], %(counts)s::integer[]) AS v(id, count)
+WHERE d.id = v.id
+"""
+
+
+def _naive(value: datetime) -> datetime:
+    # The tables use TIMESTAMP without time zone
+    return timezone.make_naive(value) if timezone.is_aware(value) else value
+
+
+class AuthWriteBuffer:
+    """Session touches and login counters waiting to be written."""
+
+    def __init__(self, flush_seconds=None, max_pending=None):
+        self.flush_seconds = flush_seconds or getattr(settings, 'AUTH_WRITE_FLUSH_SECONDS', 10)
+        self.max_pending = max_pending or getattr(settings, 'AUTH_WRITE_BUFFER_SIZE', 5000)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._session_used: Dict[str, datetime] = {}
+        self._last_login: Dict[str, datetime] = {}
+        self._logins: Counter = Counter()
+
+    def pending(self) -> int:
+        return len(self._session_used) + len(self._last_login) + len(self._logins)
+
+    def _recorded(self) -> None:
+        if self._pid != os.getpid():
+            # First use in this process (or first after a fork): the thread is not inherited
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='auth-write-buffer', daemon=True)
+            self._thread.start()
+        if self.pending() >= self.max_pending:
+            self._wake.set()
+
+    def touch_session(self, token_hash: str) -> None:
+        """Record that a session was just used."""
+        with self._lock:
+            self._session_used[token_hash] = timezone.now()
+            self._recorded()
+
+    def record_login(self, user) -> None:
+        """Record a successful login: last_login and one more UserData.logins."""
+        with self._lock:
+            self._last_login[str(user.id)] = timezone.now()
+            if user.user_data_id:
+                self._logins[str(user.user_data_id)] += 1
+            self._recorded()
+
+    def flush(self) -> None:
+        """Write everything pending; failed writes are put back for the next flush."""
+        with self._lock:
+            session_used, last_login, logins = self._session_used, self._last_login, self._logins
+            self._reset()
+        if not (session_used or last_login or logins):
+            return
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Keys go in sorted order so that workers flushing at the same
+                # time lock shared rows in the same order instead of deadlocking
+                if session_used:
+                    hashes = sorted(session_used)
+                    cursor.execute(TOUCH_SESSIONS_SQL, {
+                        'hashes': hashes, 'times': [_naive(session_used[h]) for h in hashes],
+                    })
+                if last_login:
+                    ids = sorted(last_login)
+                    cursor.execute(LAST_LOGIN_SQL, {
+                        'ids': ids, 'times': [_naive(last_login[i]) for i in ids],
+                    })
+                if logins:
+                    ids = sorted(logins)
+                    cursor.execute(INCREMENT_LOGINS_SQL, {
+                        'ids': ids, 'counts': [logins[i] for i in ids],
+                    })
+        except Exception:
+            logger.exception("Failed to flush buffered auth writes; retrying with the next flush")
+            with self._lock:
+                for token_hash, used_at in session_used.items():
+                    self._session_used[token_hash] = max(used_at, self._session_used.get(token_hash, used_at))
+                for user_id, logged_in_at in last_login.items():
+                    self._last_login[user_id] = max(logged_in_at, self._last_login.get(user_id, logged_in_at))
+                self._logins.update(logins)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+            # Do not hold a connection between flushes
+            connection.close()
+
+
+_write_buffer = AuthWriteBuffer()
+atexit.register(_write_buffer.flush)
+
+
+def get_write_buffer() -> AuthWriteBuffer:
+    """Return this worker's auth write buffer."""
+    return _write_buffer
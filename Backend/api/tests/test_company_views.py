@@ -0,0 +1,151 @@
+import base64
+import json
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from data.models import (AuthUser, Company, CompanyFragment, CompanyVersion, Office, Person, Taxonomy,
+                         TaxonomyRelationship, UserData, UserWorld, UserWorldSnapshot, WorldVersion)
+from api.services.company_payload import serialize_companies
+from api.services.session_cache import get_session_cache
+from api.views.auth_views import create_user_session
+
+
+def make_user(username):
+    person = Person.objects.create(first_name='Test', last_name='User', email=f'{username}@example.com',
+                                   company=Company.objects.create(name=f'{username} Inc', domain=f'{username}.example'))
+    user_data = UserData.objects.create(person=person)
+    return AuthUser.objects.create(user_data=user_data, username=username, email=f'{username}@example.com',
+                                   password_hash='!')
+
+
+def make_companies(count, prefix):
+    taxonomy = Taxonomy.objects.create(name=f'{prefix} tag')
+    companies = []
+    for i in range(count):
+        company = Company.objects.create(name=f'{prefix} {i}', domain=f'{prefix}-{i}.example')
+        Office.objects.create(company=company, city='Berlin', country='DE', latitude=52.5, longitude=13.4,
+                              is_headquarters=True)
+        Office.objects.create(company=company, city='Munich', country='DE', latitude=48.1, longitude=11.6)
+        Person.objects.create(first_name='P', last_name=str(i), email=f'{prefix}-{i}@example.com', company=company)
+        TaxonomyRelationship.objects.create(company=company, taxonomy=taxonomy)
+        companies.append(company)
+    return companies
+
+
+class UserCompaniesQueryCountTests(TestCase):
+
+    def setUp(self):
+        get_session_cache().clear()
+
+    def test_serialize_companies_query_count_is_constant(self):
+        few = [company.id for company in make_companies(1, 'few')]
+        many = [company.id for company in make_companies(25, 'many')]
+        with self.assertNumQueries(4):
+            serialize_companies(few)
+        with self.assertNumQueries(4):
+            payload = serialize_companies(many)
+        self.assertEqual(len(payload), 25)
+        self.assertTrue(all(len(company['locations']) == 2 for company in payload))
+
+    def _user_companies_queries(self, count, prefix):
+        user = make_user(prefix)
+        companies = make_companies(count, prefix)
+        UserWorld.objects.create(user=user, company=companies[0], world_companies=[c.id for c in companies[1:]])
+        token = create_user_session(user).token_hash
+        get_session_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/companies/', {'limit': 100}, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), count)
+        return len(queries)
+
+    def test_get_user_companies_query_count_does_not_grow_with_companies(self):
+        self.assertEqual(self._user_companies_queries(1, 'small'), self._user_companies_queries(30, 'large'))
+
+
+class CompanyCursorTests(TestCase):
+
+    def test_malformed_cursor_is_a_bad_request(self):
+        token = create_user_session(make_user('cursor')).token_hash
+        for payload in ([1, 2], {'name': 'a', 'id': 'b'}, ['a'], ['a', 'not-a-uuid']):
+            cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            response = self.client.get('/api/companies/', {'limit': 10, 'cursor': cursor},
+                                       HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(response.status_code, 400, payload)
+
+
+class WorldReadModelTests(TestCase):
+
+    def setUp(self):
+        get_session_cache().clear()
+        self.user = make_user('reader')
+        self.companies = make_companies(3, 'read')
+        UserWorld.objects.create(user=self.user, company=self.companies[0],
+                                 world_companies=[c.id for c in self.companies[1:]])
+        self.token = create_user_session(self.user).token_hash
+
+    def _get(self, **headers):
+        get_session_cache().clear()
+        return self.client.get('/api/companies/', HTTP_AUTHORIZATION=f'Bearer {self.token}', **headers)
+
+    def _bump(self, company):
+        # What the init-db.sql triggers do in the writing transaction
+        for model, key in ((CompanyVersion, {'company_id': company.id}), (WorldVersion, {'user': self.user})):
+            row, _ = model.objects.get_or_create(**key)
+            row.version += 1
+            row.save()
+
+    def test_full_list_is_served_from_the_snapshot(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        expected = sorted(serialize_companies([c.id for c in self.companies]), key=lambda c: (c['name'], c['id']))
+        self.assertEqual(response.json(), expected)
+        self.assertEqual(UserWorldSnapshot.objects.get(user=self.user).world_version, '0')
+
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_bumped_versions_rebuild_only_the_changed_fragment(self):
+        etag = self._get()['ETag']
+        untouched = dict(CompanyFragment.objects.values_list('company_id', 'updated_at'))
+
+        changed = self.companies[1]
+        Company.objects.filter(id=changed.id).update(name='read renamed')
+        self._bump(changed)
+
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('read renamed', [company['name'] for company in response.json()])
+        rebuilt = dict(CompanyFragment.objects.values_list('company_id', 'updated_at'))
+        self.assertEqual([company_id for company_id in rebuilt if rebuilt[company_id] != untouched[company_id]],
+                         [changed.id])
+
+
+class CompanyStreamTests(TestCase):
+
+    def setUp(self):
+        get_session_cache().clear()
+        user = make_user('streamer')
+        self.companies = make_companies(3, 'stream')
+        UserWorld.objects.create(user=user, company=self.companies[0],
+                                 world_companies=[c.id for c in self.companies[1:]])
+        self.token = create_user_session(user).token_hash
+
+    def _names(self, chunks):
+        return [json.loads(line)['name'] for line in b''.join(chunks).decode().splitlines()]
+
+    def test_wsgi_stream_is_a_sync_iterator(self):
+        response = self.client.get('/api/companies/', {'format': 'ndjson'}, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        self.assertEqual(self._names(response.streaming_content), [c.name for c in self.companies])
+
+    async def test_asgi_stream_is_not_buffered(self):
+        # A sync iterator would be collected into a list before the first byte is sent
+        response = await self.async_client.get('/api/companies/', {'format': 'ndjson'},
+                                               headers={'authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(self._names([chunk async for chunk in response.streaming_content]),
+                         [c.name for c in self.companies])
@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import SimpleTestCase
+
+from data.models import AuthUser
+from api.services import usernames
+
+
+class AllocateUsernamesTests(SimpleTestCase):
+
+    def test_repeats_within_a_batch_get_distinct_suffixes(self):
+        taken = {'john': (False, 0), 'ann': (True, 3), 'john_1': (False, 0)}
+        with mock.patch.object(usernames, '_taken', return_value=taken) as query:
+            allocated = usernames.allocate_usernames(['john', 'john', 'ann', 'john_1', 'ann'])
+        query.assert_called_once_with(['john', 'ann', 'john_1'])
+        # The literal "john_1" was already handed to the second "john"
+        self.assertEqual(allocated, ['john', 'john_1', 'ann_4', 'john_1_1', 'ann_5'])
+
+
+@mock.patch.object(usernames, 'transaction')
+class BulkCreateUsersTests(SimpleTestCase):
+
+    def _users(self, *bases):
+        return [AuthUser(username=base, email=f'{i}@example.com', password_hash='!') for i, base in enumerate(bases)]
+
+    def test_repeated_bases_are_allocated_per_batch(self, _transaction):
+        users = self._users('john', 'john', 'john')
+        with mock.patch.object(usernames, 'allocate_usernames', side_effect=[['john', 'john_1'], ['john_2']]) as allocate, \
+                mock.patch.object(AuthUser.objects, 'bulk_create') as bulk_create:
+            usernames.bulk_create_users(users, batch_size=2)
+        self.assertEqual(allocate.call_args_list, [mock.call(['john', 'john']), mock.call(['john'])])
+        self.assertEqual(bulk_create.call_count, 2)
+        self.assertEqual([user.username for user in users], ['john', 'john_1', 'john_2'])
+
+    def test_batch_is_reallocated_from_its_bases_after_a_username_conflict(self, _transaction):
+        users = self._users('john', 'ann')
+        conflict = IntegrityError(f'duplicate key value violates unique constraint "{usernames.USERNAME_CONSTRAINT}"')
+        with mock.patch.object(usernames, 'allocate_usernames', side_effect=[['john', 'ann'], ['john_1', 'ann']]) as allocate, \
+                mock.patch.object(AuthUser.objects, 'bulk_create', side_effect=[conflict, None]) as bulk_create:
+            usernames.bulk_create_users(users)
+        # The retry asks for the wanted bases again, not the usernames of the failed attempt
+        self.assertEqual(allocate.call_args_list, [mock.call(['john', 'ann'])] * 2)
+        self.assertEqual(bulk_create.call_count, 2)
+        self.assertEqual([user.username for user in users], ['john_1', 'ann'])
+
+    def test_other_integrity_errors_are_not_retried(self, _transaction):
+        users = self._users('john')
+        error = IntegrityError('duplicate key value violates unique constraint "custom_auth_user_email_key"')
+        with mock.patch.object(usernames, 'allocate_usernames', return_value=['john']) as allocate, \
+                mock.patch.object(AuthUser.objects, 'bulk_create', side_effect=error):
+            with self.assertRaises(IntegrityError):
+                usernames.bulk_create_users(users)
+        allocate.assert_called_once()
+
+    def test_gives_up_after_max_attempts(self, _transaction):
+        users = self._users('john')
+        conflict = IntegrityError(f'duplicate key value violates unique constraint "{usernames.USERNAME_CONSTRAINT}"')
+        with mock.patch.object(usernames, 'allocate_usernames', return_value=['john']) as allocate, \
+                mock.patch.object(AuthUser.objects, 'bulk_create', side_effect=conflict):
+            with self.assertRaises(IntegrityError):
+                usernames.bulk_create_users(users)
+        self.assertEqual(allocate.call_count, usernames.MAX_ATTEMPTS)
@@ -1,8 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from .views.auth_views import register, login, logout, get_user_profile
 from .views.oauth_views import google_oauth_login, facebook_oauth_login, get_oauth_urls
 from .views.location_view import LocationView
 from .views.company_views import CompanyViewSet
+from .views.job_views import get_job, cancel_background_job
+
+if settings.AUTH_ASYNC_VIEWS:
+    # Under backend/asgi.py: hash passwords without blocking the event loop
+    from .views.async_auth_views import register, login  # noqa: F811
 
 urlpatterns = [
     # Traditional authentication
@@ -19,5 +25,11 @@ urlpatterns = [
     path('locations/search/', LocationView.as_view({'get': 'search_locations'}), name='search_locations'),
     path('locations/coordinates/', LocationView.as_view({'get': 'get_coordinates'}), name='get_coordinates'),
     # Company endpoints
+    path('companies/nearby/', CompanyViewSet.as_view({'get': 'get_nearby_companies'}), name='company_nearby'),
+    path('companies/upload/', CompanyViewSet.as_view({'post': 'upload_domains'}), name='company_upload'),
+    path('companies/viewport/', CompanyViewSet.as_view({'get': 'get_viewport'}), name='company_viewport'),
     path('companies/', CompanyViewSet.as_view({'get': 'get_user_companies', 'post': 'make_random_company_coordinates'}), name='company'),
+    # Background jobs
+    path('jobs/<uuid:job_id>/', get_job, name='job'),
+    path('jobs/<uuid:job_id>/cancel/', cancel_background_job, name='job_cancel'),
 ]
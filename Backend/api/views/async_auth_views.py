@@ -0,0 +1,110 @@
+"""Async variants of the register and login views.
+
+Served instead of the DRF views when the app runs under `backend/asgi.py`
+(AUTH_ASYNC_VIEWS). Password hashing waits on the bounded hashing pool
+without blocking the event loop, so other requests keep being served while
+logins are in flight; the short database steps reuse the sync helpers.
+Request and response bodies match the DRF views.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from data.models import AuthUser
+from ..services.password_hashing import PasswordHashingBusy, ahash_password, averify_password
+from ..services.write_buffer import get_write_buffer
+from .auth_views import (
+    PASSWORD_HASHING_BUSY, create_registered_user, create_user_session, find_login_user, user_payload,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _request_data(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _busy():
+    response = JsonResponse(PASSWORD_HASHING_BUSY, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def register(request):
+    """Register a new user"""
+    try:
+        data = _request_data(request)
+        if data is None:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        username = data['username']
+        email = data['email']
+        password = data['password']
+        first_name = data['first_name']
+        last_name = data['last_name']
+
+        if not all([username, email, password]):
+            return JsonResponse({'error': 'Username, email, and password are required'}, status=400)
+        if await AuthUser.objects.filter(username=username).aexists():
+            return JsonResponse({'error': 'Username already exists'}, status=400)
+        if await AuthUser.objects.filter(email=email).aexists():
+            return JsonResponse({'error': 'Email already exists'}, status=400)
+
+        password_hash = await ahash_password(password)
+        auth_user, session = await sync_to_async(create_registered_user)(
+            username, email, password_hash, first_name, last_name
+        )
+        return JsonResponse({
+            'message': 'User registered successfully',
+            'user': user_payload(auth_user),
+            'token': session.token_hash
+        }, status=201)
+
+    except PasswordHashingBusy:
+        return _busy()
+    except Exception as e:
+        logger.error(f"Error registering user: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    """Login user and return session token"""
+    try:
+        data = _request_data(request)
+        if data is None:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        username = data.get('username')
+        password = data.get('password')
+        if not username or not password:
+            return JsonResponse({'error': 'Username and password are required'}, status=400)
+
+        user = await sync_to_async(find_login_user)(username)
+        if user is None or not await averify_password(password, user.password_hash):
+            return JsonResponse({'error': 'Invalid credentials'}, status=401)
+        if not user.is_active:
+            return JsonResponse({'error': 'Account is deactivated'}, status=401)
+
+        get_write_buffer().record_login(user)
+        session = await sync_to_async(create_user_session)(user)
+        return JsonResponse({
+            'message': 'Login successful',
+            'user': user_payload(user),
+            'token': session.token_hash
+        }, status=200)
+
+    except PasswordHashingBusy:
+        return _busy()
+    except Exception as e:
+        logger.error(f"Error logging in: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
@@ -1,19 +1,23 @@
 import uuid
-import hashlib
 import secrets
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.contrib.auth.hashers import make_password, check_password
 from django.db import transaction
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from data.models import AuthUser, UserData, Person, UserSession, PasswordResetToken
+from ..services.auth_sweep import trim_sessions
+from ..services.password_hashing import PasswordHashingBusy, hash_password, verify_password
+from ..services.session_cache import get_session_cache, hash_token
+from ..services.write_buffer import get_write_buffer
 import logging
 
 logger = logging.getLogger(__name__)
 
+PASSWORD_HASHING_BUSY = {'error': 'Too many login attempts in progress, try again shortly'}
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register(request):
@@ -46,42 +50,18 @@ def register(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        with transaction.atomic():
-            # Create Person
-            person = Person.objects.create(
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                company=None  # Will be set later
-            )
-            
-            # Create UserData
-            user_data = UserData.objects.create(
-                person=person
-            )
-            
-            # Create AuthUser
-            auth_user = AuthUser.objects.create(
-                user_data=user_data,
-                username=username,
-                email=email,
-                password_hash=make_password(password)
-            )
-            
-            # Create initial session
-            session = create_user_session(auth_user)
-            
-            return Response({
-                'message': 'User registered successfully',
-                'user': {
-                    'id': str(auth_user.id),
-                    'username': auth_user.username,
-                    'email': auth_user.email,
-                    'full_name': auth_user.full_name
-                },
-                'token': session.token_hash
-            }, status=status.HTTP_201_CREATED)
+        # Hash on the bounded pool, outside the transaction
+        auth_user, session = create_registered_user(
+            username, email, hash_password(password), first_name, last_name
+        )
+        return Response({
+            'message': 'User registered successfully',
+            'user': user_payload(auth_user),
+            'token': session.token_hash
+        }, status=status.HTTP_201_CREATED)
             
+    except PasswordHashingBusy:
+        return Response(PASSWORD_HASHING_BUSY, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
     except Exception as e:
         logger.error(f"Error registering user: {e}")
         return Response(
@@ -106,19 +86,15 @@ def login(request):
             )
         
         # Find user by username or email
-        try:
-            user = AuthUser.objects.get(username=username)
-        except AuthUser.DoesNotExist:
-            try:
-                user = AuthUser.objects.get(email=username)
-            except AuthUser.DoesNotExist:
-                return Response(
-                    {'error': 'Invalid credentials'}, 
-                    status=status.HTTP_401_UNAUTHORIZED
-                )
-        
-        # Check password
-        if not check_password(password, user.password_hash):
+        user = find_login_user(username)
+        if user is None:
+            return Response(
+                {'error': 'Invalid credentials'}, 
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        
+        # Check password on the bounded hashing pool
+        if not verify_password(password, user.password_hash):
             return Response(
                 {'error': 'Invalid credentials'}, 
                 status=status.HTTP_401_UNAUTHORIZED
@@ -131,24 +107,20 @@ def login(request):
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
-        # Update last login
-        user.last_login = timezone.now()
-        user.save()
+        # last_login and the login counter are written in batches
+        get_write_buffer().record_login(user)
         
         # Create new session
         session = create_user_session(user)
         
         return Response({
             'message': 'Login successful',
-            'user': {
-                'id': str(user.id),
-                'username': user.username,
-                'email': user.email,
-                'full_name': user.full_name
-            },
+            'user': user_payload(user),
             'token': session.token_hash
         }, status=status.HTTP_200_OK)
         
+    except PasswordHashingBusy:
+        return Response(PASSWORD_HASHING_BUSY, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
     except Exception as e:
         logger.error(f"Error logging in: {e}")
         return Response(
@@ -170,16 +142,16 @@ def logout(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Find and invalidate session
-        try:
-            session = UserSession.objects.get(token_hash=token)
-            session.delete()
-            return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
-        except UserSession.DoesNotExist:
+        # Find and invalidate session; sessions store the token's hash
+        token_hash = hash_token(token)
+        deleted, _ = UserSession.objects.filter(token_hash=token_hash).delete()
+        get_session_cache().revoke(token_hash)
+        if not deleted:
             return Response(
                 {'error': 'Invalid token'}, 
                 status=status.HTTP_401_UNAUTHORIZED
             )
+        return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
             
     except Exception as e:
         logger.error(f"Error logging out: {e}")
@@ -219,10 +191,48 @@ def get_user_profile(request):
         )
 
 
+def user_payload(user):
+    """User fields returned by register and login"""
+    return {
+        'id': str(user.id),
+        'username': user.username,
+        'email': user.email,
+        'full_name': user.full_name
+    }
+
+
+def find_login_user(identifier):
+    """Find a user by username, then by email; None if neither matches"""
+    users = AuthUser.objects.select_related('user_data__person')
+    return users.filter(username=identifier).first() or users.filter(email=identifier).first()
+
+
+def create_registered_user(username, email, password_hash, first_name, last_name):
+    """Create the person, user data, user and first session of a new account"""
+    with transaction.atomic():
+        person = Person.objects.create(
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+            company=None  # Will be set later
+        )
+        user_data = UserData.objects.create(
+            person=person
+        )
+        auth_user = AuthUser.objects.create(
+            user_data=user_data,
+            username=username,
+            email=email,
+            password_hash=password_hash
+        )
+        session = create_user_session(auth_user)
+    return auth_user, session
+
+
 def create_user_session(user):
     """Create a new user session"""
     token = secrets.token_urlsafe(32)
-    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    token_hash = hash_token(token)
     expires_at = timezone.now() + timedelta(days=30)  # 30 days
     
     session = UserSession.objects.create(
@@ -230,6 +240,8 @@ def create_user_session(user):
         token_hash=token_hash,
         expires_at=expires_at
     )
+    # Keep each user's live sessions bounded
+    trim_sessions(user)
     
     # Store the plain token for return (only for development)
     session.token_hash = token  # Override for return
@@ -243,12 +255,9 @@ def get_user_from_token(request):
     if not token:
         return None
     
-    token_hash = hashlib.sha256(token.encode()).hexdigest()
-    
-    try:
-        session = UserSession.objects.get(token_hash=token_hash)
-        if session.is_expired:
-            return None
-        return session.user
-    except UserSession.DoesNotExist:
-        return None
+    # Served from the per-worker session cache; misses are one indexed query
+    token_hash = hash_token(token)
+    user = get_session_cache().get_user(token_hash)
+    if user is not None:
+        get_write_buffer().touch_session(token_hash)
+    return user
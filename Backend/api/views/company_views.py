@@ -1,112 +1,353 @@
-from typing import List, Dict, Any
+from uuid import UUID
+from typing import List, Dict, Any, Optional, Set
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status, viewsets
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.cache import cache
 
-from data.models import Company, Office, Person, TaxonomyRelationship, Taxonomy, UserWorld
+from data.models import Company
 from .auth_views import get_user_from_token
-import random
-
-
-def _serialize_company(company: Company) -> Dict[str, Any]:
-    """Serialize a Company into the frontend-expected shape."""
-    # Locations mapping
-    offices = Office.objects.filter(company=company)
-    locations: List[Dict[str, Any]] = []
-    for office in offices:
-        # Only include coordinates if both present
-        coords = None
-        if office.latitude is not None and office.longitude is not None:
-            coords = {
-                'lat': float(office.latitude),
-                'lon': float(office.longitude),
-            }
-        locations.append({
-            'id': str(office.id),
-            'coordinates': coords if coords is not None else {'lat': 0.0, 'lon': 0.0},
-            'address': office.address or '',
-            'city': office.city or '',
-            'country': office.country or '',
-            'isHQ': bool(office.is_headquarters),
-        })
-
-    # People: just return IDs (frontend expects string[])
-    people_ids = list(
-        map(str, Person.objects.filter(company=company).values_list('id', flat=True))
-    )
-
-    # Tags: taxonomy IDs associated to this company
-    tag_ids = list(
-        map(str, TaxonomyRelationship.objects.filter(company=company).values_list('taxonomy_id', flat=True))
-    )
-
-    return {
-        'id': str(company.id),
-        'name': company.name,
-        'locations': locations,
-        'people': people_ids,
-        'tags': tag_ids,
-    }
+from ..services.company_payload import (
+    get_user_company_ids, iter_user_company_pages, serialize_companies, serialize_company_rows,
+)
+from ..services.read_model import get_world_payload
+from ..services.spatial_index import get_office_index
+from ..services.tag_index import get_tag_index, parse_tag_query
+from ..services.jobs import enqueue, serialize_job
+from ..services.marker_feed import get_marker_feed
+from ..renderers import MarkerFeedRenderer, NDJSONRenderer
+from ..services.conditional import not_modified, representation_etag, with_etag, world_version
+from ..services.clustering import MAX_ZOOM, cluster_tile, tiles_for_bbox
+from ..services.domain_upload import iter_upload_values, stage_upload
+import base64
+import hashlib
+import json
+
+MIN_RADIUS_KM = 1
+MAX_RADIUS_KM = 500
+# A normal map viewport spans a handful of tiles; refuse requests far beyond that
+MAX_VIEWPORT_TILES = 64
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+# Companies per keyset page when streaming
+STREAM_CHUNK_SIZE = 500
+TAG_FILTER_ERROR = 'tags must be comma-separated taxonomy IDs and mode one of any, all'
+
+
+def _encode_cursor(company: Dict[str, Any]) -> str:
+    payload = json.dumps([company['name'], str(company['id'])]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_cursor(cursor: str):
+    """Return the `(name, id)` keyset position encoded in a page cursor.
+
+    Raises ValueError for anything that is not a cursor this view issued.
+    """
+    position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not (isinstance(position, list) and len(position) == 2 and all(isinstance(part, str) for part in position)):
+        raise ValueError('Malformed cursor')
+    name, company_id = position
+    return name, UUID(company_id)
+
+
+def _stream_companies(user, allowed: Optional[Set[Any]] = None):
+    """Yield NDJSON lines for the user's companies, read in keyset pages.
+
+    Pages of `STREAM_CHUNK_SIZE` companies come straight from the user's
+    world in the database and each is serialized on its own, so memory
+    is bounded by the page size. `allowed` (a tag filter result) drops
+    companies page by page.
+    """
+    for page in iter_user_company_pages(user, STREAM_CHUNK_SIZE):
+        if allowed is not None:
+            page = [company for company in page if company['id'] in allowed]
+        if page:
+            yield ''.join(json.dumps(row) + '\n' for row in serialize_company_rows(page))
+
+
+async def _stream_in_thread(lines):
+    """Step a sync line generator one item per await, in the sync thread.
+
+    Under ASGI Django buffers a sync iterator into a list before sending
+    it; stepping it from an async generator keeps the stream, and its
+    memory, to one page at a time.
+    """
+    done = object()
+    while True:
+        line = await sync_to_async(next)(lines, done)
+        if line is done:
+            return
+        yield line
+
+
+def _filter_by_tags(request, company_ids: Set[Any]) -> Set[Any]:
+    """Apply the optional `?tags=a,b&mode=any|all` filter to a set of companies.
+
+    Raises ValueError for a malformed filter.
+    """
+    query = parse_tag_query(request.query_params)
+    if query is None:
+        return company_ids
+    tag_ids, mode = query
+    return get_tag_index().filter(company_ids, tag_ids, mode)
+
+
+def _index_sources(request, offices: bool) -> List[str]:
+    """Fingerprints of the per-worker indexes a response is answered from."""
+    sources = [get_office_index().fingerprint()] if offices else []
+    if request.query_params.get('tags'):
+        sources.append(get_tag_index().fingerprint())
+    return sources
 
 
 class CompanyViewSet(viewsets.ModelViewSet):
-    
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action == 'get_user_companies':
+            renderers.extend([MarkerFeedRenderer(), NDJSONRenderer()])
+        return renderers
+
     @action(detail=False, methods=['GET'], url_path='user-companies')
     def get_user_companies(self, request):
         """Return all companies associated to the current user.
 
         Association comes from `UserWorld` records for the user, including the
         primary `company` and any IDs listed in `world_companies` arrays.
+
+        With `Accept: application/vnd.companymap.markers` or `?format=binary`
+        the response is the compact binary marker feed instead of JSON.
+
+        Passing `limit` and/or `cursor` returns one keyset page ordered by
+        `(name, id)` as `{'results': [...], 'next_cursor': ...}`. With
+        `Accept: application/x-ndjson` or `?format=ndjson` companies are
+        streamed one JSON object per line.
+
+        Every mode accepts `?tags=a,b&mode=any|all`, answered from the
+        worker's taxonomy bitsets.
+
+        Responses carry a strong ETag derived from the user's world version
+        and, for modes answered from the worker's indexes, their
+        fingerprints; a matching `If-None-Match` gets a 304 before anything
+        is serialized.
+        """
+        user = get_user_from_token(request)
+        if not user:
+            return Response({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        version = world_version(user)
+        offices = request.accepted_renderer.format == MarkerFeedRenderer.format
+        etag = representation_etag(request, version, *_index_sources(request, offices))
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+        return with_etag(self._user_companies_response(request, user, version), etag)
+
+    def _user_companies_response(self, request, user, version):
+        try:
+            company_ids = _filter_by_tags(request, get_user_company_ids(user))
+        except ValueError:
+            return Response({'error': TAG_FILTER_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+        if request.accepted_renderer.format == MarkerFeedRenderer.format:
+            return Response(get_marker_feed(user.id, company_ids, version), status=status.HTTP_200_OK)
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            allowed = company_ids if 'tags' in request.query_params else None
+            lines = _stream_companies(user, allowed)
+            if isinstance(request._request, ASGIRequest):
+                lines = _stream_in_thread(lines)
+            return StreamingHttpResponse(lines, content_type=NDJSONRenderer.media_type)
+
+        if 'limit' in request.query_params or 'cursor' in request.query_params:
+            try:
+                limit = min(int(request.query_params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+                cursor = request.query_params.get('cursor')
+                after = _decode_cursor(cursor) if cursor else None
+            except (ValueError, TypeError):
+                return Response({'error': 'Invalid limit or cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            if limit < 1:
+                return Response({'error': 'Invalid limit or cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+            queryset = Company.objects.filter(id__in=list(company_ids)).order_by('name', 'id')
+            if after:
+                name, company_id = after
+                queryset = queryset.filter(Q(name__gt=name) | Q(name=name, id__gt=company_id))
+            companies = list(queryset.values('id', 'name')[:limit + 1])
+            next_cursor = _encode_cursor(companies[limit - 1]) if len(companies) > limit else None
+            return Response({
+                'results': serialize_company_rows(companies[:limit]),
+                'next_cursor': next_cursor,
+            }, status=status.HTTP_200_OK)
+
+        if 'tags' in request.query_params:
+            return Response(serialize_companies(company_ids), status=status.HTTP_200_OK)
+
+        # Full list: served as stored JSON text from the per-user read model
+        return HttpResponse(get_world_payload(user, version), content_type='application/json')
+
+
+    @action(detail=False, methods=['GET'], url_path='nearby')
+    def get_nearby_companies(self, request):
+        """Return the user's companies with an office within `radius_km` of a point.
+
+        Candidates come from the worker's office spatial index, which prunes
+        with a latitude/longitude bounding box before the exact great-circle
+        check. Companies are sorted by the distance of their closest office.
         """
         user = get_user_from_token(request)
         if not user:
             return Response({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        # Collect company IDs from UserWorld (direct company + world_companies array)
-        company_ids = set()
-        user_worlds = UserWorld.objects.filter(user=user)
-        for uw in user_worlds:
-            if uw.company_id:
-                company_ids.add(uw.company_id)
-            if uw.world_companies:
-                for cid in uw.world_companies:
-                    company_ids.add(cid)
+        try:
+            lat = float(request.query_params['lat'])
+            lon = float(request.query_params['lon'])
+            radius_km = float(request.query_params.get('radius_km', 100))
+        except (KeyError, ValueError):
+            return Response({'error': 'lat, lon and radius_km must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return Response({'error': 'lat/lon out of range'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (MIN_RADIUS_KM <= radius_km <= MAX_RADIUS_KM):
+            return Response(
+                {'error': f'radius_km must be between {MIN_RADIUS_KM} and {MAX_RADIUS_KM}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        etag = representation_etag(request, world_version(user), *_index_sources(request, offices=True))
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
 
+        try:
+            company_ids = _filter_by_tags(request, get_user_company_ids(user))
+        except ValueError:
+            return Response({'error': TAG_FILTER_ERROR}, status=status.HTTP_400_BAD_REQUEST)
         if not company_ids:
-            return Response([], status=status.HTTP_200_OK)
+            return with_etag(Response([], status=status.HTTP_200_OK), etag)
 
-        companies = Company.objects.filter(id__in=list(company_ids)).order_by('name')
-        data = [_serialize_company(c) for c in companies]
-        return Response(data, status=status.HTTP_200_OK)
+        # Matches come back closest first, so the first hit per company is its distance
+        distances: Dict[Any, float] = {}
+        for distance, _office_id, company_id in get_office_index().within_radius(lat, lon, radius_km, company_ids):
+            distances.setdefault(company_id, distance)
 
+        data = serialize_companies(distances.keys())
+        for company in data:
+            company['distanceKm'] = round(distances[UUID(company['id'])], 3)
+        data.sort(key=lambda company: company['distanceKm'])
+        return with_etag(Response(data, status=status.HTTP_200_OK), etag)
 
-    @action(detail=False, methods=['POST'], url_path='random-coordinates')
-    def make_random_company_coordinates(self, request):
-        batch_size = 100000
-        total_updated = 0
+    @action(detail=False, methods=['GET'], url_path='viewport')
+    def get_viewport(self, request):
+        """Return clustered markers for the user's offices inside a map viewport.
 
-        queryset = Company.objects.all().order_by('id')
-        total_companies = queryset.count()
+        `bbox` is `min_lon,min_lat,max_lon,max_lat` (Leaflet's `toBBoxString`).
+        Low zooms get grid clusters with a count and centroid, high zooms get
+        individual offices. Results are computed and cached per tile, so
+        panning only computes tiles that were not seen before.
+        """
+        user = get_user_from_token(request)
+        if not user:
+            return Response({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        for start in range(0, total_companies, batch_size):
-            batch = queryset[start:start + batch_size]
-            offices_to_update = []
+        try:
+            min_lon, min_lat, max_lon, max_lat = map(float, request.query_params['bbox'].split(','))
+            zoom = int(request.query_params['zoom'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'bbox (min_lon,min_lat,max_lon,max_lat) and zoom are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (0 <= zoom <= MAX_ZOOM) or min_lon > max_lon or min_lat > max_lat:
+            return Response({'error': 'Invalid bbox or zoom'}, status=status.HTTP_400_BAD_REQUEST)
+
+        tiles = tiles_for_bbox(min_lon, min_lat, max_lon, max_lat, zoom)
+        if len(tiles) > MAX_VIEWPORT_TILES:
+            return Response({'error': 'Viewport too large for this zoom'}, status=status.HTTP_400_BAD_REQUEST)
+
+        version = world_version(user)
+        sources = _index_sources(request, offices=True)
+        etag = representation_etag(request, version, *sources)
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+
+        try:
+            company_ids = _filter_by_tags(request, get_user_company_ids(user))
+        except ValueError:
+            return Response({'error': TAG_FILTER_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+        clusters: List[Dict[str, Any]] = []
+        offices: List[Dict[str, Any]] = []
+        if not company_ids:
+            return with_etag(Response({'zoom': zoom, 'clusters': clusters, 'offices': offices}, status=status.HTTP_200_OK), etag)
 
-            for company in batch.iterator():
-                office = Office.objects.filter(company=company).first()
-                if office:
-                    office.latitude = random.uniform(-90, 90)
-                    office.longitude = random.uniform(-180, 180)
-                    offices_to_update.append(office)
+        # The world version, index fingerprints and tag filter are part of the
+        # key, so any change in the world invalidates its tiles
+        tag_filter = f"{request.query_params.get('tags', '')}|{request.query_params.get('mode', '')}"
+        world = hashlib.sha1('|'.join([version, *sources, tag_filter]).encode()).hexdigest()[:16]
+        keys = {f'viewport:{user.id}:{world}:{zoom}:{x}:{y}': (x, y) for x, y in tiles}
+        cached = cache.get_many(list(keys))
+        missing = {}
+        index = None
+        for key, (x, y) in keys.items():
+            tile = cached.get(key)
+            if tile is None:
+                index = index or get_office_index()
+                tile = missing[key] = cluster_tile(index, company_ids, zoom, x, y)
+            clusters.extend(tile['clusters'])
+            offices.extend(tile['offices'])
+        if missing:
+            cache.set_many(missing, timeout=getattr(settings, 'VIEWPORT_CACHE_SECONDS', 60))
 
-            Office.objects.bulk_update(offices_to_update, ['latitude', 'longitude'])
-            total_updated += len(offices_to_update)
-            print(f"✅ Updated {total_updated}/{total_companies} offices so far...")
+        return with_etag(Response({'zoom': zoom, 'clusters': clusters, 'offices': offices}, status=status.HTTP_200_OK), etag)
 
-        return Response(
-            {'message': f'Random company coordinates assigned to {total_updated} offices.'},
-            status=status.HTTP_200_OK
-        )
+    @action(detail=False, methods=['POST'], url_path='upload')
+    def upload_domains(self, request):
+        """Queue adding the companies of an uploaded CSV or text domain list to the user's world.
 
+        The file is sent as multipart field `file`, one domain, URL or email
+        per line (or a CSV with a domain/website/url column). With
+        `create=true` unknown domains get placeholder companies.
+
+        The request only stages the normalized domains; it returns 202 with
+        the `import_domains` job, whose result holds the match counts.
+        """
+        user = get_user_from_token(request)
+        if not user:
+            return Response({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        uploaded = request.FILES.get('file')
+        if uploaded is None:
+            return Response({'error': 'A file upload is required'}, status=status.HTTP_400_BAD_REQUEST)
+        create_missing = str(request.data.get('create', request.query_params.get('create', ''))).lower() in ('1', 'true', 'yes')
+
+        try:
+            with transaction.atomic():
+                job = stage_upload(user, iter_upload_values(uploaded), create_missing=create_missing)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(serialize_job(job), status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['POST'], url_path='random-coordinates')
+    def make_random_company_coordinates(self, request):
+        """Queue a job that gives every company's first office random coordinates.
+
+        Returns 202 with the job; progress is available from `/api/jobs/<id>/`.
+        """
+        user = get_user_from_token(request)
+        if not user:
+            return Response({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
 
+        params = {}
+        if 'batch_size' in request.data:
+            try:
+                params['batch_size'] = int(request.data['batch_size'])
+            except (TypeError, ValueError):
+                return Response({'error': 'batch_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        job = enqueue('random_coordinates', params, owner=user)
+        return Response(serialize_job(job), status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,42 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from data.models import BackgroundJob
+from .auth_views import get_user_from_token
+from ..services.jobs import cancel_job, serialize_job
+
+
+def _visible_job(user, job_id):
+    """The job if `user` owns it or is staff; other users' jobs look like missing ones."""
+    jobs = BackgroundJob.objects.all() if user.is_staff else BackgroundJob.objects.filter(owner=user)
+    return jobs.filter(id=job_id).first()
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_job(request, job_id):
+    """Return status and progress of a background job"""
+    user = get_user_from_token(request)
+    if not user:
+        return Response({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
+    job = _visible_job(user, job_id)
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(serialize_job(job), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cancel_background_job(request, job_id):
+    """Cancel a queued job, or stop a running one at its next checkpoint"""
+    user = get_user_from_token(request)
+    if not user:
+        return Response({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
+    job = _visible_job(user, job_id)
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if job.status in (BackgroundJob.STATUS_DONE, BackgroundJob.STATUS_FAILED, BackgroundJob.STATUS_CANCELLED):
+        return Response({'error': f'Job already {job.status}'}, status=status.HTTP_409_CONFLICT)
+    return Response(serialize_job(cancel_job(job)), status=status.HTTP_202_ACCEPTED)
@@ -5,10 +5,26 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
 from django.db.models import F
+from ..services.conditional import city_version, not_modified, representation_etag, with_etag
+from ..services.city_index import get_city_indexes, search_cities
+from ..services.city_coordinates import get_coordinate_cache
+from uuid import UUID
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on ids in one batch coordinates request
+MAX_COORDINATE_IDS = 500
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
 class LocationView(viewsets.ViewSet):
 
     @action(detail=False, methods=['GET'])
@@ -17,12 +33,20 @@ class LocationView(viewsets.ViewSet):
             search_term = request.query_params.get('search_term')
             if not search_term:
                 return Response({'error': 'Search term is required'}, status=status.HTTP_400_BAD_REQUEST)
-            locations = (
-                City.objects.filter(ascii_name__icontains=search_term)
-                .values("id", "ascii_name", "country")
-                .order_by("-population")[:10]
-            )
-            return Response(list(locations), status=status.HTTP_200_OK)
+            indexes = get_city_indexes()
+            # Until this worker's indexes are built, results come from the database
+            etag = representation_etag(request, city_version(), indexes[0].version if indexes else 'db')
+            unchanged = not_modified(request, etag)
+            if unchanged:
+                return unchanged
+            locations = search_cities(search_term, indexes=indexes)
+            if request.query_params.get('coordinates', '').lower() in ('1', 'true', 'yes'):
+                # Embed coordinates so picking a suggestion needs no second request
+                found = get_coordinate_cache().get_many(location['id'] for location in locations)
+                for location in locations:
+                    coordinates = found.get(location['id'])
+                    location['latitude'], location['longitude'] = coordinates or (None, None)
+            return with_etag(Response(locations, status=status.HTTP_200_OK), etag)
 
         except Exception as e:
             logger.error(f'Error searching locations: {e}')
@@ -30,20 +54,39 @@ class LocationView(viewsets.ViewSet):
 
     @action(detail=False, methods=['GET'], url_path='coordinates')
     def get_coordinates(self, request):
+        """Coordinates of one city (`location_id`) or of many (`location_ids=a,b,c`).
+
+        The batch form returns `{"locations": {id: {latitude, longitude}}, "missing": [ids]}`.
+        """
         try:
+            location_ids = request.query_params.get('location_ids')
             location_id = request.query_params.get('location_id')
-            if not location_id:
+            if not location_id and not location_ids:
                 return Response({'error': 'Location ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+            etag = representation_etag(request, city_version())
+            unchanged = not_modified(request, etag)
+            if unchanged:
+                return unchanged
 
-            try:
-                location = City.objects.filter(id=location_id).values('latitude', 'longitude').first()
-            except Exception:
-                location = None
+            if location_ids:
+                ids = [location.strip() for location in location_ids.split(',') if location.strip()]
+                if len(ids) > MAX_COORDINATE_IDS:
+                    return Response({'error': f'At most {MAX_COORDINATE_IDS} location IDs per request'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                valid = [location for location in ids if _is_uuid(location)]
+                found = get_coordinate_cache().get_many(valid)
+                locations = {
+                    location: {'latitude': coordinates[0], 'longitude': coordinates[1]}
+                    for location, coordinates in found.items() if coordinates is not None
+                }
+                missing = [location for location in ids if location not in locations]
+                return with_etag(Response({'locations': locations, 'missing': missing}, status=status.HTTP_200_OK), etag)
 
-            if not location or location.get('latitude') is None or location.get('longitude') is None:
+            coordinates = get_coordinate_cache().get_many([location_id]).get(location_id) if _is_uuid(location_id) else None
+            if coordinates is None:
                 return Response({'error': f'Location not found {location_id}'}, status=status.HTTP_404_NOT_FOUND)
 
-            return Response(location, status=status.HTTP_200_OK)
+            return with_etag(Response({'latitude': coordinates[0], 'longitude': coordinates[1]}, status=status.HTTP_200_OK), etag)
         except Exception as e:
             logger.error(f'Error getting coordinates: {e}')
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
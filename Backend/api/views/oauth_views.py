@@ -12,11 +12,18 @@ from allauth.socialaccount.providers.facebook.views import FacebookOAuth2Adapter
 from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 from allauth.socialaccount import app_settings
 from allauth.socialaccount.models import SocialToken
-import requests
 import json
+import logging
 from datetime import datetime, timedelta
 from data.models import AuthUser, UserData, Person, OAuthAccount
 from .auth_views import create_user_session
+from ..services.oauth_providers import ProviderUnavailable, get_oauth_client
+from ..services.usernames import create_with_unique_username
+from ..services.write_buffer import get_write_buffer
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_UNAVAILABLE_MESSAGE = 'The login provider is not responding, please try again later'
 
 
 @api_view(['POST'])
@@ -28,15 +35,11 @@ def google_oauth_login(request):
         if not access_token:
             return Response({'error': 'Access token required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Verify token with Google
-        google_response = requests.get(
-            f'https://www.googleapis.com/oauth2/v2/userinfo?access_token={access_token}'
-        )
-        
-        if google_response.status_code != 200:
+        # Verify token with Google (pooled client, cached briefly)
+        google_data = get_oauth_client().userinfo('google', access_token)
+        if google_data is None:
             return Response({'error': 'Invalid access token'}, status=status.HTTP_400_BAD_REQUEST)
 
-        google_data = google_response.json()
         google_id = google_data.get('id')
         email = google_data.get('email')
         name = google_data.get('name', '')
@@ -69,14 +72,8 @@ def google_oauth_login(request):
                     provider_data=google_data
                 )
             except AuthUser.DoesNotExist:
-                # Create new user
-                username = email.split('@')[0]  # Use email prefix as username
-                # Ensure username is unique
-                counter = 1
-                original_username = username
-                while AuthUser.objects.filter(username=username).exists():
-                    username = f"{original_username}_{counter}"
-                    counter += 1
+                # Create new user, named after the email prefix
+                username = email.split('@')[0]
 
                 # Create Person
                 person = Person.objects.create(
@@ -93,12 +90,13 @@ def google_oauth_login(request):
                 )
 
                 # Create AuthUser
-                user = AuthUser.objects.create(
-                    username=username,
+                # Next free username suffix in one query; retried if taken concurrently
+                user = create_with_unique_username(username, lambda free_username: AuthUser.objects.create(
+                    username=free_username,
                     email=email,
                     password_hash='',  # No password for OAuth users
                     user_data=user_data
-                )
+                ))
 
                 # Create OAuth account
                 oauth_account = OAuthAccount.objects.create(
@@ -111,6 +109,7 @@ def google_oauth_login(request):
 
         # Create session
         session_data = create_user_session(user)
+        get_write_buffer().record_login(user)
         
         return Response({
             'message': 'Google login successful',
@@ -126,6 +125,9 @@ def google_oauth_login(request):
             'session': session_data
         }, status=status.HTTP_200_OK)
 
+    except ProviderUnavailable:
+        logger.warning('OAuth provider unavailable', exc_info=True)
+        return Response({'error': PROVIDER_UNAVAILABLE_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -139,15 +141,11 @@ def facebook_oauth_login(request):
         if not access_token:
             return Response({'error': 'Access token required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Verify token with Facebook
-        facebook_response = requests.get(
-            f'https://graph.facebook.com/me?fields=id,name,email,first_name,last_name&access_token={access_token}'
-        )
-        
-        if facebook_response.status_code != 200:
+        # Verify token with Facebook (pooled client, cached briefly)
+        facebook_data = get_oauth_client().userinfo('facebook', access_token)
+        if facebook_data is None:
             return Response({'error': 'Invalid access token'}, status=status.HTTP_400_BAD_REQUEST)
 
-        facebook_data = facebook_response.json()
         facebook_id = facebook_data.get('id')
         email = facebook_data.get('email')
         name = facebook_data.get('name', '')
@@ -185,6 +183,7 @@ def facebook_oauth_login(request):
                 else:
                     # User found and linked, create session
                     session_data = create_user_session(user)
+                    get_write_buffer().record_login(user)
                     return Response({
                         'message': 'Facebook login successful',
                         'user': {
@@ -199,14 +198,8 @@ def facebook_oauth_login(request):
                         'session': session_data
                     }, status=status.HTTP_200_OK)
 
-            # Create new user
+            # Create new user, named after the email prefix
             username = email.split('@')[0] if email else f"fb_{facebook_id}"
-            # Ensure username is unique
-            counter = 1
-            original_username = username
-            while AuthUser.objects.filter(username=username).exists():
-                username = f"{original_username}_{counter}"
-                counter += 1
 
             # Create Person
             person = Person.objects.create(
@@ -223,12 +216,13 @@ def facebook_oauth_login(request):
             )
 
             # Create AuthUser
-            user = AuthUser.objects.create(
-                username=username,
+            # Next free username suffix in one query; retried if taken concurrently
+            user = create_with_unique_username(username, lambda free_username: AuthUser.objects.create(
+                username=free_username,
                 email=email or f"{facebook_id}@facebook.local",
                 password_hash='',  # No password for OAuth users
                 user_data=user_data
-            )
+            ))
 
             # Create OAuth account
             oauth_account = OAuthAccount.objects.create(
@@ -241,6 +235,7 @@ def facebook_oauth_login(request):
 
         # Create session
         session_data = create_user_session(user)
+        get_write_buffer().record_login(user)
         
         return Response({
             'message': 'Facebook login successful',
@@ -256,6 +251,9 @@ def facebook_oauth_login(request):
             'session': session_data
         }, status=status.HTTP_200_OK)
 
+    except ProviderUnavailable:
+        logger.warning('OAuth provider unavailable', exc_info=True)
+        return Response({'error': PROVIDER_UNAVAILABLE_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
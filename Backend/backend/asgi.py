@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+# Serve the async register/login views, which hash passwords off the event loop
+os.environ.setdefault("AUTH_ASYNC_VIEWS", "true")
 
 application = get_asgi_application()
+
+# Build the city search indexes before the first autocomplete request needs them
+from api.services.city_index import warm_city_indexes  # noqa: E402
+
+warm_city_indexes()
@@ -154,6 +154,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['ETag']
 
 # REST Framework settings
 REST_FRAMEWORK = {
@@ -229,3 +230,62 @@ SPECTACULAR_SETTINGS = {
     "VERSION": "1.0.0",
     "SERVE_INCLUDE_SCHEMA": False,
 }
+
+# Per-worker office spatial index (api/services/spatial_index.py)
+SPATIAL_INDEX_REFRESH_SECONDS = config('SPATIAL_INDEX_REFRESH_SECONDS', default=5, cast=int)
+SPATIAL_INDEX_REBUILD_SECONDS = config('SPATIAL_INDEX_REBUILD_SECONDS', default=3600, cast=int)
+# Lifetime of cached per-tile viewport clusters
+VIEWPORT_CACHE_SECONDS = config('VIEWPORT_CACHE_SECONDS', default=60, cast=int)
+# Lifetime of cached per-user binary marker feeds
+MARKER_FEED_CACHE_SECONDS = config('MARKER_FEED_CACHE_SECONDS', default=60, cast=int)
+
+# Per-worker taxonomy bitset index (api/services/tag_index.py)
+TAG_INDEX_REFRESH_SECONDS = config('TAG_INDEX_REFRESH_SECONDS', default=5, cast=int)
+TAG_INDEX_REBUILD_SECONDS = config('TAG_INDEX_REBUILD_SECONDS', default=600, cast=int)
+
+# Background job queue (api/services/jobs.py, manage.py run_workers)
+JOB_POLL_SECONDS = config('JOB_POLL_SECONDS', default=1.0, cast=float)
+# Running jobs refresh their heartbeat this often from a side thread
+JOB_HEARTBEAT_SECONDS = config('JOB_HEARTBEAT_SECONDS', default=30, cast=int)
+# A running job without a heartbeat for this long is assumed dead and requeued
+JOB_STALE_SECONDS = config('JOB_STALE_SECONDS', default=600, cast=int)
+# First retry delay; doubles with every further attempt
+JOB_RETRY_BASE_SECONDS = config('JOB_RETRY_BASE_SECONDS', default=30, cast=int)
+
+# Memory budget of the per-worker fuzzy city name index (api/services/city_index.py)
+CITY_TRIGRAM_MEMORY_MB = config('CITY_TRIGRAM_MEMORY_MB', default=64, cast=int)
+# Per-worker LRU of city coordinates, warmed with the most populous cities
+CITY_COORDINATES_CACHE_SIZE = config('CITY_COORDINATES_CACHE_SIZE', default=50000, cast=int)
+CITY_COORDINATES_WARM_SIZE = config('CITY_COORDINATES_WARM_SIZE', default=20000, cast=int)
+
+# Per-worker cache of bearer token sessions (api/services/session_cache.py);
+# also the longest a logged out token can still be accepted by other workers
+AUTH_TOKEN_CACHE_SECONDS = config('AUTH_TOKEN_CACHE_SECONDS', default=30, cast=int)
+AUTH_TOKEN_CACHE_SIZE = config('AUTH_TOKEN_CACHE_SIZE', default=10000, cast=int)
+# Buffered session last-used and login counter writes (api/services/write_buffer.py);
+# a crashed worker loses at most this much bookkeeping
+AUTH_WRITE_FLUSH_SECONDS = config('AUTH_WRITE_FLUSH_SECONDS', default=10, cast=int)
+AUTH_WRITE_BUFFER_SIZE = config('AUTH_WRITE_BUFFER_SIZE', default=5000, cast=int)
+# Logging in past this many live sessions deletes the user's oldest ones (api/services/auth_sweep.py)
+AUTH_MAX_SESSIONS_PER_USER = config('AUTH_MAX_SESSIONS_PER_USER', default=10, cast=int)
+
+# Bounded password hashing pool (api/services/password_hashing.py); workers default to the CPU count
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=0, cast=int) or None
+PASSWORD_HASH_QUEUE = config('PASSWORD_HASH_QUEUE', default=32, cast=int)
+# Logins waiting longer than this for a hashing slot get a 503
+PASSWORD_HASH_WAIT_SECONDS = config('PASSWORD_HASH_WAIT_SECONDS', default=2.0, cast=float)
+# Async register/login views; backend/asgi.py turns this on
+AUTH_ASYNC_VIEWS = config('AUTH_ASYNC_VIEWS', default=False, cast=bool)
+
+# OAuth userinfo verification (api/services/oauth_providers.py). Point the base URLs at a
+# stub server for load tests.
+OAUTH_GOOGLE_API_URL = config('OAUTH_GOOGLE_API_URL', default='https://www.googleapis.com')
+OAUTH_FACEBOOK_API_URL = config('OAUTH_FACEBOOK_API_URL', default='https://graph.facebook.com')
+OAUTH_CONNECT_TIMEOUT = config('OAUTH_CONNECT_TIMEOUT', default=2.0, cast=float)
+OAUTH_READ_TIMEOUT = config('OAUTH_READ_TIMEOUT', default=5.0, cast=float)
+OAUTH_HTTP_POOL_SIZE = config('OAUTH_HTTP_POOL_SIZE', default=10, cast=int)
+OAUTH_USERINFO_CACHE_SECONDS = config('OAUTH_USERINFO_CACHE_SECONDS', default=60, cast=int)
+OAUTH_USERINFO_CACHE_SIZE = config('OAUTH_USERINFO_CACHE_SIZE', default=10000, cast=int)
+
+# Creates the unmanaged tables for `manage.py test` (needs the Postgres from DATABASE_URL)
+TEST_RUNNER = 'backend.test_runner.UnmanagedModelTestRunner'
@@ -0,0 +1,27 @@
+"""Test runner that creates tables for the unmanaged models.
+
+The schema is owned by init-scripts/init-db.sql, so every model in `data`
+is `managed = False` and the app has no migrations. For the test database
+the models are switched to managed and the app is synced from the model
+definitions instead.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class UnmanagedModelTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, *args, **kwargs):
+        self.unmanaged_models = [model for model in apps.get_app_config('data').get_models() if not model._meta.managed]
+        for model in self.unmanaged_models:
+            model._meta.managed = True
+        self.migration_modules = settings.MIGRATION_MODULES
+        settings.MIGRATION_MODULES = {**self.migration_modules, 'data': None}
+        super().setup_test_environment(*args, **kwargs)
+
+    def teardown_test_environment(self, *args, **kwargs):
+        super().teardown_test_environment(*args, **kwargs)
+        settings.MIGRATION_MODULES = self.migration_modules
+        for model in self.unmanaged_models:
+            model._meta.managed = False
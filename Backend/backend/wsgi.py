@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
 application = get_wsgi_application()
+
+# Build the city search indexes before the first autocomplete request needs them
+from api.services.city_index import warm_city_indexes  # noqa: E402
+
+warm_city_indexes()
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import (
     Taxonomy, Company, TaxonomyRelationship, Office, Person, 
-    UserData, AuthUser, UserSession, PasswordResetToken, UserWorld, OAuthAccount
+    UserData, AuthUser, UserSession, PasswordResetToken, UserWorld, OAuthAccount,
+    CompanyFragment, UserWorldSnapshot, BackgroundJob
 )
 
 
@@ -113,3 +114,26 @@ class OAuthAccountAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__email', 'provider_id']
     raw_id_fields = ['user']
     readonly_fields = ['provider_data']
+
+
+@admin.register(CompanyFragment)
+class CompanyFragmentAdmin(admin.ModelAdmin):
+    list_display = ['name', 'version', 'updated_at']
+    search_fields = ['name']
+    raw_id_fields = ['company']
+    readonly_fields = ['payload', 'version']
+
+
+@admin.register(UserWorldSnapshot)
+class UserWorldSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['user', 'world_version', 'updated_at']
+    search_fields = ['user__username', 'user__email']
+    raw_id_fields = ['user']
+    readonly_fields = ['payload', 'world_version']
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'status', 'processed', 'total', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'created_at']
+    readonly_fields = ['params', 'checkpoint', 'result', 'error']
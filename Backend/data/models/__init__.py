@@ -12,6 +12,11 @@ from .password_reset_token import PasswordResetToken
 from .user_world import UserWorld
 from .oauth_account import OAuthAccount
 from .city import City
+from .company_fragment import CompanyFragment
+from .company_version import CompanyVersion
+from .user_world_snapshot import UserWorldSnapshot
+from .world_version import WorldVersion
+from .background_job import BackgroundJob
 
 __all__ = [
     'BaseModel',
@@ -27,4 +32,9 @@ __all__ = [
     'UserWorld',
     'OAuthAccount',
     'City',
+    'CompanyFragment',
+    'CompanyVersion',
+    'UserWorldSnapshot',
+    'WorldVersion',
+    'BackgroundJob',
 ]
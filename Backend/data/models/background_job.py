@@ -0,0 +1,54 @@
+from django.db import models
+from django.utils import timezone
+from .base import BaseModel
+
+
+class BackgroundJob(BaseModel):
+    """Long-running job executed outside the request cycle"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+
+    kind = models.CharField(max_length=100, help_text="Handler name in api.services.jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    params = models.JSONField(default=dict, help_text="Handler arguments")
+    checkpoint = models.JSONField(default=dict, help_text="Resume position written after every batch")
+    processed = models.BigIntegerField(default=0)
+    total = models.BigIntegerField(blank=True, null=True)
+    result = models.JSONField(default=dict)
+    error = models.TextField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not claimed before this time (retry backoff)")
+    cancel_requested = models.BooleanField(default=False)
+    locked_by = models.CharField(max_length=255, blank=True, null=True, help_text="Worker running the job")
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    owner = models.ForeignKey('AuthUser', on_delete=models.SET_NULL, blank=True, null=True, related_name='jobs',
+                              help_text="User who may see and cancel the job; staff only if empty")
+
+    class Meta:
+        managed = False
+        db_table = 'background_job'
+        verbose_name = 'Background Job'
+        verbose_name_plural = 'Background Jobs'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} ({self.status})"
+
+    @property
+    def progress(self):
+        if not self.total:
+            return None
+        return min(1.0, self.processed / self.total)
@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
 
 
 class City(models.Model):
@@ -10,6 +11,10 @@ class City(models.Model):
     latitude = models.DecimalField(max_digits=10, decimal_places=8, null=True, blank=True)
     longitude = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True)
     population = models.IntegerField(null=True, blank=True)
+    alternate_names = ArrayField(models.TextField(), null=True, blank=True)  # GeoNames alternate names
+    geoname_id = models.BigIntegerField(unique=True, null=True, blank=True)
+    timezone = models.CharField(max_length=64, null=True, blank=True)
+    modification_date = models.DateField(null=True, blank=True)  # GeoNames last change; drives incremental loads
 
     class Meta:
         managed = False                 # table already created by SQL; don't let Django manage it
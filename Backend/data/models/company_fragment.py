@@ -0,0 +1,19 @@
+from django.db import models
+
+
+class CompanyFragment(models.Model):
+    """Ready-to-serve JSON for one company in the map payload"""
+    company = models.OneToOneField('Company', on_delete=models.CASCADE, primary_key=True, related_name='fragment')
+    name = models.CharField(max_length=255, help_text="Company name, for ordering snapshots")
+    payload = models.TextField(help_text="Serialized company object")
+    version = models.TextField(help_text="Source version the payload was built from")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = 'company_fragment'
+        verbose_name = 'Company Fragment'
+        verbose_name_plural = 'Company Fragments'
+
+    def __str__(self):
+        return f"Fragment for {self.name}"
@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class CompanyVersion(models.Model):
+    """Change counter for one company and its offices, people and tags, bumped by database triggers"""
+    company_id = models.UUIDField(primary_key=True, help_text="Company id; kept after the company is deleted")
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        managed = False
+        db_table = 'company_version'
+        verbose_name = 'Company Version'
+        verbose_name_plural = 'Company Versions'
+
+    def __str__(self):
+        return f"Version {self.version} of company {self.company_id}"
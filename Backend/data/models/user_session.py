@@ -6,10 +6,11 @@ from django.utils import timezone
 class UserSession(models.Model):
     """User session model for token-based authentication"""
     user = models.ForeignKey('AuthUser', on_delete=models.CASCADE, related_name='sessions')
-    token_hash = models.CharField(max_length=255)
+    token_hash = models.CharField(max_length=255, unique=True)
     expires_at = models.DateTimeField()
     created_at = models.DateTimeField(db_default=Now())
-    last_used_at = models.DateTimeField(auto_now=True)
+    # Updated in batches by api/services/write_buffer.py, not on every request
+    last_used_at = models.DateTimeField(db_default=Now())
 
     class Meta:
         managed = False
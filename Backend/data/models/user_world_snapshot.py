@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class UserWorldSnapshot(models.Model):
+    """Ready-to-serve map payload for one user, assembled from company fragments"""
+    user = models.OneToOneField('AuthUser', on_delete=models.CASCADE, primary_key=True, related_name='world_snapshot')
+    payload = models.TextField(help_text="Serialized list of company objects")
+    world_version = models.TextField(help_text="World version the payload was built from")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = 'user_world_snapshot'
+        verbose_name = 'User World Snapshot'
+        verbose_name_plural = 'User World Snapshots'
+
+    def __str__(self):
+        return f"World snapshot for {self.user.username}"
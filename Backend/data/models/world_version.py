@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class WorldVersion(models.Model):
+    """Change counter for one user's world, bumped by database triggers"""
+    user = models.OneToOneField('AuthUser', on_delete=models.CASCADE, primary_key=True, related_name='world_version')
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        managed = False
+        db_table = 'world_version'
+        verbose_name = 'World Version'
+        verbose_name_plural = 'World Versions'
+
+    def __str__(self):
+        return f"World version {self.version} for {self.user.username}"
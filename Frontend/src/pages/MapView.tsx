@@ -1,7 +1,7 @@
-import React, { useEffect, useRef, useState } from 'react';
-import { MapContainer, TileLayer, Marker, Popup, Circle, useMapEvents } from 'react-leaflet';
+import React, { useEffect, useMemo, useRef, useState } from 'react';
+import { MapContainer, TileLayer, Marker, Popup, Circle, useMap, useMapEvents } from 'react-leaflet';
 import { SearchIcon, FilterIcon, ChevronDownIcon, PlusIcon, MinusIcon } from 'lucide-react';
-import { getMyCompanies, getAllTags, Company, Tag, searchLocations, CitySuggestion, getCoordinatesByLocationId } from '../utils/api';
+import { getMyCompanies, getAllTags, Company, Tag, searchLocations, CitySuggestion, getCoordinatesByLocationId, getNearbyCompanies, NearbyCompany, getViewportMarkers, ViewportMarkers, MarkerCluster, Location } from '../utils/api';
 import 'leaflet/dist/leaflet.css';
 import L from 'leaflet';
 // Fix for default marker icons in Leaflet with React
@@ -33,6 +33,43 @@ const MapController: React.FC<{
   return null;
 };
 
+// Reports the visible bbox and zoom on load and after every pan or zoom
+const ViewportWatcher: React.FC<{ onChange: (bbox: string, zoom: number) => void }> = ({ onChange }) => {
+  const report = (map: L.Map) => {
+    const bounds = map.getBounds();
+    // Leaflet keeps counting past the antimeridian; the server wants real coordinates
+    const bbox = [
+      Math.max(-180, bounds.getWest()),
+      Math.max(-90, bounds.getSouth()),
+      Math.min(180, bounds.getEast()),
+      Math.min(90, bounds.getNorth())
+    ].join(',');
+    onChange(bbox, map.getZoom());
+  };
+  const map = useMapEvents({
+    moveend: () => report(map)
+  });
+  useEffect(() => {
+    report(map);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [map]);
+  return null;
+};
+
+const clusterIcon = (count: number) => L.divIcon({
+  html: `<div class="flex items-center justify-center w-full h-full rounded-full bg-blue-600 bg-opacity-80 text-white text-xs font-semibold border-2 border-white shadow">${count}</div>`,
+  className: '',
+  iconSize: count < 100 ? [32, 32] : count < 1000 ? [40, 40] : [48, 48]
+});
+
+// A server-side cluster; clicking it zooms in on its members
+const ClusterMarker: React.FC<{ cluster: MarkerCluster }> = ({ cluster }) => {
+  const map = useMap();
+  return <Marker position={[cluster.lat, cluster.lon]} icon={clusterIcon(cluster.count)} eventHandlers={{
+    click: () => map.setView([cluster.lat, cluster.lon], Math.min(map.getZoom() + 2, map.getMaxZoom()))
+  }} />;
+};
+
 // Helper to recenter map when center changes, preserving current zoom
 const RecenterOnChange: React.FC<{ center: [number, number] }> = ({ center }) => {
   const map = useMapEvents({});
@@ -63,6 +100,9 @@ const MapView: React.FC = () => {
     center: null,
     radius: 100 // km
   });
+  const [nearbyCompanies, setNearbyCompanies] = useState<NearbyCompany[] | null>(null);
+  const [viewport, setViewport] = useState<{ bbox: string; zoom: number } | null>(null);
+  const [viewportMarkers, setViewportMarkers] = useState<ViewportMarkers | null>(null);
 
   const searchTypeRef = useRef<HTMLDivElement>(null);
 
@@ -117,8 +157,51 @@ const MapView: React.FC = () => {
     
     loadData();
   }, []);
+  // Radius filter is resolved server-side; its response is rendered as is
+  useEffect(() => {
+    if (!radiusFilter.enabled || !radiusFilter.center) {
+      setNearbyCompanies(null);
+      return;
+    }
+    let active = true;
+    const [lat, lon] = radiusFilter.center;
+    const handler = setTimeout(async () => {
+      const nearby = await getNearbyCompanies(lat, lon, radiusFilter.radius);
+      // On a failed request keep the markers of the last successful one
+      if (!active || !nearby) return;
+      setNearbyCompanies(nearby);
+    }, 250);
+    return () => {
+      active = false;
+      clearTimeout(handler);
+    };
+  }, [radiusFilter]);
+  // Without a search or radius filter the map shows the server's clusters
+  // for the visible viewport instead of one marker per office
+  const showViewportMarkers = !radiusFilter.enabled && !searchTerm;
+  useEffect(() => {
+    if (!showViewportMarkers || !viewport) return;
+    let active = true;
+    const handler = setTimeout(async () => {
+      const markers = await getViewportMarkers(viewport.bbox, viewport.zoom, selectedTags);
+      // On a failed request keep the markers of the last successful one
+      if (!active || !markers) return;
+      setViewportMarkers(markers);
+    }, 150);
+    return () => {
+      active = false;
+      clearTimeout(handler);
+    };
+  }, [showViewportMarkers, viewport, selectedTags]);
+  // Popup details of the individual offices the viewport returns
+  const officeDetails = useMemo(() => {
+    const details = new Map<string, { company: Company; location: Location }>();
+    companies.forEach(company => company.locations.forEach(location => details.set(location.id, { company, location })));
+    return details;
+  }, [companies]);
   // Filter companies based on search term and tags
-  const filteredCompanies = companies.filter(company => {
+  const visibleCompanies: Company[] = radiusFilter.enabled && nearbyCompanies ? nearbyCompanies : companies;
+  const filteredCompanies = visibleCompanies.filter(company => {
     if (searchTerm) {
       const term = searchTerm.toLowerCase();
       const matches = searchType === 'company'
@@ -129,23 +212,6 @@ const MapView: React.FC = () => {
     if (selectedTags.length > 0) {
       if (!selectedTags.some(tagId => company.tags.includes(tagId))) return false;
     }
-    if (radiusFilter.enabled && radiusFilter.center) {
-      if (!company.locations.some(location => {
-        if (!radiusFilter.center) return false;
-        // Calculate distance between points (Haversine formula)
-        const lat1 = radiusFilter.center[0];
-        const lon1 = radiusFilter.center[1];
-        const lat2 = location.coordinates.lat;
-        const lon2 = location.coordinates.lon;
-        const R = 6371; // Radius of the Earth in km
-        const dLat = (lat2 - lat1) * Math.PI / 180;
-        const dLon = (lon2 - lon1) * Math.PI / 180;
-        const a = Math.sin(dLat / 2) * Math.sin(dLat / 2) + Math.cos(lat1 * Math.PI / 180) * Math.cos(lat2 * Math.PI / 180) * Math.sin(dLon / 2) * Math.sin(dLon / 2);
-        const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1 - a));
-        const distance = R * c; // Distance in km
-        return distance <= radiusFilter.radius;
-      })) return false;
-    }
     return true;
   });
 
@@ -186,6 +252,26 @@ const MapView: React.FC = () => {
         return 'bg-gray-500';
     }
   };
+  const renderPopup = (company: Company, location: Location) => <Popup>
+      <div>
+        <h3 className="font-bold">{company.name}</h3>
+        <p className="text-sm">{location.address}</p>
+        <p className="text-sm">
+          {location.city}, {location.country}
+        </p>
+        {location.isHQ && <span className="inline-block mt-1 text-xs bg-blue-100 text-blue-800 px-2 py-0.5 rounded-full">
+            Headquarters
+          </span>}
+        <div className="mt-2 flex flex-wrap gap-1">
+          {company.tags.map(tagId => {
+            const tag = tags.find(t => t.id === tagId);
+            return tag ? <span key={tag.id} className={`text-xs px-2 py-0.5 rounded-full text-white ${getTagColor(tag.priority)}`}>
+                {tag.name}
+              </span> : null;
+          })}
+        </div>
+      </div>
+    </Popup>;
   if (loading) {
     return (
       <div className="h-full flex items-center justify-center">
@@ -265,7 +351,9 @@ const MapView: React.FC = () => {
                         <button
                           className="w-full text-left px-3 py-2 hover:bg-gray-50 text-gray-700 flex justify-between"
                           onClick={async () => {
-                            const coords = await getCoordinatesByLocationId(s.id);
+                            const coords = typeof s.latitude === 'number' && typeof s.longitude === 'number'
+                              ? { latitude: s.latitude, longitude: s.longitude }
+                              : await getCoordinatesByLocationId(s.id);
                             if (coords && typeof coords.latitude === 'number' && typeof coords.longitude === 'number') {
                               setMapCenter([coords.latitude, coords.longitude]);
                             }
@@ -349,6 +437,7 @@ const MapView: React.FC = () => {
           <TileLayer attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors' url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png" />
           <RecenterOnChange center={mapCenter} />
           <MapController onMapClick={handleMapClick} radiusFilterEnabled={radiusFilter.enabled} />
+          <ViewportWatcher onChange={(bbox, zoom) => setViewport({ bbox, zoom })} />
           {/* Radius circle */}
           {radiusFilter.enabled && radiusFilter.center && <Circle center={radiusFilter.center} radius={radiusFilter.radius * 1000} // Convert km to meters
         pathOptions={{
@@ -356,28 +445,17 @@ const MapView: React.FC = () => {
           fillColor: 'blue',
           fillOpacity: 0.1
         }} />}
-          {/* Company markers */}
-          {filteredCompanies.flatMap(company => company.locations.map(location => <Marker key={location.id} position={[location.coordinates.lat, location.coordinates.lon]}>
-                <Popup>
-                  <div>
-                    <h3 className="font-bold">{company.name}</h3>
-                    <p className="text-sm">{location.address}</p>
-                    <p className="text-sm">
-                      {location.city}, {location.country}
-                    </p>
-                    {location.isHQ && <span className="inline-block mt-1 text-xs bg-blue-100 text-blue-800 px-2 py-0.5 rounded-full">
-                        Headquarters
-                      </span>}
-                    <div className="mt-2 flex flex-wrap gap-1">
-                      {company.tags.map(tagId => {
-                  const tag = tags.find(t => t.id === tagId);
-                  return tag ? <span key={tag.id} className={`text-xs px-2 py-0.5 rounded-full text-white ${getTagColor(tag.priority)}`}>
-                            {tag.name}
-                          </span> : null;
-                })}
-                    </div>
-                  </div>
-                </Popup>
+          {/* Clustered viewport markers */}
+          {showViewportMarkers && viewportMarkers && viewportMarkers.clusters.map(cluster => <ClusterMarker key={`${cluster.lat},${cluster.lon},${cluster.count}`} cluster={cluster} />)}
+          {showViewportMarkers && viewportMarkers && viewportMarkers.offices.map(office => {
+            const details = officeDetails.get(office.id);
+            return <Marker key={office.id} position={[office.lat, office.lon]}>
+                {details && renderPopup(details.company, details.location)}
+              </Marker>;
+          })}
+          {/* Company markers matching a search or the radius filter */}
+          {!showViewportMarkers && filteredCompanies.flatMap(company => company.locations.map(location => <Marker key={location.id} position={[location.coordinates.lat, location.coordinates.lon]}>
+                {renderPopup(company, location)}
               </Marker>))}
         </MapContainer>
         {/* Radius controls moved into toolbar above map */}
@@ -65,6 +65,106 @@ export const getMyCompanies = async (): Promise<Company[]> => {
   }
 };
 
+// Compact binary marker feed (see Backend/api/services/marker_feed.py)
+export interface MarkerFeed {
+  lat: Float32Array;
+  lon: Float32Array;
+  companyIndex: Uint32Array;
+  officeIds: Uint8Array; // 16 bytes per office
+  companyIds: Uint8Array; // 16 bytes per company
+  companyNames: string[];
+}
+
+export const getMyMarkerFeed = async (): Promise<MarkerFeed | undefined> => {
+  try {
+    const token = authService.getToken();
+    const response = await fetch(`${API_BASE_URL}/companies/`, {
+      headers: {
+        'Accept': 'application/vnd.companymap.markers',
+        ...(token ? { 'Authorization': `Bearer ${token}` } : {}),
+      },
+    });
+    if (!response.ok) throw new Error('Failed to fetch marker feed');
+    const buffer = await response.arrayBuffer();
+    const [, offices, companies, namesLength] = new Uint32Array(buffer, 0, 5);
+    let offset = 20;
+    const lat = new Float32Array(buffer, offset, offices); offset += offices * 4;
+    const lon = new Float32Array(buffer, offset, offices); offset += offices * 4;
+    const companyIndex = new Uint32Array(buffer, offset, offices); offset += offices * 4;
+    const officeIds = new Uint8Array(buffer, offset, offices * 16); offset += offices * 16;
+    const companyIds = new Uint8Array(buffer, offset, companies * 16); offset += companies * 16;
+    const names = new TextDecoder().decode(new Uint8Array(buffer, offset, namesLength));
+    return { lat, lon, companyIndex, officeIds, companyIds, companyNames: companies ? names.split('\n') : [] };
+  } catch (error) {
+    console.error('Error fetching marker feed:', error);
+    return undefined;
+  }
+};
+
+export interface NearbyCompany extends Company {
+  distanceKm: number;
+}
+
+// Authenticated: companies with an office within radiusKm of a point, closest first.
+// Resolves to undefined on failure so callers can keep what they already show.
+export const getNearbyCompanies = async (lat: number, lon: number, radiusKm: number): Promise<NearbyCompany[] | undefined> => {
+  try {
+    const token = authService.getToken();
+    const url = new URL(`${API_BASE_URL}/companies/nearby/`);
+    url.searchParams.set('lat', String(lat));
+    url.searchParams.set('lon', String(lon));
+    url.searchParams.set('radius_km', String(radiusKm));
+    const response = await fetch(url.toString(), {
+      headers: token ? { 'Authorization': `Bearer ${token}` } : {},
+    });
+    if (!response.ok) throw new Error('Failed to fetch nearby companies');
+    return await response.json();
+  } catch (error) {
+    console.error('Error fetching nearby companies:', error);
+    return undefined;
+  }
+};
+
+// Server-side clustered markers for a map viewport (see Backend/api/services/clustering.py)
+export interface MarkerCluster {
+  lat: number;
+  lon: number;
+  count: number;
+}
+
+export interface ViewportOffice {
+  id: string;
+  companyId: string;
+  lat: number;
+  lon: number;
+}
+
+export interface ViewportMarkers {
+  zoom: number;
+  clusters: MarkerCluster[];
+  offices: ViewportOffice[];
+}
+
+// bbox is Leaflet's toBBoxString(): min_lon,min_lat,max_lon,max_lat.
+// Resolves to undefined on failure so callers can keep what they already show.
+export const getViewportMarkers = async (bbox: string, zoom: number, tagIds: string[] = []): Promise<ViewportMarkers | undefined> => {
+  try {
+    const token = authService.getToken();
+    const url = new URL(`${API_BASE_URL}/companies/viewport/`);
+    url.searchParams.set('bbox', bbox);
+    url.searchParams.set('zoom', String(zoom));
+    if (tagIds.length > 0) url.searchParams.set('tags', tagIds.join(','));
+    const response = await fetch(url.toString(), {
+      headers: token ? { 'Authorization': `Bearer ${token}` } : {},
+    });
+    if (!response.ok) throw new Error('Failed to fetch viewport markers');
+    return await response.json();
+  } catch (error) {
+    console.error('Error fetching viewport markers:', error);
+    return undefined;
+  }
+};
+
 export const getAllPeople = async (): Promise<Person[]> => {
   try {
     const response = await fetch(`${API_BASE_URL}/people/`);
@@ -147,12 +247,16 @@ export interface CitySuggestion {
   id: string;
   ascii_name: string;
   country: string;
+  // Present because searchLocations asks for embedded coordinates
+  latitude?: number | null;
+  longitude?: number | null;
 }
 
 export const searchLocations = async (searchTerm: string): Promise<CitySuggestion[]> => {
   try {
     const url = new URL(`${API_BASE_URL}/locations/search/`);
     url.searchParams.set('search_term', searchTerm);
+    url.searchParams.set('coordinates', 'true');
     const response = await fetch(url.toString());
     if (!response.ok) throw new Error('Failed to search locations');
     return await response.json();
@@ -167,6 +271,20 @@ export interface Coordinates {
   longitude: number;
 }
 
+export const getCoordinatesByLocationIds = async (locationIds: string[]): Promise<Record<string, Coordinates>> => {
+  try {
+    const url = new URL(`${API_BASE_URL}/locations/coordinates/`);
+    url.searchParams.set('location_ids', locationIds.join(','));
+    const response = await fetch(url.toString());
+    if (!response.ok) throw new Error('Failed to fetch coordinates');
+    const data = await response.json();
+    return data.locations;
+  } catch (error) {
+    console.error('Error fetching coordinates:', error);
+    return {};
+  }
+};
+
 export const getCoordinatesByLocationId = async (locationId: string): Promise<Coordinates | undefined> => {
   try {
     const url = new URL(`${API_BASE_URL}/locations/coordinates/`);
@@ -65,6 +65,16 @@ ALTER TABLE COMPANY
 
 COMMIT;
 
+-- Keyset pagination of company lists on (name, id)
+CREATE INDEX IF NOT EXISTS idx_company_name_id ON COMPANY (name, id);
+
+-- Domain list uploads match on the primary and alternate domains. Unique, so
+-- concurrent imports cannot create the same company twice; existing databases
+-- must merge duplicates (manage.py find_duplicate_companies) before it builds.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_company_domain_lower_unique ON COMPANY (lower(domain));
+DROP INDEX IF EXISTS idx_company_domain_lower;
+CREATE INDEX IF NOT EXISTS idx_company_domains ON COMPANY USING GIN (domains);
+
 CREATE TABLE IF NOT EXISTS OFFICE(
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     company_id UUID NOT NULL,
@@ -82,6 +92,11 @@ CREATE TABLE IF NOT EXISTS OFFICE(
     FOREIGN KEY (company_id) REFERENCES Company(id)
 );
 
+-- Bounding-box prefilter for radius searches scoped to a set of companies
+CREATE INDEX IF NOT EXISTS idx_office_company_lat_lon ON OFFICE (company_id, latitude, longitude);
+-- Incremental refresh of the per-worker office spatial index
+CREATE INDEX IF NOT EXISTS idx_office_updated_at ON OFFICE (updated_at);
+
 CREATE TABLE IF NOT EXISTS PERSON(
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     first_name VARCHAR(255) NOT NULL,
@@ -130,6 +145,21 @@ CREATE TABLE IF NOT EXISTS custom_auth_user(
     updated_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- Username allocation range-scans `name_...` for the highest numeric suffix.
+-- Built concurrently so re-running this script on a live database does not
+-- block signups; an interrupted build leaves an invalid index, which is
+-- dropped here so the next run builds it again.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = 'idx_custom_auth_user_username_pattern' AND NOT i.indisvalid
+  ) THEN
+    DROP INDEX idx_custom_auth_user_username_pattern;
+  END IF;
+END $$;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_custom_auth_user_username_pattern ON custom_auth_user (username text_pattern_ops);
+
 -- OAuth accounts table for linking OAuth providers
 CREATE TABLE IF NOT EXISTS oauth_account(
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -156,6 +186,13 @@ CREATE TABLE IF NOT EXISTS user_session(
     last_used_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- Every authenticated request looks its session up by token hash
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_session_token_hash ON user_session (token_hash);
+-- sweep_auth walks expired sessions in (expires_at, id) order
+CREATE INDEX IF NOT EXISTS idx_user_session_expires_at ON user_session (expires_at, id);
+-- Per-user session cap trims a user's oldest sessions
+CREATE INDEX IF NOT EXISTS idx_user_session_user_created ON user_session (user_id, created_at);
+
 -- Password reset tokens
 CREATE TABLE IF NOT EXISTS password_reset_token(
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -166,6 +203,10 @@ CREATE TABLE IF NOT EXISTS password_reset_token(
     created_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- sweep_auth removes expired and used reset tokens
+CREATE INDEX IF NOT EXISTS idx_password_reset_token_expires_at ON password_reset_token (expires_at, id);
+CREATE INDEX IF NOT EXISTS idx_password_reset_token_used ON password_reset_token (id) WHERE used;
+
 CREATE TABLE IF NOT EXISTS USER_WORLD(
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID REFERENCES custom_auth_user(id),
@@ -177,6 +218,247 @@ CREATE TABLE IF NOT EXISTS USER_WORLD(
     updated_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- A user's world and the per-company lookups behind its read model
+CREATE INDEX IF NOT EXISTS idx_user_world_user ON USER_WORLD (user_id);
+CREATE INDEX IF NOT EXISTS idx_person_company ON PERSON (company_id);
+CREATE INDEX IF NOT EXISTS idx_taxonomy_relationship_company ON TAXONOMY_RELATIONSHIP (company_id);
+
+-- Incremental refresh of the per-worker tag index (api/services/tag_index.py)
+CREATE INDEX IF NOT EXISTS idx_taxonomy_relationship_updated_at ON TAXONOMY_RELATIONSHIP (updated_at);
+
+-- Deleted relationships, so tag index refreshes can clear them without a rebuild.
+-- Entries are pruned by the index rebuild.
+CREATE TABLE IF NOT EXISTS taxonomy_relationship_deletion(
+    company_id UUID NOT NULL,
+    taxonomy_id UUID NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT (clock_timestamp() AT TIME ZONE 'UTC')
+);
+CREATE INDEX IF NOT EXISTS idx_taxonomy_relationship_deletion_at ON taxonomy_relationship_deletion (deleted_at);
+
+CREATE OR REPLACE FUNCTION public.log_taxonomy_relationship_deletion()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO taxonomy_relationship_deletion (company_id, taxonomy_id) VALUES (OLD.company_id, OLD.taxonomy_id);
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER taxonomy_relationship_deletion_log
+    AFTER DELETE ON TAXONOMY_RELATIONSHIP
+    FOR EACH ROW EXECUTE FUNCTION public.log_taxonomy_relationship_deletion();
+
+-- Read model for the map payload: one JSON fragment per company, assembled
+-- into one snapshot per user. Versions match api/services/read_model.py.
+CREATE TABLE IF NOT EXISTS company_fragment(
+    company_id UUID PRIMARY KEY REFERENCES COMPANY(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    payload TEXT NOT NULL,
+    version TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_company_fragment_name ON company_fragment (name, company_id);
+
+-- Change counter per company behind fragment versions (api/services/read_model.py),
+-- bumped by the world triggers below alongside the world versions. No foreign
+-- key: the counter of a deleted company is bumped by the delete itself.
+CREATE TABLE IF NOT EXISTS company_version(
+    company_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS user_world_snapshot(
+    user_id UUID PRIMARY KEY REFERENCES custom_auth_user(id) ON DELETE CASCADE,
+    payload TEXT NOT NULL,
+    world_version TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Per-user world version behind ETags and snapshots (api/services/conditional.py).
+-- Bumped by the statement triggers below in the same transaction as the change,
+-- so it moves exactly when the change commits; updated_at is taken before commit
+-- and cannot be compared reliably.
+CREATE TABLE IF NOT EXISTS world_version(
+    user_id UUID PRIMARY KEY REFERENCES custom_auth_user(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Finding the worlds a changed company belongs to
+CREATE INDEX IF NOT EXISTS idx_user_world_company ON USER_WORLD (company_id);
+CREATE INDEX IF NOT EXISTS idx_user_world_companies ON USER_WORLD USING GIN (world_companies_id);
+
+CREATE OR REPLACE FUNCTION public.bump_world_versions(p_companies uuid[])
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- In user order, so concurrent writers lock shared rows in the same order
+    INSERT INTO world_version AS v (user_id, version)
+    SELECT DISTINCT w.user_id, 1
+    FROM user_world w
+    WHERE w.user_id IS NOT NULL
+      AND (w.company_id = ANY(p_companies) OR w.world_companies_id && p_companies)
+    ORDER BY w.user_id
+    ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.bump_company_versions(p_companies uuid[])
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO company_version AS v (company_id, version)
+    SELECT id, 1 FROM unnest(p_companies) AS id ORDER BY id
+    ON CONFLICT (company_id) DO UPDATE SET version = v.version + 1;
+END;
+$$;
+
+-- Statement trigger for company, office, person and taxonomy_relationship;
+-- TG_ARGV[0] is the column holding the company id
+CREATE OR REPLACE FUNCTION public.world_rows_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    changed uuid[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        EXECUTE format('SELECT array_agg(DISTINCT %1$I) FROM new_rows WHERE %1$I IS NOT NULL', TG_ARGV[0]) INTO changed;
+    ELSIF TG_OP = 'DELETE' THEN
+        EXECUTE format('SELECT array_agg(DISTINCT %1$I) FROM old_rows WHERE %1$I IS NOT NULL', TG_ARGV[0]) INTO changed;
+    ELSE
+        EXECUTE format(
+            'SELECT array_agg(DISTINCT id) FROM (SELECT %1$I AS id FROM new_rows UNION SELECT %1$I FROM old_rows) c WHERE id IS NOT NULL',
+            TG_ARGV[0]
+        ) INTO changed;
+    END IF;
+    IF changed IS NOT NULL THEN
+        PERFORM public.bump_company_versions(changed);
+        PERFORM public.bump_world_versions(changed);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.user_world_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO world_version AS v (user_id, version)
+        SELECT DISTINCT user_id, 1 FROM new_rows WHERE user_id IS NOT NULL ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO world_version AS v (user_id, version)
+        SELECT DISTINCT user_id, 1 FROM old_rows WHERE user_id IS NOT NULL ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1;
+    ELSE
+        INSERT INTO world_version AS v (user_id, version)
+        SELECT user_id, 1 FROM (SELECT user_id FROM new_rows UNION SELECT user_id FROM old_rows) u
+        WHERE user_id IS NOT NULL ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Transition tables allow one event per trigger, hence three triggers per table
+CREATE OR REPLACE TRIGGER company_world_insert AFTER INSERT ON COMPANY
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('id');
+CREATE OR REPLACE TRIGGER company_world_update AFTER UPDATE ON COMPANY
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('id');
+CREATE OR REPLACE TRIGGER company_world_delete AFTER DELETE ON COMPANY
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('id');
+
+CREATE OR REPLACE TRIGGER office_world_insert AFTER INSERT ON OFFICE
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+CREATE OR REPLACE TRIGGER office_world_update AFTER UPDATE ON OFFICE
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+CREATE OR REPLACE TRIGGER office_world_delete AFTER DELETE ON OFFICE
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+
+CREATE OR REPLACE TRIGGER person_world_insert AFTER INSERT ON PERSON
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+CREATE OR REPLACE TRIGGER person_world_update AFTER UPDATE ON PERSON
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+CREATE OR REPLACE TRIGGER person_world_delete AFTER DELETE ON PERSON
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+
+CREATE OR REPLACE TRIGGER taxonomy_relationship_world_insert AFTER INSERT ON TAXONOMY_RELATIONSHIP
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+CREATE OR REPLACE TRIGGER taxonomy_relationship_world_update AFTER UPDATE ON TAXONOMY_RELATIONSHIP
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+CREATE OR REPLACE TRIGGER taxonomy_relationship_world_delete AFTER DELETE ON TAXONOMY_RELATIONSHIP
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION public.world_rows_changed('company_id');
+
+CREATE OR REPLACE TRIGGER user_world_version_insert AFTER INSERT ON USER_WORLD
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.user_world_changed();
+CREATE OR REPLACE TRIGGER user_world_version_update AFTER UPDATE ON USER_WORLD
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.user_world_changed();
+CREATE OR REPLACE TRIGGER user_world_version_delete AFTER DELETE ON USER_WORLD
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION public.user_world_changed();
+
+-- Long-running jobs (coordinate seeding, imports) run outside the request cycle
+CREATE TABLE IF NOT EXISTS background_job(
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    kind VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    params JSONB NOT NULL DEFAULT '{}',
+    checkpoint JSONB NOT NULL DEFAULT '{}',
+    processed BIGINT NOT NULL DEFAULT 0,
+    total BIGINT,
+    result JSONB NOT NULL DEFAULT '{}',
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    locked_by VARCHAR(255),
+    heartbeat_at TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    owner_id UUID REFERENCES custom_auth_user(id) ON DELETE SET NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Databases created before jobs had owners
+ALTER TABLE background_job ADD COLUMN IF NOT EXISTS owner_id UUID REFERENCES custom_auth_user(id) ON DELETE SET NULL;
+CREATE INDEX IF NOT EXISTS idx_background_job_owner ON background_job (owner_id);
+
+-- Workers claim the oldest due job with FOR UPDATE SKIP LOCKED
+CREATE INDEX IF NOT EXISTS idx_background_job_queued ON background_job (run_after, created_at) WHERE status = 'queued';
+-- Lease recovery scans running jobs by heartbeat
+CREATE INDEX IF NOT EXISTS idx_background_job_running ON background_job (heartbeat_at) WHERE status = 'running';
+
+-- Normalized rows of a company import, staged per job and chunk until the merge.
+-- UNLOGGED: it only holds data that can be re-derived from the source file.
+CREATE UNLOGGED TABLE IF NOT EXISTS company_import_staging(
+    job_id UUID NOT NULL,
+    chunk INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    domain VARCHAR(255) NOT NULL,
+    industry VARCHAR(255),
+    locality VARCHAR(255),
+    region VARCHAR(255),
+    country VARCHAR(255)
+);
+
+CREATE INDEX IF NOT EXISTS idx_company_import_staging_job ON company_import_staging (job_id, domain, chunk, line);
+
+-- Normalized domains of an uploaded domain list, staged until its import job has run
+CREATE UNLOGGED TABLE IF NOT EXISTS domain_upload_staging(
+    job_id UUID NOT NULL,
+    line INTEGER NOT NULL,
+    domain VARCHAR(255) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_domain_upload_staging_job ON domain_upload_staging (job_id, line);
+
 CREATE TABLE IF NOT EXISTS CITY(
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     name VARCHAR(255) NOT NULL,
@@ -184,9 +466,22 @@ CREATE TABLE IF NOT EXISTS CITY(
     country VARCHAR(255) NOT NULL,
     latitude DECIMAL(10,8),
     longitude DECIMAL(11,8),
-    population INTEGER
+    population INTEGER,
+    alternate_names TEXT[],
+    geoname_id BIGINT,
+    timezone VARCHAR(64),
+    modification_date DATE
 );
 
+-- Databases created before the GeoNames loader and alternate-name search
+ALTER TABLE CITY ADD COLUMN IF NOT EXISTS alternate_names TEXT[];
+ALTER TABLE CITY ADD COLUMN IF NOT EXISTS geoname_id BIGINT;
+ALTER TABLE CITY ADD COLUMN IF NOT EXISTS timezone VARCHAR(64);
+ALTER TABLE CITY ADD COLUMN IF NOT EXISTS modification_date DATE;
+
+-- manage.py load_cities upserts by GeoNames id
+CREATE UNIQUE INDEX IF NOT EXISTS idx_city_geoname_id ON CITY (geoname_id);
+
 
 -- One function: call as load_cities_from_csv(); or override default path with load_cities_from_csv('/path/file.csv')
 CREATE OR REPLACE FUNCTION public.load_cities_from_csv(
@@ -228,14 +523,19 @@ BEGIN
     'bash -lc "cat ' || p_file || ' && rm -f ' || p_file || '"'
   );
 
-  INSERT INTO public.city (name, ascii_name, country, latitude, longitude, population)
+  INSERT INTO public.city (name, ascii_name, country, latitude, longitude, population, alternate_names,
+                           geoname_id, timezone, modification_date)
   SELECT
     COALESCE(NULLIF("Name", ''), 'Unknown'),
     COALESCE(NULLIF("ASCII Name", ''), COALESCE(NULLIF("Name", ''), 'Unknown')),
     COALESCE(NULLIF("Country name EN", ''), COALESCE(NULLIF("Country Code", ''), 'Unknown')),
     NULLIF(TRIM(split_part("Coordinates", ',', 1)), '')::DECIMAL(10,8),
     NULLIF(TRIM(split_part("Coordinates", ',', 2)), '')::DECIMAL(11,8),
-    NULLIF(NULLIF("Population", ''), NULL)::INTEGER
+    NULLIF(NULLIF("Population", ''), NULL)::INTEGER,
+    string_to_array(NULLIF("Alternate Names", ''), ','),
+    "Geoname ID",
+    NULLIF("Timezone", ''),
+    NULLIF("Modification date", '')::DATE
   FROM staging_cities;
 
   GET DIAGNOSTICS inserted_count = ROW_COUNT;
@@ -332,11 +632,8 @@ BEGIN
     ARRAY[derived_domain]::TEXT[],
     industry_text
   FROM to_insert
-  -- simple duplicate guard: avoid inserting if a company with same domain already exists
-  WHERE NOT EXISTS (
-    SELECT 1 FROM public.company c
-    WHERE LOWER(c.domain) = LOWER(to_insert.derived_domain)
-  );
+  -- duplicate guard: skip domains that already have a company (or repeat within the file)
+  ON CONFLICT ((lower(domain))) DO NOTHING;
 
   GET DIAGNOSTICS inserted_count = ROW_COUNT;
   RETURN inserted_count;